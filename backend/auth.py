@@ -3,26 +3,26 @@ from typing import Optional
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
-from passlib.context import CryptContext
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 import crud, models, schemas
+from cache import identity_cache
 from config import settings
-from database import get_db
-
-# Password hashing context
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from database import get_async_db
+from services import password_service
+from services.password_service import pwd_context
 
 # OAuth2 scheme for token-based authentication
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verifica si una contraseña plana coincide con su hash."""
-    return pwd_context.verify(plain_password, hashed_password)
+    return password_service.verify_password(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
     """Genera el hash de una contraseña."""
-    return pwd_context.hash(password)
+    return password_service.hash_password(password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """Crea un token de acceso JWT."""
@@ -35,15 +35,11 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> models.User:
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)) -> models.User:
     """
     Dependencia de FastAPI para obtener el usuario actual a partir del token JWT.
     Valida el token y recupera al usuario de la base de datos.
     """
-    print(f"🔐 DEBUG: Received token: {token[:50]}...")  # Log para debug
-    print(f"🔐 DEBUG: SECRET_KEY being used: {settings.SECRET_KEY[:20]}...")  # Log para debug
-    print(f"🔐 DEBUG: ALGORITHM: {settings.ALGORITHM}")  # Log para debug
-    
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -52,22 +48,27 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
         email: str = payload.get("sub")
-        print(f"🔐 DEBUG: Decoded email: {email}")  # Log para debug
-        print(f"🔐 DEBUG: Token payload: {payload}")  # Log para debug
         if email is None:
-            print(f"🔐 DEBUG: Email is None in token payload")  # Log para debug
             raise credentials_exception
         token_data = schemas.TokenData(email=email)
     except JWTError as e:
-        print(f"🔐 DEBUG: JWT Error: {e}")  # Log para debug
         raise credentials_exception
     
-    user = crud.get_user_by_email(db, email=token_data.email)
+    # Identidad en caché: se devuelve un User transitorio con las columnas guardadas
+    cached = identity_cache.get(("legacy", token_data.email))
+    if cached is not None:
+        return models.User(**cached)
+
+    user = (await db.execute(
+        select(models.User).where(models.User.email == token_data.email)
+    )).scalar_one_or_none()
     if user is None:
-        print(f"🔐 DEBUG: User not found: {token_data.email}")  # Log para debug
         raise credentials_exception
     
-    print(f"🔐 DEBUG: User authenticated: {user.email}")  # Log para debug
+    identity_cache.set(
+        ("legacy", user.email),
+        {column.key: getattr(user, column.key) for column in models.User.__table__.columns}
+    )
     return user
 
 async def get_current_active_user(current_user: models.User = Depends(get_current_user)) -> models.User:
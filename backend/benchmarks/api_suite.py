@@ -0,0 +1,442 @@
+"""
+Benchmark de la API de punta a punta - MIRIESGO v2
+Ejecuta la aplicación en proceso (httpx.ASGITransport) contra una base de datos sembrada
+con el generador de cartera sintética y mide, por escenario y por tamaño de datos,
+throughput y latencia p50/p95/p99:
+
+    login       POST /api/auth/login
+    me          GET  /api/auth/me
+    report      GET  /api/reports/{identifier}   (identificadores distintos al azar)
+    clients     GET  /api/clients/               (páginas recorridas con el cursor)
+    dashboard   GET  /api/dashboard
+    upload      POST /api/files/upload           (archivo de ancho fijo sintético)
+
+Cada tamaño corre en un proceso propio con su base SQLite en --workdir (la URL de la base
+es relativa al directorio de trabajo); la base sembrada se reutiliza mientras el tamaño y
+la semilla no cambien. Los workers de archivos no se inician: upload mide la recepción,
+la copia a disco y el encolado, no la ingesta.
+
+Los resultados se guardan en JSON y se comparan con una línea base: un escenario falla su
+presupuesto si su p95 supera el de la línea base en más de --tolerance o si su throughput
+cae en esa misma proporción. Con regresiones el proceso termina con código 1.
+
+Uso (desde backend/):
+    python -m benchmarks.api_suite --sizes 1000,10000 --save-baseline
+    python -m benchmarks.api_suite --sizes 1000,10000            # compara con la línea base
+    python -m benchmarks.api_suite --sizes 1000 --scenarios me,report --requests 500
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCHMARKS_DIR)
+
+SCENARIOS = ("login", "me", "report", "clients", "dashboard", "upload")
+# Fecha de corte fija: los datos sembrados no dependen del día en que se corre
+BENCH_CUTOFF = date(2025, 6, 30)
+BENCH_COMPANIES = 5
+BENCH_EMAIL = "bench.api@miriesgo.local"
+BENCH_PASSWORD = "BenchPass123!"
+CLIENTS_PAGE_SIZE = 50
+# Páginas distintas que recorre el escenario clients
+CLIENTS_PAGES = 20
+
+DEFAULT_RESULTS_DIR = os.path.join(BENCHMARKS_DIR, "results")
+DEFAULT_BASELINE = os.path.join(DEFAULT_RESULTS_DIR, "baseline.json")
+
+def percentile(values, pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def summarize(latencies, failures: int, elapsed: float) -> dict:
+    """Throughput y percentiles (ms) de un escenario"""
+    return {
+        "requests": len(latencies),
+        "failures": failures,
+        "throughput": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "max_ms": max(latencies) * 1000,
+    }
+
+# ===============================================
+# PROCESO HIJO: UN TAMAÑO DE DATOS
+# ===============================================
+
+def prepare_schema():
+    """
+    Crear las tablas de los dos modelos de la aplicación en la base del benchmark.
+    companies la leen ambos con columnas distintas: se crea con el modelo canónico
+    y se le agregan las columnas del modelo de backend/models.py que le falten.
+    """
+    from sqlalchemy import inspect, text
+    from database import get_engine
+    import database.models as db_models
+    import models
+
+    engine = get_engine()
+    models.Base.metadata.create_all(engine, tables=[
+        table for name, table in models.Base.metadata.tables.items() if name not in ("users", "companies")
+    ])
+    db_models.Base.metadata.create_all(engine)
+
+    existing = {column["name"] for column in inspect(engine).get_columns("companies")}
+    with engine.begin() as conn:
+        for column in models.Company.__table__.columns:
+            if column.name not in existing:
+                conn.execute(text(
+                    f"ALTER TABLE companies ADD COLUMN {column.name} {column.type.compile(engine.dialect)}"
+                ))
+
+def seed(size: int, seed_value: int) -> float:
+    """Sembrar la cartera si la base no corresponde a (size, seed); retorna los segundos usados"""
+    from benchmarks.synthetic_portfolio import PortfolioSpec, build_portfolio
+
+    marker = {"clients": size, "seed": seed_value, "companies": BENCH_COMPANIES, "cutoff": BENCH_CUTOFF.isoformat()}
+    marker_path = "seed.json"
+    if os.path.exists(marker_path):
+        with open(marker_path) as fh:
+            if json.load(fh) == marker:
+                return 0.0
+
+    start = time.perf_counter()
+    prepare_schema()
+    spec = PortfolioSpec(companies=BENCH_COMPANIES, clients=size, seed=seed_value, cutoff=BENCH_CUTOFF)
+    build_portfolio(spec)
+    with open(marker_path, "w") as fh:
+        json.dump(marker, fh)
+    return time.perf_counter() - start
+
+def ensure_bench_user():
+    """Crear (o desbloquear) el usuario administrador del benchmark"""
+    from database import SessionLocal, User, UserRole
+    from services.password_service import hash_password
+
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.email == BENCH_EMAIL).first()
+        if user is None:
+            user = User(
+                full_name="Benchmark API",
+                national_identifier="BENCH-API",
+                email=BENCH_EMAIL,
+                phone="0000000000",
+                password_hash=hash_password(BENCH_PASSWORD),
+                role=UserRole.admin,
+                created_user="benchmark"
+            )
+            db.add(user)
+        user.is_active = True
+        user.login_attempts = 0
+        user.locked_until = None
+        db.commit()
+    finally:
+        db.close()
+
+def build_upload_file(size: int, seed_value: int) -> str:
+    """
+    Archivo de ancho fijo de la primera empresa sembrada; crece con el tamaño
+    de datos (un 5 % de los clientes, entre 100 y 2000).
+    """
+    from benchmarks.synthetic_portfolio import PortfolioSpec, build_portfolio
+
+    directory = "upload_source"
+    shutil.rmtree(directory, ignore_errors=True)
+    clients = min(2000, max(100, size // 20))
+    spec = PortfolioSpec(companies=1, clients=clients, seed=seed_value, cutoff=BENCH_CUTOFF)
+    build_portfolio(spec, load_db=False, fixed_width_dir=directory)
+    return os.path.join(directory, os.listdir(directory)[0])
+
+async def measure(client, name: str, make_request, requests: int, concurrency: int, warmup: int) -> dict:
+    """Ejecutar make_request(i) requests veces con la concurrencia dada, tras unas de calentamiento"""
+    for index in range(warmup):
+        await make_request(index)
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    failures = 0
+
+    async def one(index: int):
+        nonlocal failures
+        async with semaphore:
+            start = time.perf_counter()
+            response = await make_request(index)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                failures += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(index) for index in range(requests)))
+    result = summarize(latencies, failures, time.perf_counter() - start)
+    print(f"  {name:<10} {result['throughput']:8.1f} req/s  p95 {result['p95_ms']:8.1f} ms  "
+          f"fallidas {failures}", flush=True)
+    return result
+
+async def run_scenarios(options: dict, upload_path: str) -> dict:
+    import httpx
+    import numpy as np
+    import auth as legacy_auth
+    from benchmarks.synthetic_portfolio import PortfolioSpec
+    from main import app
+
+    size, seed_value = options["size"], options["seed"]
+    requests, concurrency, warmup = options["requests"], options["concurrency"], options["warmup"]
+    rng = np.random.default_rng(seed_value)
+    results = {}
+
+    async def login():
+        response = await client.post("/api/auth/login", data={"username": BENCH_EMAIL, "password": BENCH_PASSWORD})
+        response.raise_for_status()
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        # /api/auth usa el token de sesión; las rutas de backend/auth.py, su propio JWT
+        session_headers = {}
+        headers = {"Authorization": f"Bearer {legacy_auth.create_access_token({'sub': BENCH_EMAIL})}"}
+
+        identifiers = (PortfolioSpec.identifier_base + rng.choice(size, size=requests + warmup, replace=requests + warmup > size)).astype(str)
+
+        cursors = [None]
+        while len(cursors) < CLIENTS_PAGES:
+            params = {"limit": CLIENTS_PAGE_SIZE, **({"cursor": cursors[-1]} if cursors[-1] else {})}
+            next_cursor = (await client.get("/api/clients/", params=params, headers=headers)).headers.get("X-Next-Cursor")
+            if not next_cursor:
+                break
+            cursors.append(next_cursor)
+
+        with open(upload_path, "rb") as fh:
+            upload_bytes = fh.read()
+        upload_name = os.path.basename(upload_path)
+
+        scenarios = {
+            "login": (lambda i: client.post(
+                "/api/auth/login", data={"username": BENCH_EMAIL, "password": BENCH_PASSWORD}
+            ), options["login_requests"]),
+            "me": (lambda i: client.get("/api/auth/me", headers=session_headers), requests),
+            "report": (lambda i: client.get(f"/api/reports/{identifiers[i]}", headers=headers), requests),
+            "clients": (lambda i: client.get("/api/clients/", headers=headers, params={
+                "limit": CLIENTS_PAGE_SIZE, **({"cursor": cursors[i % len(cursors)]} if cursors[i % len(cursors)] else {})
+            }), requests),
+            "dashboard": (lambda i: client.get("/api/dashboard", headers=headers), requests),
+            "upload": (lambda i: client.post(
+                "/api/files/upload", headers=headers, files={"file": (upload_name, upload_bytes, "text/plain")}
+            ), options["upload_requests"]),
+        }
+
+        for name in options["scenarios"]:
+            make_request, count = scenarios[name]
+            if name == "me":
+                # Cada login cierra las sesiones anteriores: la de me se abre justo antes
+                session_headers.update(await login())
+            # El calentamiento de report usa los primeros identificadores; la medición, los siguientes
+            if name == "report":
+                measured = lambda i, make_request=make_request: make_request(i + warmup)
+                results[name] = await measure(client, name, measured, count, concurrency, 0)
+                continue
+            results[name] = await measure(client, name, make_request, count, concurrency, warmup)
+
+        results["upload_file_bytes"] = len(upload_bytes)
+    return results
+
+def child(options: dict):
+    """Un tamaño de datos; imprime los resultados como JSON en la última línea"""
+    sys.path.append(BACKEND_DIR + '/..')
+    sys.path.append(BACKEND_DIR)
+
+    seed_seconds = seed(options["size"], options["seed"])
+    ensure_bench_user()
+    upload_path = build_upload_file(options["size"], options["seed"])
+
+    # Como al arrancar el servidor, la auditoría se escribe por lotes en segundo plano;
+    # los workers de archivos no se inician
+    from services.audit_service import audit_sink
+    audit_sink.start()
+    try:
+        scenarios = asyncio.run(run_scenarios(options, upload_path))
+    finally:
+        audit_sink.stop()
+    upload_file_bytes = scenarios.pop("upload_file_bytes")
+
+    # Los archivos subidos no se procesan; se borran para no llenar el disco entre corridas
+    shutil.rmtree("uploads", ignore_errors=True)
+    os.makedirs("uploads", exist_ok=True)
+
+    print(json.dumps({
+        "seed_seconds": seed_seconds,
+        "upload_file_bytes": upload_file_bytes,
+        "scenarios": scenarios,
+    }))
+
+# ===============================================
+# PROCESO PRINCIPAL
+# ===============================================
+
+def run_size(size: int, args) -> dict:
+    workdir = os.path.join(args.workdir, f"size_{size}_seed_{args.seed}")
+    if args.fresh:
+        shutil.rmtree(workdir, ignore_errors=True)
+    os.makedirs(workdir, exist_ok=True)
+
+    options = {
+        "size": size,
+        "seed": args.seed,
+        "requests": args.requests,
+        "login_requests": args.login_requests,
+        "upload_requests": args.upload_requests,
+        "concurrency": args.concurrency,
+        "warmup": args.warmup,
+        "scenarios": args.scenarios,
+    }
+    env = {
+        **os.environ,
+        "DB_BACKEND": "sqlite",
+        "LOG_LEVEL": os.getenv("LOG_LEVEL", "WARNING"),
+        "UPLOAD_DIRECTORY": "uploads",
+    }
+    print(f"Tamaño {size:,} clientes ({workdir})", flush=True)
+    completed = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", json.dumps(options)],
+        cwd=workdir, env=env, stdout=subprocess.PIPE, text=True
+    )
+    if completed.returncode != 0:
+        sys.exit(completed.returncode)
+    lines = completed.stdout.strip().splitlines()
+    for line in lines[:-1]:
+        print(line)
+    return json.loads(lines[-1])
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True
+        ).stdout.strip()
+    except OSError:
+        return ""
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Escenarios fuera de presupuesto respecto de la línea base: [(tamaño, escenario, motivo)]"""
+    regressions = []
+    for size, current in results["sizes"].items():
+        base_size = baseline.get("sizes", {}).get(size)
+        if not base_size:
+            continue
+        for name, current_scenario in current["scenarios"].items():
+            base = base_size["scenarios"].get(name)
+            if not base:
+                continue
+            budget = base["p95_ms"] * (1 + tolerance)
+            if current_scenario["p95_ms"] > budget:
+                regressions.append((size, name, f"p95 {current_scenario['p95_ms']:.1f} ms > presupuesto {budget:.1f} ms"))
+            floor = base["throughput"] * (1 - tolerance)
+            if current_scenario["throughput"] < floor:
+                regressions.append((size, name, f"throughput {current_scenario['throughput']:.1f} < {floor:.1f} req/s"))
+            if current_scenario["failures"] > base["failures"]:
+                regressions.append((size, name, f"{current_scenario['failures']} peticiones fallidas"))
+    return regressions
+
+def print_report(results: dict, baseline: dict):
+    print("="*78)
+    print(f"{'tamaño':>9} {'escenario':<10} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'Δp95':>8} {'fallas':>7}")
+    for size, current in results["sizes"].items():
+        base_size = (baseline or {}).get("sizes", {}).get(size, {}).get("scenarios", {})
+        for name, scenario in current["scenarios"].items():
+            base = base_size.get(name)
+            delta = f"{(scenario['p95_ms'] / base['p95_ms'] - 1) * 100:+7.1f}%" if base and base["p95_ms"] else "       -"
+            print(f"{int(size):>9,} {name:<10} {scenario['throughput']:>9.1f} {scenario['p50_ms']:>9.1f} "
+                  f"{scenario['p95_ms']:>9.1f} {scenario['p99_ms']:>9.1f} {delta} {scenario['failures']:>7}")
+    print("="*78)
+
+def main(args):
+    results = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "seed": args.seed,
+            "requests": args.requests,
+            "login_requests": args.login_requests,
+            "upload_requests": args.upload_requests,
+            "concurrency": args.concurrency,
+            "warmup": args.warmup,
+        },
+        "sizes": {},
+    }
+    for size in args.sizes:
+        results["sizes"][str(size)] = run_size(size, args)
+
+    output = args.output or os.path.join(
+        DEFAULT_RESULTS_DIR, f"api_suite_{datetime.now():%Y%m%d_%H%M%S}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as fh:
+        json.dump(results, fh, indent=2)
+
+    baseline = None
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as fh:
+            baseline = json.load(fh)
+
+    print_report(results, baseline)
+    print(f"Resultados: {output}")
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        shutil.copyfile(output, args.baseline)
+        print(f"Línea base guardada en {args.baseline}")
+        return 0
+    if baseline is None:
+        print("Sin línea base para comparar (use --save-baseline)")
+        return 0
+
+    regressions = compare(results, baseline, args.tolerance)
+    print(f"Línea base: {args.baseline} (commit {baseline.get('commit') or '?'}, tolerancia {args.tolerance:.0%})")
+    for size, name, reason in regressions:
+        print(f"  REGRESIÓN {int(size):,} {name}: {reason}")
+    if not regressions:
+        print("  Todos los escenarios dentro del presupuesto")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de la API de punta a punta")
+    parser.add_argument("--sizes", type=lambda value: [int(size) for size in value.split(",")], default=[1000, 10000],
+                        help="Tamaños de cartera (clientes) separados por coma")
+    parser.add_argument("--scenarios", type=lambda value: value.split(","), default=list(SCENARIOS),
+                        help=f"Escenarios separados por coma ({','.join(SCENARIOS)})")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--requests", type=int, default=200, help="Peticiones por escenario")
+    parser.add_argument("--login-requests", type=int, default=20, help="Peticiones de login (bcrypt es costoso)")
+    parser.add_argument("--upload-requests", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=5, help="Peticiones previas no medidas por escenario")
+    parser.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "miriesgo_api_suite"),
+                        help="Directorio de las bases sembradas (se reutilizan entre corridas)")
+    parser.add_argument("--fresh", action="store_true", help="Volver a sembrar las bases")
+    parser.add_argument("--output", help="Archivo JSON de resultados (por defecto en benchmarks/results/)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="Guardar esta corrida como línea base")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Margen permitido sobre la línea base (0.2 = 20 %%)")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(json.loads(args.child))
+    else:
+        unknown = set(args.scenarios) - set(SCENARIOS)
+        if unknown:
+            parser.error(f"Escenarios desconocidos: {', '.join(sorted(unknown))}")
+        sys.exit(main(args))
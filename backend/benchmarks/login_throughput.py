@@ -0,0 +1,111 @@
+"""
+Benchmark de login - MIRIESGO v2
+Mide logins por segundo y cuánto se bloquea el event loop durante una ráfaga de logins.
+
+Mientras corren los logins concurrentes, una sonda consulta /api/health en bucle:
+si bcrypt corriera en el event loop, la latencia de la sonda subiría a cientos de ms.
+
+Uso (desde backend/):
+    python -m benchmarks.login_throughput --logins 100 --concurrency 20
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + '/../..')
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + '/..')
+
+import httpx
+
+from database import SessionLocal, User, UserRole, create_all_tables
+from services.password_service import hash_password
+from main import app
+
+BENCH_EMAIL = "bench.login@miriesgo.local"
+BENCH_PASSWORD = "BenchPass123!"
+
+def ensure_bench_user():
+    """Crear (o desbloquear) el usuario del benchmark"""
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.email == BENCH_EMAIL).first()
+        if user is None:
+            user = User(
+                full_name="Benchmark Login",
+                national_identifier="BENCH-LOGIN",
+                email=BENCH_EMAIL,
+                phone="0000000000",
+                password_hash=hash_password(BENCH_PASSWORD),
+                role=UserRole.analyst,
+                created_user="benchmark"
+            )
+            db.add(user)
+        user.is_active = True
+        user.login_attempts = 0
+        user.locked_until = None
+        db.commit()
+    finally:
+        db.close()
+
+def percentile(values, pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+async def run(logins: int, concurrency: int):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        semaphore = asyncio.Semaphore(concurrency)
+        login_latencies, probe_latencies = [], []
+        failures = 0
+        done = asyncio.Event()
+
+        async def one_login():
+            nonlocal failures
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post(
+                    "/api/auth/login",
+                    data={"username": BENCH_EMAIL, "password": BENCH_PASSWORD}
+                )
+                login_latencies.append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    failures += 1
+
+        async def probe():
+            while not done.is_set():
+                start = time.perf_counter()
+                await client.get("/api/health")
+                probe_latencies.append(time.perf_counter() - start)
+                await asyncio.sleep(0.01)
+
+        probe_task = asyncio.create_task(probe())
+        start = time.perf_counter()
+        await asyncio.gather(*(one_login() for _ in range(logins)))
+        elapsed = time.perf_counter() - start
+        done.set()
+        await probe_task
+
+    ms = lambda seconds: f"{seconds * 1000:.1f} ms"
+    print("="*50)
+    print(f"Logins: {logins} (concurrencia {concurrency}), fallidos: {failures}")
+    print(f"Throughput: {logins / elapsed:.1f} logins/s en {elapsed:.2f} s")
+    print(f"Latencia login  p50 {ms(statistics.median(login_latencies))}  "
+          f"p95 {ms(percentile(login_latencies, 95))}  max {ms(max(login_latencies))}")
+    print(f"Sonda /health   p50 {ms(statistics.median(probe_latencies))}  "
+          f"p99 {ms(percentile(probe_latencies, 99))}  max {ms(max(probe_latencies))}")
+    print("="*50)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de throughput de login")
+    parser.add_argument("--logins", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+
+    create_all_tables()
+    ensure_bench_user()
+    asyncio.run(run(args.logins, args.concurrency))
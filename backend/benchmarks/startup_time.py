@@ -0,0 +1,114 @@
+"""
+Benchmark de arranque - MIRIESGO v2
+Mide el arranque en frío de un worker: cada corrida es un proceso nuevo que importa
+la aplicación, ejecuta sus eventos de arranque (como el lifespan de uvicorn), atiende la
+primera petición y abre la primera conexión a la base de datos.
+
+Reporta por fase (mediana y máximo de las corridas):
+    import    importar main
+    startup   eventos de arranque: selección del backend (prueba de MySQL en modo auto),
+              workers de archivos, escritor de auditoría y programador de re-scoring;
+              import + startup es lo que espera el servidor antes de aceptar tráfico
+    health    primera respuesta de /api/health
+    db        primera sentencia SQL (creación del engine + conexión, si el arranque no los abrió)
+    proceso   tiempo total del proceso, incluido el arranque del intérprete
+
+Uso (desde backend/):
+    python -m benchmarks.startup_time --runs 5
+    DB_BACKEND=sqlite python -m benchmarks.startup_time    # sin prueba de MySQL
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def child():
+    """Una corrida en frío; imprime los tiempos como JSON en la última línea"""
+    start = time.perf_counter()
+    sys.path.append(BACKEND_DIR + '/..')
+    sys.path.append(BACKEND_DIR)
+
+    from main import app
+    imported = time.perf_counter()
+
+    # Estado tras el import: nada debería haberse conectado ni cargado de más
+    import database.config as db_config
+    engine_at_import = db_config._engine is not None
+    genai_at_import = "google.generativeai" in sys.modules
+
+    import asyncio
+    import httpx
+
+    from sqlalchemy import text
+
+    async def cold_start():
+        # httpx.ASGITransport no envía los eventos de lifespan: se ejecutan aquí
+        await app.router.startup()
+        started = time.perf_counter()
+        try:
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                response = await client.get("/api/health")
+                response.raise_for_status()
+            health = time.perf_counter()
+
+            with db_config.get_engine().connect() as conn:
+                conn.execute(text("SELECT 1")).fetchone()
+            return started, health, time.perf_counter()
+        finally:
+            await app.router.shutdown()
+
+    started, health, db_ready = asyncio.run(cold_start())
+
+    print(json.dumps({
+        "import": imported - start,
+        "startup": started - imported,
+        "health": health - started,
+        "db": db_ready - health,
+        "engine_at_import": engine_at_import,
+        "genai_at_import": genai_at_import,
+        "backend": db_config.select_database_url().split(":", 1)[0],
+    }))
+
+def run(runs: int):
+    results = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        completed = subprocess.run(
+            [sys.executable, "-m", "benchmarks.startup_time", "--child"],
+            cwd=BACKEND_DIR, capture_output=True, text=True
+        )
+        elapsed = time.perf_counter() - start
+        if completed.returncode != 0:
+            print(completed.stderr, file=sys.stderr)
+            sys.exit(completed.returncode)
+        result = json.loads(completed.stdout.strip().splitlines()[-1])
+        result["proceso"] = elapsed
+        results.append(result)
+
+    ms = lambda seconds: f"{seconds * 1000:8.1f} ms"
+    print("="*50)
+    print(f"Corridas en frío: {runs}  (backend: {results[0]['backend']})")
+    for phase in ("import", "startup", "health", "db", "proceso"):
+        values = [result[phase] for result in results]
+        print(f"{phase:<8} p50 {ms(statistics.median(values))}   max {ms(max(values))}")
+    print(f"Engine creado al importar: {any(r['engine_at_import'] for r in results)}")
+    print(f"SDK de Gemini cargado al importar: {any(r['genai_at_import'] for r in results)}")
+    print("="*50)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de arranque en frío")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child()
+    else:
+        run(args.runs)
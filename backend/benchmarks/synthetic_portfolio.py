@@ -0,0 +1,623 @@
+"""
+Generador de cartera sintética - MIRIESGO v2
+Portafolios reproducibles (misma semilla = mismos datos) a escala de producción para
+reproducir consultas lentas y medir optimizaciones: empresas, clientes con historial de
+contacto y banderas, préstamos en todos los estados y modalidades y su plan de pagos completo.
+
+Los datos se generan vectorizados con numpy por bloques de clientes y se cargan con
+INSERT multi-fila en las tablas que leen reportes, listado de clientes y dashboard
+(modelos de backend/models.py). Opcionalmente escribe, por empresa, el archivo de
+ancho fijo equivalente: una línea por cuota con el formato de file_processor_service.
+
+Uso (desde backend/):
+    python -m benchmarks.synthetic_portfolio --companies 5 --clients 100000 --seed 7
+    python -m benchmarks.synthetic_portfolio --clients 20000 --no-db --fixed-width-dir /tmp/cargas
+"""
+
+import argparse
+import os
+import sys
+import time
+import unicodedata
+from dataclasses import dataclass, field
+from datetime import date
+from functools import reduce
+from typing import Dict, Iterator, List, Optional, Tuple
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + '/../..')
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + '/..')
+
+import numpy as np
+from sqlalchemy import MetaData, Table, func, insert, select
+from sqlalchemy.orm import Session
+
+from database import SessionLocal, get_engine
+from services.file_processor_service import CONTROL_LAYOUT, DETAIL_LAYOUT
+import crud, models
+
+# ===============================================
+# CATÁLOGOS
+# ===============================================
+
+FIRST_NAMES = (
+    "Carlos", "María", "Juan", "Ana", "Luis", "Carmen", "Roberto", "Patricia", "Andrés", "Laura",
+    "Jorge", "Sofía", "Diego", "Valentina", "Camilo", "Daniela", "Felipe", "Natalia", "Sebastián",
+    "Paola", "Julián", "Ángela", "Óscar", "Lucía", "Hernán", "Marcela", "Iván", "Claudia", "Mateo", "Inés",
+)
+LAST_NAMES = (
+    "García", "Rodríguez", "Martínez", "López", "Gómez", "Pérez", "Sánchez", "Ramírez", "Torres", "Díaz",
+    "Hernández", "Morales", "Castro", "Jiménez", "Vargas", "Rojas", "Gutiérrez", "Silva", "Moreno", "Ruiz",
+    "Ortiz", "Muñoz", "Suárez", "Acosta", "Herrera", "Medina", "Castaño", "Ríos", "Cárdenas", "Peña",
+)
+CITIES = (
+    "Bogotá", "Medellín", "Cali", "Barranquilla", "Cartagena", "Bucaramanga", "Pereira", "Manizales",
+    "Cúcuta", "Ibagué", "Santa Marta", "Villavicencio", "Pasto", "Montería", "Neiva",
+)
+STREET_TYPES = ("Calle", "Carrera", "Avenida", "Transversal", "Diagonal")
+EMAIL_DOMAINS = ("gmail.com", "hotmail.com", "yahoo.com", "outlook.com")
+
+# Bandera: peso relativo entre los clientes marcados
+FLAGS = {
+    "Fraude": 0.15,
+    "Robo de identidad": 0.15,
+    "Estafa": 0.10,
+    "Múltiples moras": 0.30,
+    "Proceso jurídico": 0.20,
+    "Cliente VIP": 0.10,
+}
+FLAGGED_CLIENT_RATE = 0.04
+
+# Estado: (peso, días de atraso mínimo, máximo, préstamo cerrado)
+LOAN_STATUSES = {
+    "Vigente": (0.50, 0, 0, False),
+    "Pagado": (0.20, 0, 0, True),
+    "Cancelado": (0.04, 0, 0, True),
+    "En Mora": (0.12, 1, 90, False),
+    "Castigado": (0.04, 180, 720, False),
+    "En Jurídica": (0.04, 120, 540, False),
+    "Embargo": (0.02, 150, 720, False),
+    "Fraudulento": (0.01, 30, 360, False),
+    "Siniestrado": (0.03, 0, 0, False),
+}
+# Modalidad: (peso, días entre cuotas, cuotas mínimo, máximo, factor sobre el monto)
+MODALITIES = {
+    "Diario": (0.15, 1, 30, 120, 0.15),
+    "Semanal": (0.15, 7, 8, 52, 0.4),
+    "Quincenal": (0.15, 15, 6, 48, 0.7),
+    "Mensual": (0.50, 30, 6, 72, 1.0),
+    "Anual": (0.05, 365, 1, 10, 4.0),
+}
+
+# Equivalencias con los códigos del archivo de ancho fijo (LOAN_*_CODES del procesador)
+FILE_LOAN_STATUS_CODES = {
+    "Vigente": "01", "Siniestrado": "01", "Pagado": "02", "En Mora": "03", "Castigado": "03",
+    "En Jurídica": "03", "Embargo": "03", "Cancelado": "05", "Fraudulento": "05",
+}
+FILE_PAYMENT_STATUS_CODES = {"Pendiente": "0", "Pagado": "1", "En Mora": "2"}
+FILE_LOAN_TYPE_WEIGHTS = {"01": 0.06, "02": 0.12, "03": 0.47, "04": 0.15, "05": 0.20}
+
+def _ascii(text: str) -> str:
+    return unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode().lower()
+
+def _catalog(weights: Dict) -> Tuple[np.ndarray, np.ndarray]:
+    names = np.array(list(weights))
+    probabilities = np.array([w[0] if isinstance(w, tuple) else w for w in weights.values()], dtype=float)
+    return names, probabilities / probabilities.sum()
+
+_FIRST = np.array(FIRST_NAMES)
+_FIRST_ASCII = np.array([_ascii(name) for name in FIRST_NAMES])
+_LAST = np.array(LAST_NAMES)
+_LAST_ASCII = np.array([_ascii(name) for name in LAST_NAMES])
+_CITIES = np.array(CITIES)
+_STREETS = np.array(STREET_TYPES)
+_DOMAINS = np.array(EMAIL_DOMAINS)
+_FLAG_NAMES, _FLAG_P = _catalog(FLAGS)
+_STATUS_NAMES, _STATUS_P = _catalog(LOAN_STATUSES)
+_STATUS_LATE_MIN = np.array([v[1] for v in LOAN_STATUSES.values()])
+_STATUS_LATE_MAX = np.array([v[2] for v in LOAN_STATUSES.values()])
+_STATUS_CLOSED = np.array([v[3] for v in LOAN_STATUSES.values()])
+_MODALITY_NAMES, _MODALITY_P = _catalog(MODALITIES)
+_MODALITY_PERIOD = np.array([v[1] for v in MODALITIES.values()])
+_MODALITY_MIN = np.array([v[2] for v in MODALITIES.values()])
+_MODALITY_MAX = np.array([v[3] for v in MODALITIES.values()])
+_MODALITY_SCALE = np.array([v[4] for v in MODALITIES.values()])
+_LOAN_TYPE_CODES, _LOAN_TYPE_P = _catalog(FILE_LOAN_TYPE_WEIGHTS)
+
+# ===============================================
+# GENERACIÓN VECTORIZADA
+# ===============================================
+
+@dataclass
+class PortfolioSpec:
+    """Parámetros del portafolio; con la misma especificación los datos son idénticos"""
+    companies: int = 5
+    clients: int = 10000
+    seed: int = 42
+    chunk_size: int = 5000
+    cutoff: date = field(default_factory=date.today)
+    identifier_base: int = 1_000_000_000
+
+
+@dataclass
+class PortfolioChunk:
+    """
+    Columnas numpy de un bloque de clientes. Los ids de clientes y préstamos son
+    ordinales del portafolio (base 0); el cargador les suma el desplazamiento de la tabla.
+    company_id es el índice de la empresa en el portafolio.
+    """
+    clients: Dict[str, np.ndarray]
+    history: Dict[str, np.ndarray]
+    current_contacts: Dict[str, np.ndarray]
+    flags: Dict[str, np.ndarray]
+    loans: Dict[str, np.ndarray]
+    payments: Dict[str, np.ndarray]
+    # Solo para el archivo de ancho fijo
+    contact_values: Dict[str, np.ndarray]
+    loan_extra: Dict[str, np.ndarray]
+
+
+def _group_positions(counts: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Para grupos de tamaño counts: dueño de cada fila y posición dentro del grupo"""
+    owner = np.repeat(np.arange(counts.size), counts)
+    starts = np.cumsum(counts) - counts
+    return owner, np.arange(owner.size) - starts[owner]
+
+def _join(*parts) -> np.ndarray:
+    return reduce(np.char.add, parts)
+
+def _history_rows(rng, counts, cutoff_ts):
+    """Filas de historial por cliente; la más reciente de cada cliente es la vigente"""
+    owner, position = _group_positions(counts)
+    age_rank = counts[owner] - position - 1
+    days_ago = age_rank * rng.integers(30, 720, owner.size) + rng.integers(0, 30, owner.size)
+    modified = (cutoff_ts - days_ago * np.timedelta64(1, "D")
+                - rng.integers(0, 86400, owner.size) * np.timedelta64(1, "s"))
+    return owner, age_rank == 0, modified
+
+def generate_chunk(spec: PortfolioSpec, chunk_index: int, first_client: int, size: int,
+                   first_loan: int) -> PortfolioChunk:
+    """Generar un bloque de clientes con todo lo que cuelga de ellos"""
+    rng = np.random.default_rng([spec.seed, chunk_index])
+    cutoff = np.datetime64(spec.cutoff, "D")
+    cutoff_ts = cutoff.astype("datetime64[s]") + np.timedelta64(18, "h")
+    client_ordinal = first_client + np.arange(size)
+
+    # -- Clientes --
+    first, second, last1, last2 = (rng.integers(len(FIRST_NAMES), size=size),
+                                   rng.integers(len(FIRST_NAMES), size=size),
+                                   rng.integers(len(LAST_NAMES), size=size),
+                                   rng.integers(len(LAST_NAMES), size=size))
+    has_second = rng.random(size) < 0.6
+    full_name = _join(
+        _FIRST[first], np.where(has_second, np.char.add(" ", _FIRST[second]), ""),
+        " ", _LAST[last1], " ", _LAST[last2]
+    )
+    clients = {
+        "id": client_ordinal,
+        "national_identifier": (spec.identifier_base + client_ordinal).astype(str),
+        "full_name": full_name,
+        "birth_date": cutoff - rng.integers(18 * 365, 80 * 365, size),
+    }
+
+    # -- Historial de contacto (dirección, teléfono, correo) --
+    history_parts, contact_values = [], {}
+
+    owner, latest, modified = _history_rows(rng, rng.integers(1, 4, size), cutoff_ts)
+    city = rng.integers(len(CITIES), size=owner.size)
+    address = _join(
+        _STREETS[rng.integers(len(STREET_TYPES), size=owner.size)], " ",
+        rng.integers(1, 200, owner.size).astype(str), " #", rng.integers(1, 150, owner.size).astype(str),
+        "-", rng.integers(1, 99, owner.size).astype(str), ", ", _CITIES[city]
+    )
+    history_parts.append(("address", owner, latest, modified, address))
+    contact_values["city"] = _CITIES[city[latest]]
+
+    owner, latest, modified = _history_rows(rng, rng.integers(1, 3, size), cutoff_ts)
+    phone = rng.integers(3_000_000_000, 3_509_999_999, owner.size).astype(str)
+    history_parts.append(("phone", owner, latest, modified, phone))
+
+    owner, latest, modified = _history_rows(rng, rng.integers(1, 3, size), cutoff_ts)
+    email = _join(
+        _FIRST_ASCII[first[owner]], ".", _LAST_ASCII[last1[owner]],
+        rng.integers(1, 9999, owner.size).astype(str), "@",
+        _DOMAINS[rng.integers(len(EMAIL_DOMAINS), size=owner.size)]
+    )
+    history_parts.append(("email", owner, latest, modified, email))
+
+    history_columns = []
+    for data_type, owner, latest, modified, values in history_parts:
+        history_columns.append({
+            "client_id": client_ordinal[owner],
+            "data_type": np.full(owner.size, data_type),
+            "value": values,
+            "date_modified": modified,
+            "latest": latest,
+        })
+        # Una fila vigente por cliente, en el orden de los clientes
+        contact_values[data_type] = values[latest]
+    history = {key: np.concatenate([part[key] for part in history_columns]) for key in history_columns[0]}
+    current = history.pop("latest")
+    current_contacts = {key: column[current] for key, column in history.items()}
+
+    # -- Banderas: 1 o 2 distintas para una fracción de los clientes --
+    flagged = np.flatnonzero(rng.random(size) < FLAGGED_CLIENT_RATE)
+    flag_counts = rng.integers(1, 3, flagged.size)
+    flag_owner, flag_position = _group_positions(flag_counts)
+    base_flag = rng.choice(_FLAG_NAMES.size, flagged.size, p=_FLAG_P)
+    flag_index = (base_flag[flag_owner] + flag_position * rng.integers(1, _FLAG_NAMES.size, flag_owner.size)) % _FLAG_NAMES.size
+    flags = {
+        "client_id": client_ordinal[flagged[flag_owner]],
+        "flag": _FLAG_NAMES[flag_index],
+    }
+
+    # -- Préstamos --
+    loan_counts = np.minimum(rng.poisson(0.9, size) + 1, 6)
+    loan_owner = np.repeat(np.arange(size), loan_counts)
+    loan_total = loan_owner.size
+    status = rng.choice(_STATUS_NAMES.size, loan_total, p=_STATUS_P)
+    modality = rng.choice(_MODALITY_NAMES.size, loan_total, p=_MODALITY_P)
+    period = _MODALITY_PERIOD[modality]
+    installments = rng.integers(_MODALITY_MIN[modality], _MODALITY_MAX[modality] + 1)
+    span = installments * period
+    closed = _STATUS_CLOSED[status]
+    days_late = rng.integers(_STATUS_LATE_MIN[status], _STATUS_LATE_MAX[status] + 1)
+
+    # Cerrados: el plan terminó antes del corte. Abiertos: a mitad del plan y con
+    # antigüedad suficiente para acumular el atraso asignado
+    elapsed = np.where(
+        closed,
+        span + rng.integers(0, 720, loan_total),
+        np.maximum((rng.uniform(0.05, 0.95, loan_total) * span).astype(np.int64), days_late + period)
+    )
+    origination = cutoff - elapsed
+    original_amount = np.clip(
+        np.round(rng.lognormal(np.log(2_500_000), 0.9, loan_total) * _MODALITY_SCALE[modality], -3),
+        100_000, 999_000_000
+    )
+    interest_rate = np.round(rng.uniform(12.0, 38.0, loan_total), 2)
+    installment_amount = np.round(original_amount * (1 + interest_rate / 100 * span / 365) / installments, 2)
+
+    # -- Plan de pagos completo --
+    pay_loan, position = _group_positions(installments)
+    installment_number = position + 1
+    expected = origination[pay_loan] + installment_number * period[pay_loan]
+    due = expected <= cutoff
+    overdue = due & (days_late[pay_loan] > 0) & (expected >= cutoff - days_late[pay_loan])
+    paid = (due & ~overdue) | closed[pay_loan]
+
+    lateness = np.minimum(rng.geometric(0.55, pay_loan.size) - 1, 45)
+    actual = np.where(paid, np.minimum(expected + lateness, cutoff), np.datetime64("NaT", "D"))
+    amount_paid = np.round(installment_amount[pay_loan] * rng.uniform(0.98, 1.02, pay_loan.size), 2)
+    payment_days_late = np.where(paid, (actual - expected).astype(np.int64),
+                                 np.where(overdue, (cutoff - expected).astype(np.int64), 0))
+    payment_status = np.where(paid, "Pagado", np.where(overdue, "En Mora", "Pendiente"))
+
+    unpaid = np.bincount(pay_loan, weights=~paid, minlength=loan_total)
+    current_balance = np.where(closed, 0.0, np.round(original_amount * unpaid / installments, 2))
+    last_paid = np.full(loan_total, -1, dtype=np.int64)
+    np.maximum.at(last_paid, pay_loan[paid], actual[paid].astype(np.int64))
+    last_payment_date = np.where(last_paid >= 0, last_paid.astype("datetime64[D]"), np.datetime64("NaT", "D"))
+
+    loan_ordinal = first_loan + np.arange(loan_total)
+    # Mismo número en la base y en los archivos: recargar un archivo actualiza sus préstamos.
+    # Lleva la identificación del titular, así portafolios con otra identifier_base no chocan
+    loan_number = _join(clients["national_identifier"][loan_owner], "-",
+                        np.char.zfill((loan_ordinal % 10 ** 8).astype(str), 8))
+    loans = {
+        "id": loan_ordinal,
+        "loan_number": loan_number,
+        "client_id": client_ordinal[loan_owner],
+        "company_id": _company_index(rng, spec.companies, loan_total),
+        "origination_date": origination,
+        "original_amount": original_amount,
+        "current_balance": current_balance,
+        "status": _STATUS_NAMES[status],
+        "modality": _MODALITY_NAMES[modality],
+        "interest_rate": interest_rate,
+        "installments": installments,
+        "days_late": days_late,
+        "last_report_date": np.full(loan_total, cutoff),
+    }
+    amount_column = amount_paid.astype(object)
+    amount_column[~paid] = None
+    payments = {
+        "loan_id": loan_ordinal[pay_loan],
+        "installment_number": installment_number,
+        "expected_payment_date": expected,
+        "actual_payment_date": actual,
+        "amount_paid": amount_column,
+        "status": payment_status,
+        "days_late": payment_days_late,
+    }
+    loan_extra = {
+        "owner": loan_owner,
+        "loan_number": loan_number,
+        "loan_type": _LOAN_TYPE_CODES[rng.choice(_LOAN_TYPE_CODES.size, loan_total, p=_LOAN_TYPE_P)],
+        "end_date": origination + span,
+        "installment_amount": installment_amount,
+        "last_payment_date": last_payment_date,
+        "pay_loan": pay_loan,
+        "amount_paid": np.where(paid, amount_paid, 0.0),
+    }
+    return PortfolioChunk(clients, history, current_contacts, flags, loans, payments, contact_values, loan_extra)
+
+def _company_index(rng, companies: int, size: int) -> np.ndarray:
+    """Empresa de cada préstamo; pocas empresas concentran la mayor parte de la cartera"""
+    weights = 1.0 / np.arange(1, companies + 1) ** 0.8
+    return rng.choice(companies, size, p=weights / weights.sum())
+
+def generate_portfolio(spec: PortfolioSpec) -> Iterator[PortfolioChunk]:
+    """Recorrer el portafolio bloque a bloque; solo un bloque vive en memoria"""
+    first_loan = 0
+    for chunk_index, first_client in enumerate(range(0, spec.clients, spec.chunk_size)):
+        size = min(spec.chunk_size, spec.clients - first_client)
+        chunk = generate_chunk(spec, chunk_index, first_client, size, first_loan)
+        first_loan += chunk.loans["id"].size
+        yield chunk
+
+# ===============================================
+# CARGA EN BASE DE DATOS
+# ===============================================
+
+# Tablas del modelo de lectura que llena el generador (companies se trata aparte)
+PORTFOLIO_TABLES = (
+    models.Client, models.ClientDataHistory, models.ClientCurrentContact, models.ClientFlag,
+    models.Loan, models.Payment, models.CompanyPortfolioStats,
+)
+INSERT_BATCH_SIZE = 10000
+
+def _insert_columns(db: Session, model, columns: Dict[str, np.ndarray], offsets: Dict[str, int] = None) -> int:
+    """
+    INSERT multi-fila de columnas numpy en lotes de INSERT_BATCH_SIZE filas.
+    Solo el lote en curso se convierte a objetos de Python.
+    """
+    offsets = offsets or {}
+    keys = list(columns)
+    total = len(columns[keys[0]]) if keys else 0
+    for start in range(0, total, INSERT_BATCH_SIZE):
+        values = []
+        for key in keys:
+            column = columns[key][start:start + INSERT_BATCH_SIZE]
+            values.append((column + offsets[key] if key in offsets else column).tolist())
+        db.execute(insert(model), [dict(zip(keys, row)) for row in zip(*values)])
+    return total
+
+def ensure_companies(db: Session, count: int) -> List[Tuple[int, str]]:
+    """
+    Crear (o reutilizar por código) las empresas del portafolio; retorna [(id, código)].
+    La tabla companies la comparten los dos modelos de la aplicación con columnas
+    distintas, así que se refleja y se llenan solo las columnas que existen.
+    """
+    companies = Table("companies", MetaData(), autoload_with=db.get_bind())
+    # Si existen las dos columnas de código (base compartida) se llenan ambas
+    code_columns = [companies.c[name] for name in ("code", "transunion_code") if name in companies.c]
+    code_column = code_columns[0]
+    codes = [f"SYN{index:04d}" for index in range(count)]
+
+    existing = dict(db.execute(select(code_column, companies.c.id).where(code_column.in_(codes))).all())
+    # La tabla reflejada no trae los defaults de Python de los modelos: las fechas
+    # se llenan con el reloj de la base (las lee la API de empresas)
+    now = db.execute(select(func.current_timestamp())).scalar()
+    defaults = {"status": "active", "is_active": True, "created_user": "synthetic", "industry": "Financiero",
+                "created_at": now, "updated_at": now}
+    new_rows = []
+    for index, code in enumerate(codes):
+        if code in existing:
+            continue
+        row = {"name": f"Financiera Sintética {index + 1}", "nit": f"900{index:06d}-S"}
+        row.update({column.name: code for column in code_columns})
+        row.update({key: value for key, value in defaults.items() if key in companies.c})
+        new_rows.append(row)
+    if new_rows:
+        db.execute(insert(companies), new_rows)
+        db.commit()
+        existing = dict(db.execute(select(code_column, companies.c.id).where(code_column.in_(codes))).all())
+    return [(existing[code], code) for code in codes]
+
+def _next_id(db: Session, model) -> int:
+    return (db.execute(select(func.max(model.id))).scalar() or 0) + 1
+
+class PortfolioLoader:
+    """Carga los bloques con ids consecutivos a partir del máximo actual de cada tabla"""
+
+    def __init__(self, db: Session, company_ids: List[int]):
+        self.db = db
+        self.company_ids = np.array(company_ids)
+        self.client_base = _next_id(db, models.Client)
+        self.loan_base = _next_id(db, models.Loan)
+        self.rows: Dict[str, int] = {}
+
+    def load(self, chunk: PortfolioChunk):
+        client_offset = {"id": self.client_base, "client_id": self.client_base}
+        loan_offset = {"id": self.loan_base, "client_id": self.client_base}
+        loans = {**chunk.loans, "company_id": self.company_ids[chunk.loans["company_id"]]}
+
+        for model, columns, offsets in (
+            (models.Client, chunk.clients, client_offset),
+            (models.ClientDataHistory, chunk.history, client_offset),
+            (models.ClientCurrentContact, chunk.current_contacts, client_offset),
+            (models.ClientFlag, chunk.flags, client_offset),
+            (models.Loan, loans, loan_offset),
+            (models.Payment, chunk.payments, {"loan_id": self.loan_base}),
+        ):
+            inserted = _insert_columns(self.db, model, columns, offsets)
+            self.rows[model.__tablename__] = self.rows.get(model.__tablename__, 0) + inserted
+        self.db.commit()
+
+# ===============================================
+# ARCHIVOS DE ANCHO FIJO
+# ===============================================
+
+def _text(values, width: int) -> np.ndarray:
+    return np.char.ljust(np.asarray(values).astype(str).astype(f"U{width}"), width)
+
+def _number(values, width: int) -> np.ndarray:
+    values = np.clip(np.asarray(values, dtype=np.int64), 0, 10 ** width - 1)
+    return np.char.zfill(values.astype(str), width)
+
+def _amount(values, width: int) -> np.ndarray:
+    """Montos con dos decimales implícitos (centavos)"""
+    return _number(np.rint(np.asarray(values, dtype=float) * 100), width)
+
+def _date(values, width: int) -> np.ndarray:
+    values = np.asarray(values, dtype="datetime64[D]")
+    text = np.char.replace(np.datetime_as_string(values, unit="D"), "-", "")
+    return np.where(np.isnat(values), "0" * width, text)
+
+class FixedWidthWriter:
+    """
+    Un archivo por empresa con el registro de control y una línea de detalle por cuota.
+    El total de registros del control se completa al cerrar (la línea tiene ancho fijo).
+    """
+
+    def __init__(self, directory: str, companies: List[Tuple[int, str]], cutoff: date):
+        os.makedirs(directory, exist_ok=True)
+        self.cutoff = cutoff
+        self.codes = [code for _, code in companies]
+        self.paths = [os.path.join(directory, f"{code}_{cutoff:%Y%m%d}.txt") for code in self.codes]
+        self.totals = [0] * len(companies)
+        self._files = [open(path, "w", encoding="latin-1", newline="") for path in self.paths]
+        for index, fh in enumerate(self._files):
+            fh.write(self._control_line(index) + "\n")
+
+    def _control_line(self, index: int) -> str:
+        fields = {
+            "record_type": "1",
+            "company_code": self.codes[index].ljust(10)[:10],
+            "cutoff_date": f"{self.cutoff:%Y%m%d}",
+            "total_records": str(self.totals[index]).zfill(9),
+        }
+        return "".join(fields[name] for name, _, _ in CONTROL_LAYOUT)
+
+    def write(self, chunk: PortfolioChunk):
+        loans, extra, payments = chunk.loans, chunk.loan_extra, chunk.payments
+        pay_loan = extra["pay_loan"]
+        owner = extra["owner"][pay_loan]
+        status_codes = np.vectorize(FILE_LOAN_STATUS_CODES.get)(loans["status"])
+        payment_codes = np.vectorize(FILE_PAYMENT_STATUS_CODES.get)(payments["status"])
+
+        values = {
+            "record_type": np.full(pay_loan.size, "2"),
+            "national_identifier": chunk.clients["national_identifier"][owner],
+            "full_name": chunk.clients["full_name"][owner],
+            "birth_date": chunk.clients["birth_date"][owner],
+            "phone": chunk.contact_values["phone"][owner],
+            "email": chunk.contact_values["email"][owner],
+            "address": chunk.contact_values["address"][owner],
+            "city": chunk.contact_values["city"][owner],
+            "loan_number": extra["loan_number"][pay_loan],
+            "loan_type": extra["loan_type"][pay_loan],
+            "original_amount": loans["original_amount"][pay_loan],
+            "current_balance": loans["current_balance"][pay_loan],
+            "monthly_payment": extra["installment_amount"][pay_loan],
+            "interest_rate": loans["interest_rate"][pay_loan],
+            "start_date": loans["origination_date"][pay_loan],
+            "end_date": extra["end_date"][pay_loan],
+            "last_payment_date": extra["last_payment_date"][pay_loan],
+            "status": status_codes[pay_loan],
+            "days_late": loans["days_late"][pay_loan],
+            "installment_number": payments["installment_number"],
+            "expected_payment_date": payments["expected_payment_date"],
+            "actual_payment_date": payments["actual_payment_date"],
+            "amount_paid": extra["amount_paid"],
+            "payment_status": payment_codes,
+        }
+        numbers = {"days_late", "installment_number"}
+        amounts = {"original_amount", "current_balance", "monthly_payment", "interest_rate", "amount_paid"}
+        dates = {"birth_date", "start_date", "end_date", "last_payment_date",
+                 "expected_payment_date", "actual_payment_date"}
+
+        companies = loans["company_id"][pay_loan]
+
+        # Las líneas (416 caracteres) se arman por tramos para acotar la memoria
+        for start in range(0, pay_loan.size, INSERT_BATCH_SIZE):
+            window = slice(start, start + INSERT_BATCH_SIZE)
+            parts = []
+            for name, field_start, field_end in DETAIL_LAYOUT:
+                formatter = (_number if name in numbers else _amount if name in amounts
+                             else _date if name in dates else _text)
+                parts.append(formatter(values[name][window], field_end - field_start))
+            lines = _join(*parts)
+
+            line_companies = companies[window]
+            for index, fh in enumerate(self._files):
+                selected = lines[line_companies == index]
+                if selected.size:
+                    fh.write("\n".join(selected.tolist()) + "\n")
+                    self.totals[index] += selected.size
+
+    def close(self) -> List[str]:
+        for index, fh in enumerate(self._files):
+            fh.seek(0)
+            fh.write(self._control_line(index))
+            fh.close()
+        return self.paths
+
+# ===============================================
+# EJECUCIÓN
+# ===============================================
+
+def build_portfolio(spec: PortfolioSpec, load_db: bool = True,
+                    fixed_width_dir: Optional[str] = None) -> Dict[str, int]:
+    """Generar el portafolio completo; retorna filas por tabla (y líneas por archivo)"""
+    db = SessionLocal() if load_db else None
+    try:
+        if load_db:
+            models.Base.metadata.create_all(
+                get_engine(), tables=[model.__table__ for model in PORTFOLIO_TABLES]
+            )
+            companies = ensure_companies(db, spec.companies)
+            loader = PortfolioLoader(db, [company_id for company_id, _ in companies])
+        else:
+            companies = [(index + 1, f"SYN{index:04d}") for index in range(spec.companies)]
+            loader = None
+        writer = FixedWidthWriter(fixed_width_dir, companies, spec.cutoff) if fixed_width_dir else None
+
+        generated = 0
+        for chunk in generate_portfolio(spec):
+            if loader:
+                loader.load(chunk)
+            if writer:
+                writer.write(chunk)
+            generated += chunk.clients["id"].size
+            print(f"  {generated}/{spec.clients} clientes", flush=True)
+
+        result = dict(loader.rows) if loader else {}
+        if writer:
+            for path, total in zip(writer.close(), writer.totals):
+                result[os.path.basename(path)] = total
+        if loader:
+            # Los agregados del dashboard se reconstruyen una vez al final
+            crud.rebuild_portfolio_stats(db)
+        return result
+    finally:
+        if db is not None:
+            db.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generador de cartera sintética")
+    parser.add_argument("--companies", type=int, default=5)
+    parser.add_argument("--clients", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--chunk-size", type=int, default=5000, help="Clientes por bloque")
+    parser.add_argument("--cutoff", type=date.fromisoformat, default=date.today(), help="Fecha de corte AAAA-MM-DD")
+    parser.add_argument("--identifier-base", type=int, default=1_000_000_000)
+    parser.add_argument("--fixed-width-dir", help="Directorio donde escribir los archivos de ancho fijo")
+    parser.add_argument("--no-db", action="store_true", help="Solo generar archivos, sin cargar la base de datos")
+    args = parser.parse_args()
+
+    spec = PortfolioSpec(
+        companies=args.companies, clients=args.clients, seed=args.seed, chunk_size=args.chunk_size,
+        cutoff=args.cutoff, identifier_base=args.identifier_base
+    )
+    start = time.perf_counter()
+    result = build_portfolio(spec, load_db=not args.no_db, fixed_width_dir=args.fixed_width_dir)
+    elapsed = time.perf_counter() - start
+
+    print("="*50)
+    print(f"Portafolio: {spec.clients} clientes, {spec.companies} empresas, semilla {spec.seed}")
+    for name, rows in result.items():
+        print(f"  {name:<32} {rows:>12,}")
+    total_rows = sum(result.values())
+    print(f"Tiempo: {elapsed:.1f} s ({total_rows / elapsed:,.0f} filas/s)")
+    print("="*50)
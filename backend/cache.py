@@ -0,0 +1,97 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable
+
+from config import settings
+
+class TTLCache:
+    """
+    Caché en memoria del proceso con expiración por TTL y límite de tamaño LRU.
+    Es segura entre hilos; cada worker del servidor tiene su propia copia.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def invalidate_many(self, keys: Iterable[Hashable]):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SingleFlight:
+    """
+    Deduplicación de llamadas asíncronas en curso: las peticiones concurrentes con la
+    misma clave esperan el resultado (o la excepción) de una sola ejecución.
+    La llamada compartida no se cancela si la petición que la inició se desconecta.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.shared = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+
+# Identidades autenticadas por 'sub' del JWT (email). La firma del token se sigue
+# verificando en cada petición; solo se evita la consulta del usuario. Cada capa de
+# autenticación guarda su propia forma bajo (capa, email).
+IDENTITY_LAYERS = ("legacy", "v2")
+identity_cache = TTLCache(maxsize=settings.IDENTITY_CACHE_MAX_ENTRIES, ttl=settings.IDENTITY_CACHE_TTL_SECONDS)
+
+def invalidate_identity(email: str):
+    """Descartar la identidad en caché de un usuario (cambios de rol, estado o contraseña)"""
+    identity_cache.invalidate_many((layer, email) for layer in IDENTITY_LAYERS)
@@ -12,15 +12,101 @@ class Settings(BaseSettings):
     DB_USER: str = os.getenv("DB_USER", "")
     DB_PASSWORD: str = os.getenv("DB_PASSWORD", "")
     DB_NAME: str = os.getenv("DB_NAME", "miriresgo")
+    # "auto" prueba MySQL en el primer uso y cae a SQLite; "mysql" o "sqlite" evitan la prueba
+    DB_BACKEND: str = os.getenv("DB_BACKEND", "auto")
+    DB_PROBE_TIMEOUT: int = int(os.getenv("DB_PROBE_TIMEOUT", "3"))
 
     # Configuración de JWT
     SECRET_KEY: str = os.getenv("SECRET_KEY", "clave-secreta-por-defecto-cambiar-en-produccion")
     ALGORITHM: str = os.getenv("ALGORITHM", "HS256")
     ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "1440"))
 
+    # Clave HMAC para el digest de los tokens de sesión (tabla sessions)
+    SESSION_TOKEN_KEY: str = os.getenv("SESSION_TOKEN_KEY", os.getenv("SECRET_KEY", "clave-secreta-por-defecto-cambiar-en-produccion"))
+    # Intervalo mínimo entre actualizaciones de sessions.last_activity
+    SESSION_ACTIVITY_UPDATE_SECONDS: int = int(os.getenv("SESSION_ACTIVITY_UPDATE_SECONDS", "60"))
+
     # Google Gemini
     API_KEY: str = os.getenv("API_KEY", "")
 
+    # Puntaje de riesgo: "scorecard" (local), "llm" (Gemini, con el scorecard si falla)
+    # o "blend" (promedio ponderado de ambos con RISK_SCORE_LLM_WEIGHT para Gemini)
+    RISK_SCORE_MODE: str = os.getenv("RISK_SCORE_MODE", "scorecard").lower()
+    RISK_SCORE_LLM_WEIGHT: float = float(os.getenv("RISK_SCORE_LLM_WEIGHT", "0.5"))
+    # Caché de puntajes de Gemini por contenido del reporte simplificado
+    RISK_SCORE_CACHE_TTL_SECONDS: int = int(os.getenv("RISK_SCORE_CACHE_TTL_SECONDS", "3600"))
+    RISK_SCORE_CACHE_MAX_ENTRIES: int = int(os.getenv("RISK_SCORE_CACHE_MAX_ENTRIES", "10000"))
+
+    # Cliente de Gemini: backend ("gemini" o "fake" para pruebas sin red), llamadas simultáneas,
+    # plazo por intento y por llamada completa, reintentos y espera base entre reintentos
+    GEMINI_BACKEND: str = os.getenv("GEMINI_BACKEND", "gemini").lower()
+    GEMINI_FAKE_LATENCY_SECONDS: float = float(os.getenv("GEMINI_FAKE_LATENCY_SECONDS", "0.5"))
+    GEMINI_MAX_CONCURRENCY: int = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+    GEMINI_TIMEOUT_SECONDS: float = float(os.getenv("GEMINI_TIMEOUT_SECONDS", "10"))
+    GEMINI_DEADLINE_SECONDS: float = float(os.getenv("GEMINI_DEADLINE_SECONDS", "25"))
+    GEMINI_RETRIES: int = int(os.getenv("GEMINI_RETRIES", "2"))
+    GEMINI_RETRY_BACKOFF_SECONDS: float = float(os.getenv("GEMINI_RETRY_BACKOFF_SECONDS", "0.5"))
+    # Circuit breaker: fallos seguidos para abrirlo y segundos abierto antes de volver a probar
+    GEMINI_BREAKER_FAILURES: int = int(os.getenv("GEMINI_BREAKER_FAILURES", "5"))
+    GEMINI_BREAKER_RESET_SECONDS: float = float(os.getenv("GEMINI_BREAKER_RESET_SECONDS", "30"))
+    # Puntaje por lotes (/api/risk-score/batch): tokens estimados por llamada (prompt y
+    # respuesta) y máximo de reportes por llamada
+    GEMINI_BATCH_TOKEN_BUDGET: int = int(os.getenv("GEMINI_BATCH_TOKEN_BUDGET", "8000"))
+    GEMINI_BATCH_MAX_ITEMS: int = int(os.getenv("GEMINI_BATCH_MAX_ITEMS", "40"))
+
+    # Recálculo de puntajes por lotes: cada cuántos minutos corre en el servidor (0 = solo
+    # manual o por cron), procesos, clientes por bloque, minutos tras los que una corrida
+    # "running" se considera abandonada y usuario registrado como solicitante
+    RESCORING_INTERVAL_MINUTES: int = int(os.getenv("RESCORING_INTERVAL_MINUTES", "0"))
+    RESCORING_WORKERS: int = int(os.getenv("RESCORING_WORKERS", "2"))
+    RESCORING_CHUNK_SIZE: int = int(os.getenv("RESCORING_CHUNK_SIZE", "5000"))
+    RESCORING_STALE_MINUTES: int = int(os.getenv("RESCORING_STALE_MINUTES", "120"))
+    RESCORING_USER_EMAIL: str = os.getenv("RESCORING_USER_EMAIL", "admin@miriesgo.com")
+
+    # Carga de archivos planos
+    UPLOAD_DIRECTORY: str = os.getenv("UPLOAD_DIRECTORY", "uploads")
+    INGESTION_BATCH_SIZE: int = int(os.getenv("INGESTION_BATCH_SIZE", "2000"))
+    FILE_WORKERS: int = int(os.getenv("FILE_WORKERS", "2"))
+    FILE_WORKER_POLL_SECONDS: float = float(os.getenv("FILE_WORKER_POLL_SECONDS", "2"))
+    FILE_WORKER_STALE_MINUTES: int = int(os.getenv("FILE_WORKER_STALE_MINUTES", "30"))
+
+    # Caché de reportes de crédito
+    REPORT_CACHE_TTL_SECONDS: int = int(os.getenv("REPORT_CACHE_TTL_SECONDS", "300"))
+    REPORT_CACHE_MAX_ENTRIES: int = int(os.getenv("REPORT_CACHE_MAX_ENTRIES", "5000"))
+    # Cada cuánto se revisan los cambios hechos por otros procesos (máxima antigüedad
+    # de un reporte en caché tras una escritura en otro worker o una ingesta)
+    REPORT_CACHE_UPLOAD_CHECK_SECONDS: int = int(os.getenv("REPORT_CACHE_UPLOAD_CHECK_SECONDS", "5"))
+    # Duración máxima esperada de una transacción de escritura: los cambios se buscan
+    # desde la revisión anterior menos este margen
+    REPORT_CACHE_WRITE_LAG_SECONDS: int = int(os.getenv("REPORT_CACHE_WRITE_LAG_SECONDS", "60"))
+
+    # Caché de identidades autenticadas (JWT ya decodificado -> usuario)
+    IDENTITY_CACHE_TTL_SECONDS: int = int(os.getenv("IDENTITY_CACHE_TTL_SECONDS", "30"))
+    IDENTITY_CACHE_MAX_ENTRIES: int = int(os.getenv("IDENTITY_CACHE_MAX_ENTRIES", "10000"))
+
+    # Hilos dedicados a bcrypt (hash y verificación de contraseñas)
+    PASSWORD_HASH_WORKERS: int = int(os.getenv("PASSWORD_HASH_WORKERS", "4"))
+
+    # Auditoría con buffer: tamaño de lote, intervalo máximo de escritura y tope de la cola
+    AUDIT_BATCH_SIZE: int = int(os.getenv("AUDIT_BATCH_SIZE", "200"))
+    AUDIT_FLUSH_SECONDS: float = float(os.getenv("AUDIT_FLUSH_SECONDS", "1"))
+    AUDIT_QUEUE_MAX: int = int(os.getenv("AUDIT_QUEUE_MAX", "10000"))
+
+    # Métricas en /api/metrics (formato Prometheus)
+    METRICS_ENABLED: bool = os.getenv("METRICS_ENABLED", "True").lower() in ("true", "1", "t")
+
+    # Detector de N+1 / presupuesto SQL por petición: "off", "log" o "raise"
+    SQL_BUDGET_MODE: str = os.getenv("SQL_BUDGET_MODE", "off").lower()
+    SQL_BUDGET_DEFAULT_STATEMENTS: int = int(os.getenv("SQL_BUDGET_DEFAULT_STATEMENTS", "50"))
+    SQL_BUDGET_MAX_REPEATS: int = int(os.getenv("SQL_BUDGET_MAX_REPEATS", "5"))
+
+    # Logging: nivel raíz, niveles por subsistema ("logger=NIVEL,..."), formato y SQL muestreado
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
+    LOG_LEVELS: str = os.getenv("LOG_LEVELS", "")
+    LOG_FORMAT: str = os.getenv("LOG_FORMAT", "json").lower()
+    SQL_LOG_SAMPLE_RATE: float = float(os.getenv("SQL_LOG_SAMPLE_RATE", "0"))
+    SQL_LOG_SLOW_MS: float = float(os.getenv("SQL_LOG_SLOW_MS", "500"))
+
     DEBUG: bool = os.getenv("DEBUG", "False").lower() in ("true", "1", "t")
 
     class Config:
@@ -1,15 +1,21 @@
-from sqlalchemy.orm import Session, joinedload, subqueryload
-from sqlalchemy import func
+from sqlalchemy.orm import Session, joinedload, subqueryload, selectinload
+from sqlalchemy import func, case, select, insert, update, literal, union_all, or_, and_
 import models, schemas
-from auth import get_password_hash
-from datetime import datetime
+from services import password_service
+from cache import TTLCache
+from config import settings
+from datetime import datetime, timedelta
+import logging
+import time
+
+logger = logging.getLogger("miriesgo.crud")
 
 # --- User CRUD ---
 def get_user_by_email(db: Session, email: str):
     return db.query(models.User).filter(models.User.email == email).first()
 
 def create_user(db: Session, user: schemas.UserCreate):
-    hashed_password = get_password_hash(user.password)
+    hashed_password = password_service.hash_password(user.password)
     db_user = models.User(
         email=user.email,
         password_hash=hashed_password,
@@ -32,17 +38,108 @@ def get_all_companies(db: Session):
 def get_client_by_identifier(db: Session, identifier: str):
     return db.query(models.Client).filter(models.Client.national_identifier == identifier).first()
 
-def get_all_clients(db: Session):
-    return (
-        db.query(models.Client)
-        .options(
-            subqueryload(models.Client.data_history),
-            subqueryload(models.Client.flags)
+def get_clients_page(db: Session, limit: int, after: tuple = None):
+    """
+    Página de clientes ordenada por (full_name, id) con paginación por llave (keyset).
+    `after` es el (full_name, id) del último cliente de la página anterior; el costo
+    no crece con la posición de la página, a diferencia de OFFSET.
+    """
+    query = db.query(models.Client).options(selectinload(models.Client.flags))
+    if after is not None:
+        last_name, last_id = after
+        query = query.filter(or_(
+            models.Client.full_name > last_name,
+            and_(models.Client.full_name == last_name, models.Client.id > last_id)
+        ))
+    return query.order_by(models.Client.full_name, models.Client.id).limit(limit).all()
+
+# --- Contact History ---
+CONTACT_DATA_TYPES = ('address', 'phone', 'email')
+
+def get_contact_history(db: Session, client_ids, limit: int = None) -> dict:
+    """
+    Historial de contacto de varios clientes, del más reciente al más antiguo,
+    como {client_id: {data_type: [entradas]}}. El orden lo resuelve la base de datos
+    con idx_client_data_history_latest. Con limit=1 se lee la proyección
+    client_current_contacts; con otro limit se usa ROW_NUMBER() por tipo.
+    """
+    history = {client_id: {data_type: [] for data_type in CONTACT_DATA_TYPES} for client_id in client_ids}
+    if not client_ids:
+        return history
+
+    if limit == 1:
+        rows = db.query(models.ClientCurrentContact).filter(
+            models.ClientCurrentContact.client_id.in_(client_ids)
+        ).all()
+        for row in rows:
+            history[row.client_id][row.data_type].append(row)
+        # Clientes aún sin proyección (historial anterior a rebuild_current_contacts)
+        client_ids = [client_id for client_id in client_ids if not any(history[client_id].values())]
+        if not client_ids:
+            return history
+
+    entry = models.ClientDataHistory
+    if limit is None:
+        rows = db.execute(
+            select(entry.client_id, entry.data_type, entry.value, entry.date_modified)
+            .where(entry.client_id.in_(client_ids))
+            .order_by(entry.client_id, entry.data_type, entry.date_modified.desc())
+        ).all()
+    else:
+        position = func.row_number().over(
+            partition_by=(entry.client_id, entry.data_type),
+            order_by=(entry.date_modified.desc(), entry.id.desc())
+        ).label('position')
+        ranked = (
+            select(entry.client_id, entry.data_type, entry.value, entry.date_modified, position)
+            .where(entry.client_id.in_(client_ids))
+            .subquery()
         )
-        .order_by(models.Client.full_name)
-        .all()
+        rows = db.execute(
+            select(ranked.c.client_id, ranked.c.data_type, ranked.c.value, ranked.c.date_modified)
+            .where(ranked.c.position <= limit)
+            .order_by(ranked.c.client_id, ranked.c.data_type, ranked.c.position)
+        ).all()
+
+    for row in rows:
+        history[row.client_id][row.data_type].append(row)
+    return history
+
+def to_client_schema(client: models.Client, history: dict) -> schemas.ClientSchema:
+    """Convertir un cliente y su historial de contacto (ya ordenado) al esquema Pydantic"""
+    def to_historic_entries(entries):
+        return [schemas.HistoricEntry(value=e.value, dateModified=e.date_modified) for e in entries]
+
+    return schemas.ClientSchema(
+        id=client.id,
+        nationalIdentifier=client.national_identifier,
+        fullName=client.full_name,
+        birthDate=client.birth_date,
+        addresses=to_historic_entries(history['address']),
+        phones=to_historic_entries(history['phone']),
+        emails=to_historic_entries(history['email']),
+        flags=[f.flag for f in client.flags]
     )
 
+def rebuild_current_contacts(db: Session):
+    """Reconstruir la proyección client_current_contacts desde el historial completo"""
+    entry = models.ClientDataHistory
+    position = func.row_number().over(
+        partition_by=(entry.client_id, entry.data_type),
+        order_by=(entry.date_modified.desc(), entry.id.desc())
+    ).label('position')
+    ranked = select(entry.client_id, entry.data_type, entry.value, entry.date_modified, position).subquery()
+
+    db.query(models.ClientCurrentContact).delete()
+    db.execute(
+        insert(models.ClientCurrentContact).from_select(
+            ['client_id', 'data_type', 'value', 'date_modified'],
+            select(ranked.c.client_id, ranked.c.data_type, ranked.c.value, ranked.c.date_modified)
+            .where(ranked.c.position == 1)
+        )
+    )
+    db.commit()
+
 def update_client(db: Session, client_id: int, update_data: schemas.ClientUpdateData):
     db_client = db.query(models.Client).filter(models.Client.id == client_id).first()
     if not db_client:
@@ -53,23 +150,26 @@ def update_client(db: Session, client_id: int, update_data: schemas.ClientUpdate
     # Update simple fields
     db_client.full_name = update_data.fullName
     
-    # Obtener el dato más reciente de cada tipo para comparar
-    latest_address = db.query(models.ClientDataHistory).filter_by(client_id=client_id, data_type='address').order_by(models.ClientDataHistory.date_modified.desc()).first()
-    latest_phone = db.query(models.ClientDataHistory).filter_by(client_id=client_id, data_type='phone').order_by(models.ClientDataHistory.date_modified.desc()).first()
-    latest_email = db.query(models.ClientDataHistory).filter_by(client_id=client_id, data_type='email').order_by(models.ClientDataHistory.date_modified.desc()).first()
-
-    # Update historical data if changed
-    if not latest_address or latest_address.value != update_data.address:
-        new_address = models.ClientDataHistory(client_id=client_id, data_type='address', value=update_data.address, date_modified=now)
-        db.add(new_address)
-    
-    if not latest_phone or latest_phone.value != update_data.phone:
-        new_phone = models.ClientDataHistory(client_id=client_id, data_type='phone', value=update_data.phone, date_modified=now)
-        db.add(new_phone)
-        
-    if not latest_email or latest_email.value != update_data.email:
-        new_email = models.ClientDataHistory(client_id=client_id, data_type='email', value=update_data.email, date_modified=now)
-        db.add(new_email)
+    # Valor vigente de cada tipo, leído de la proyección en una sola consulta
+    current_contacts = {
+        contact.data_type: contact
+        for contact in db.query(models.ClientCurrentContact).filter_by(client_id=client_id)
+    }
+
+    # Update historical data if changed, keeping the projection in sync
+    new_values = {'address': update_data.address, 'phone': update_data.phone, 'email': update_data.email}
+    contacts_changed = False
+    for data_type, value in new_values.items():
+        current = current_contacts.get(data_type)
+        if current and current.value == value:
+            continue
+        contacts_changed = True
+        db.add(models.ClientDataHistory(client_id=client_id, data_type=data_type, value=value, date_modified=now))
+        if current:
+            current.value = value
+            current.date_modified = now
+        else:
+            db.add(models.ClientCurrentContact(client_id=client_id, data_type=data_type, value=value, date_modified=now))
 
     # Update flags
     current_flags = {f.flag for f in db_client.flags}
@@ -81,8 +181,14 @@ def update_client(db: Session, client_id: int, update_data: schemas.ClientUpdate
     for flag_val in flags_to_add:
         new_flag = models.ClientFlag(client_id=client_id, flag=flag_val)
         db.add(new_flag)
+
+    # Una marca borrada no deja fila: updated_at del cliente registra el cambio para el
+    # recálculo de puntajes y para la caché de reportes de los demás procesos
+    if contacts_changed or flags_to_remove or flags_to_add:
+        db_client.updated_at = func.now()
         
     db.commit()
+    invalidate_credit_reports([db_client.national_identifier])
     db.refresh(db_client)
     return db_client
 
@@ -93,6 +199,10 @@ def update_loan(db: Session, loan_id: int, loan_update: dict):
     if not db_loan:
         return None
     
+    # Aporte del cliente a los agregados del dashboard antes del cambio
+    client_ids = {db_loan.client_id}
+    before = portfolio_snapshot(db, client_ids)
+
     # Update only the fields provided in the dictionary
     for key, value in loan_update.items():
         if hasattr(db_loan, key):
@@ -100,31 +210,173 @@ def update_loan(db: Session, loan_id: int, loan_update: dict):
             
     db_loan.last_report_date = datetime.utcnow().date()
     
+    db.flush()
+    client_ids.add(db_loan.client_id)
+    apply_portfolio_delta(db, before, portfolio_snapshot(db, client_ids))
     db.commit()
+    invalidate_credit_reports([db_loan.client.national_identifier])
     db.refresh(db_loan)
     return db_loan
 
 
-# --- Credit Report Logic ---
-def get_full_credit_report(db: Session, identifier: str):
-    client = (
-        db.query(models.Client)
-        .options(
-            joinedload(models.Client.data_history),
-            joinedload(models.Client.flags),
-            joinedload(models.Client.loans).subqueryload(models.Loan.payments)
-        )
-        .filter(models.Client.national_identifier == identifier)
-        .first()
+# --- Portfolio Stats ---
+# Agregados del dashboard mantenidos en company_portfolio_stats. Cada escritura de préstamos
+# suma, en su misma transacción, la diferencia entre el aporte de los clientes afectados
+# antes y después del cambio; la reconstrucción completa solo se hace de forma explícita
+# (rebuild_portfolio_stats.py y el generador de cartera sintética).
+
+# Estados del modelo canónico (database/models.py) que pueden quedar en loans, con su
+# equivalente del modelo de lectura
+LOAN_STATUS_ALIASES = {
+    'active': 'Vigente',
+    'paid': 'Pagado',
+    'defaulted': 'En Mora',
+    'restructured': 'Vigente',
+    'cancelled': 'Cancelado',
+}
+
+def _with_aliases(statuses):
+    return tuple(statuses) + tuple(alias for alias, status in LOAN_STATUS_ALIASES.items() if status in statuses)
+
+ARREARS_STATUSES = _with_aliases(('En Mora', 'Castigado'))
+LEGAL_STATUSES = _with_aliases(('En Jurídica', 'Embargo'))
+GENERAL_STATS_ID = 0
+PORTFOLIO_STATS_FIELDS = (
+    "total_clients", "active_clients_up_to_date", "clients_with_arrears", "clients_in_legal",
+    "mora_1_30", "mora_31_60", "mora_61_90", "mora_91_plus",
+)
+
+def compute_portfolio_breakdown(db: Session, company_ids=None, client_ids=None) -> dict:
+    """
+    Calcula en una sola consulta los agregados de cada empresa y el consolidado.
+
+    Cada cliente se clasifica por su préstamo más grave (jurídico > mora > al día)
+    y por sus días de atraso máximos, una vez por empresa y una vez en general
+    (UNION ALL); la consulta externa agrupa por alcance con SUM(CASE ...).
+    Por empresa cuentan los clientes con préstamos en ella; el general cuenta a todos
+    los clientes, y los que no tienen préstamos quedan como al día.
+    Con client_ids solo cuenta a esos clientes (su aporte a cada alcance).
+    Retorna {company_id: valores}, con GENERAL_STATS_ID para el consolidado.
+    """
+    severity = func.max(case(
+        (models.Loan.status.in_(LEGAL_STATUSES), 2),
+        (models.Loan.status.in_(ARREARS_STATUSES), 1),
+        else_=0
+    ))
+    max_days_late = func.max(models.Loan.days_late)
+
+    by_company = (
+        select(models.Loan.company_id.label('scope'), models.Loan.client_id,
+               severity.label('severity'), max_days_late.label('max_days_late'))
+        .group_by(models.Loan.company_id, models.Loan.client_id)
     )
+    if company_ids is not None:
+        by_company = by_company.where(models.Loan.company_id.in_(company_ids))
+    general = (
+        select(literal(GENERAL_STATS_ID).label('scope'), models.Client.id.label('client_id'),
+               severity.label('severity'), max_days_late.label('max_days_late'))
+        .select_from(models.Client)
+        .outerjoin(models.Loan, models.Loan.client_id == models.Client.id)
+        .group_by(models.Client.id)
+    )
+    if client_ids is not None:
+        by_company = by_company.where(models.Loan.client_id.in_(client_ids))
+        general = general.where(models.Client.id.in_(client_ids))
+    per_client = union_all(by_company, general).subquery()
 
-    if not client:
-        return None
+    def count_if(condition):
+        return func.coalesce(func.sum(case((condition, 1), else_=0)), 0)
 
-    addresses = sorted([h for h in client.data_history if h.data_type == 'address'], key=lambda x: x.date_modified, reverse=True)
-    phones = sorted([h for h in client.data_history if h.data_type == 'phone'], key=lambda x: x.date_modified, reverse=True)
-    emails = sorted([h for h in client.data_history if h.data_type == 'email'], key=lambda x: x.date_modified, reverse=True)
-    
+    days_late = per_client.c.max_days_late
+    rows = db.execute(
+        select(
+            per_client.c.scope,
+            func.count(per_client.c.client_id),
+            count_if(per_client.c.severity == 0),
+            count_if(per_client.c.severity == 1),
+            count_if(per_client.c.severity == 2),
+            count_if(days_late.between(1, 30)),
+            count_if(days_late.between(31, 60)),
+            count_if(days_late.between(61, 90)),
+            count_if(days_late > 90),
+        ).group_by(per_client.c.scope)
+    ).all()
+
+    empty = dict.fromkeys(PORTFOLIO_STATS_FIELDS, 0)
+    breakdown = {company_id: dict(empty) for company_id in (company_ids or [])}
+    breakdown[GENERAL_STATS_ID] = dict(empty)
+    for scope, *values in rows:
+        breakdown[scope] = dict(zip(PORTFOLIO_STATS_FIELDS, values))
+    return breakdown
+
+def portfolio_snapshot(db: Session, client_ids) -> dict:
+    """Aporte de los clientes indicados a cada alcance; se toma antes y después de escribir"""
+    client_ids = list(set(client_ids))
+    if not client_ids:
+        return {}
+    return compute_portfolio_breakdown(db, client_ids=client_ids)
+
+def apply_portfolio_delta(db: Session, before: dict, after: dict):
+    """
+    Sumar a company_portfolio_stats la diferencia after - before de cada alcance con
+    UPDATE columna = columna + delta, atómico frente a escrituras concurrentes. No hace
+    commit: se confirma junto con la escritura que lo originó. Si los agregados aún no
+    se han construido (no hay fila general) no hace nada.
+    """
+    deltas = {}
+    for scope in set(before) | set(after):
+        delta = {
+            field: after.get(scope, {}).get(field, 0) - before.get(scope, {}).get(field, 0)
+            for field in PORTFOLIO_STATS_FIELDS
+        }
+        if any(delta.values()):
+            deltas[scope] = delta
+    if not deltas:
+        return
+
+    stats = models.CompanyPortfolioStats
+    existing = set(db.execute(
+        select(stats.company_id).where(stats.company_id.in_([GENERAL_STATS_ID, *deltas]))
+    ).scalars())
+    if GENERAL_STATS_ID not in existing:
+        return
+
+    for scope, delta in deltas.items():
+        if scope in existing:
+            db.execute(
+                update(stats).where(stats.company_id == scope)
+                .values({field: getattr(stats, field) + value for field, value in delta.items() if value})
+            )
+        else:
+            # Empresa sin fila (creada después de la última reconstrucción): se calcula completa
+            values = compute_portfolio_breakdown(db, company_ids=[scope])[scope]
+            db.add(models.CompanyPortfolioStats(company_id=scope, **values))
+
+def rebuild_portfolio_stats(db: Session):
+    """Reconstruir desde cero los agregados de todas las empresas y el consolidado"""
+    company_ids = [company_id for (company_id,) in db.query(models.Company.id)]
+    breakdown = compute_portfolio_breakdown(db, company_ids)
+    db.query(models.CompanyPortfolioStats).delete()
+    db.add_all(
+        models.CompanyPortfolioStats(company_id=company_id, **values)
+        for company_id, values in breakdown.items()
+    )
+    db.commit()
+
+def get_portfolio_stats(db: Session) -> dict:
+    """
+    Agregados precalculados {company_id: valores} (GENERAL_STATS_ID = general).
+    Solo lee: si aún no se han construido se calculan en línea sin guardarlos.
+    """
+    stats = db.query(models.CompanyPortfolioStats).all()
+    if not any(s.company_id == GENERAL_STATS_ID for s in stats):
+        logger.warning("company_portfolio_stats vacía: se calcula en línea (ejecute rebuild_portfolio_stats.py)")
+        return compute_portfolio_breakdown(db, [company_id for (company_id,) in db.query(models.Company.id)])
+    return {s.company_id: {f: getattr(s, f) for f in PORTFOLIO_STATS_FIELDS} for s in stats}
+
+
+# --- Credit Report Logic ---
+def _build_credit_report(client: models.Client, history: dict):
     # Calculate debt summary
     total_credits = len(client.loans)
     active_credits = sum(1 for loan in client.loans if loan.status not in ['Pagado', 'Cancelado'])
@@ -140,28 +392,115 @@ def get_full_credit_report(db: Session, identifier: str):
         totalCurrentBalance=float(total_current_balance)
     )
 
-    # Helper function to convert ClientDataHistory to HistoricEntry with proper dateModified
-    def to_historic_entry(history_item):
-        return schemas.HistoricEntry(
-            value=history_item.value,
-            dateModified=history_item.date_modified
-        )
-
-    client_schema = schemas.ClientSchema(
-        id=client.id,
-        nationalIdentifier=client.national_identifier,
-        fullName=client.full_name,
-        birthDate=client.birth_date,
-        addresses=[to_historic_entry(a) for a in addresses],
-        phones=[to_historic_entry(p) for p in phones],
-        emails=[to_historic_entry(e) for e in emails],
-        flags=[f.flag for f in client.flags]
-    )
-
-    report = schemas.CreditReportSchema(
-        client=client_schema,
+    return schemas.CreditReportSchema(
+        client=to_client_schema(client, history),
         loans=[schemas.LoanSchema.from_orm(loan) for loan in client.loans],
         debtSummary=debt_summary
     )
-    
-    return report
\ No newline at end of file
+
+def get_full_credit_report(db: Session, identifier: str, history_limit: int = None):
+    reports = get_credit_reports(db, [identifier], history_limit=history_limit)
+    return reports.get(identifier)
+
+def get_credit_reports(db: Session, identifiers, history_limit: int = None) -> dict:
+    """
+    Reportes de varios clientes {identificador: reporte} con un número fijo de consultas
+    IN (clientes, marcas, préstamos, pagos e historial) sin importar cuántos sean.
+    Los identificadores sin cliente no aparecen en el resultado.
+    """
+    identifiers = list(dict.fromkeys(identifiers))
+    if not identifiers:
+        return {}
+
+    clients = (
+        db.query(models.Client)
+        .options(
+            selectinload(models.Client.flags),
+            selectinload(models.Client.loans).selectinload(models.Loan.payments)
+        )
+        .filter(models.Client.national_identifier.in_(identifiers))
+        .all()
+    )
+    history = get_contact_history(db, [client.id for client in clients], limit=history_limit)
+
+    return {
+        client.national_identifier: _build_credit_report(client, history[client.id])
+        for client in clients
+    }
+
+
+# --- Credit Report Cache ---
+# Reportes por identificación nacional; cada entrada guarda las variantes por history_limit.
+# Las escrituras de este proceso invalidan de inmediato. Las de otros procesos (workers
+# de la API, ingesta) se detectan cada REPORT_CACHE_UPLOAD_CHECK_SECONDS buscando los
+# clientes con cambios desde la revisión anterior; solo esas entradas se descartan, así
+# que un reporte puede quedar desactualizado en otro proceso a lo sumo ese intervalo.
+report_cache = TTLCache(maxsize=settings.REPORT_CACHE_MAX_ENTRIES, ttl=settings.REPORT_CACHE_TTL_SECONDS)
+_report_cache_watermark = {"checked_at": 0.0, "since": None}
+
+def invalidate_credit_reports(identifiers):
+    """Descartar los reportes en caché de las identificaciones indicadas"""
+    report_cache.invalidate_many(identifiers)
+
+def _changed_report_identifiers(db: Session, since: datetime) -> list:
+    """Identificaciones de los clientes cuyo reporte cambió desde since (inclusive)"""
+    changed = union_all(
+        select(models.Client.id).where(models.Client.updated_at >= since),
+        select(models.ClientFlag.client_id).where(models.ClientFlag.created_at >= since),
+        select(models.Loan.client_id).where(models.Loan.updated_at >= since),
+        select(models.Loan.client_id)
+        .join(models.Payment, models.Payment.loan_id == models.Loan.id)
+        .where(models.Payment.updated_at >= since),
+    ).subquery()
+    return db.execute(
+        select(models.Client.national_identifier).where(models.Client.id.in_(select(changed.c[0])))
+    ).scalars().all()
+
+def _sync_report_cache_with_writes(db: Session):
+    now = time.monotonic()
+    if now - _report_cache_watermark["checked_at"] < settings.REPORT_CACHE_UPLOAD_CHECK_SECONDS:
+        return
+    _report_cache_watermark["checked_at"] = now
+
+    db_now = db.execute(select(func.current_timestamp())).scalar()
+    since = _report_cache_watermark["since"]
+    if since is not None and len(report_cache):
+        # Una transacción larga (un lote de ingesta) confirma filas con el timestamp de
+        # cuando las escribió: se revisa también REPORT_CACHE_WRITE_LAG_SECONDS hacia atrás
+        lag = timedelta(seconds=settings.REPORT_CACHE_WRITE_LAG_SECONDS)
+        report_cache.invalidate_many(_changed_report_identifiers(db, since - lag))
+    _report_cache_watermark["since"] = db_now
+
+def get_cached_credit_report(db: Session, identifier: str, history_limit: int = None):
+    """Reporte de crédito servido desde la caché; se construye y guarda si no existe"""
+    _sync_report_cache_with_writes(db)
+
+    variants = report_cache.get(identifier)
+    if variants is not None and history_limit in variants:
+        return variants[history_limit]
+
+    report = get_full_credit_report(db, identifier, history_limit=history_limit)
+    if report is not None:
+        variants = dict(variants or {})
+        variants[history_limit] = report
+        report_cache.set(identifier, variants)
+    return report
+
+def get_cached_credit_reports(db: Session, identifiers, history_limit: int = None) -> dict:
+    """Versión por lotes de get_cached_credit_report: solo se consultan los que faltan en caché"""
+    _sync_report_cache_with_writes(db)
+
+    reports, missing = {}, []
+    for identifier in dict.fromkeys(identifiers):
+        variants = report_cache.get(identifier)
+        if variants is not None and history_limit in variants:
+            reports[identifier] = variants[history_limit]
+        else:
+            missing.append(identifier)
+
+    for identifier, report in get_credit_reports(db, missing, history_limit=history_limit).items():
+        variants = dict(report_cache.get(identifier) or {})
+        variants[history_limit] = report
+        report_cache.set(identifier, variants)
+        reports[identifier] = report
+    return reports
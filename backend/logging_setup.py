@@ -0,0 +1,184 @@
+"""
+Logging estructurado - MIRIESGO v2
+Salida JSON por una cola (el hilo de la petición nunca escribe en stdout),
+IDs de correlación por petición, niveles por subsistema y SQL muestreado.
+
+Variables de entorno (ver config.Settings):
+    LOG_LEVEL            nivel raíz (INFO)
+    LOG_LEVELS           niveles por logger, p. ej. "miriesgo.auth=DEBUG,uvicorn.access=WARNING"
+    LOG_FORMAT           "json" o "text"
+    SQL_LOG_SAMPLE_RATE  fracción de sentencias SQL que se registran (0 = ninguna)
+    SQL_LOG_SLOW_MS      las sentencias más lentas que esto se registran siempre (0 = desactivado)
+"""
+
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import time
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy import event
+
+from config import settings
+
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+# Atributos estándar de LogRecord; el resto se considera contexto extra del evento
+_RESERVED = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "request_id"}
+
+# ===============================================
+# FORMATO Y FILTROS
+# ===============================================
+
+class RequestIdFilter(logging.Filter):
+    """Agrega el ID de correlación de la petición en curso al registro"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class JSONFormatter(logging.Formatter):
+    """Un objeto JSON por línea"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            entry["request_id"] = request_id
+        for key, value in vars(record).items():
+            if key not in _RESERVED and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+# ===============================================
+# CONFIGURACIÓN
+# ===============================================
+
+def _parse_levels(spec: str):
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, level = item.partition("=")
+        if level:
+            yield name.strip(), level.strip().upper()
+
+def configure_logging():
+    """
+    Instalar el pipeline de logging del proceso (idempotente).
+    El logger raíz solo tiene un QueueHandler; un QueueListener en su propio hilo
+    formatea y escribe en stdout.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(sys.stdout)
+    if settings.LOG_FORMAT == "json":
+        output.setFormatter(JSONFormatter())
+    else:
+        output.setFormatter(logging.Formatter(
+            "%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s"
+        ))
+
+    log_queue: "queue.SimpleQueue" = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    # El filtro corre en el hilo que emite, donde el contextvar de la petición es visible
+    queue_handler.addFilter(RequestIdFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(settings.LOG_LEVEL.upper())
+
+    # SQLAlchemy solo registra sentencias por el muestreo de abajo
+    logging.getLogger("sqlalchemy.engine").setLevel(logging.WARNING)
+    for name, level in _parse_levels(settings.LOG_LEVELS):
+        logging.getLogger(name).setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+
+def shutdown_logging():
+    """Vaciar la cola y detener el hilo de escritura"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+# ===============================================
+# SQL MUESTREADO
+# ===============================================
+
+def instrument_sql_logging(engine):
+    """Registrar una fracción de las sentencias SQL y siempre las lentas, sin parámetros"""
+    sample_rate = settings.SQL_LOG_SAMPLE_RATE
+    slow_seconds = settings.SQL_LOG_SLOW_MS / 1000.0
+    if sample_rate <= 0 and slow_seconds <= 0:
+        return
+    sql_logger = logging.getLogger("miriesgo.sql")
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("log_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["log_query_start"].pop()
+        if slow_seconds > 0 and elapsed >= slow_seconds:
+            sql_logger.warning("SQL lenta", extra={"sql": statement, "ms": round(elapsed * 1000, 2)})
+        elif sample_rate > 0 and random.random() < sample_rate:
+            sql_logger.info("SQL", extra={"sql": statement, "ms": round(elapsed * 1000, 2)})
+
+# ===============================================
+# MIDDLEWARE DE CORRELACIÓN
+# ===============================================
+
+class RequestIdMiddleware:
+    """
+    Middleware ASGI que toma X-Request-ID de la petición (o genera uno),
+    lo deja disponible para los logs y lo devuelve en la respuesta.
+    """
+
+    def __init__(self, app, header_name: str = "x-request-id"):
+        self.app = app
+        self.header_name = header_name.lower().encode()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope.get("headers", []):
+            if name == self.header_name:
+                request_id = value.decode("latin-1")[:64]
+                break
+        request_id = request_id or uuid.uuid4().hex
+        token = request_id_var.set(request_id)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((self.header_name, request_id.encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_id_var.reset(token)
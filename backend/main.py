@@ -1,24 +1,38 @@
 import os
 import sys
+import logging
 from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.exc import SQLAlchemyError
 
 # Agregar el directorio padre al path para importar database
 sys.path.append(os.path.dirname(os.path.abspath(__file__)) + '/..')
 
+# El logging se configura antes de importar routers y servicios
+from config import settings
+from logging_setup import configure_logging, shutdown_logging, instrument_sql_logging, RequestIdMiddleware
+configure_logging()
+logger = logging.getLogger("miriesgo.main")
+
 # Importar routers
 from routers import auth, reports, clients, dashboard, gemini, files, companies, users
+from services.job_queue import file_worker_pool
+from services import password_service
+from services.audit_service import audit_sink
+from services.rescoring_service import rescoring_scheduler
+from database import (
+    on_engine_created, on_async_engine_created, use_pool_class, use_async_pool_class, select_database_url
+)
+import metrics
+import sql_budget
 
 # Crea la carpeta de uploads si no existe
-if not os.path.exists('uploads'):
-    os.makedirs('uploads')
+if not os.path.exists(settings.UPLOAD_DIRECTORY):
+    os.makedirs(settings.UPLOAD_DIRECTORY)
 
-print("🚀 Iniciando MIRIESGO v2 Backend...")
-print("="*50)
-print("📊 Conectando a base de datos MariaDB")
-print("="*50)
+logger.info("Iniciando MIRIESGO v2 Backend")
 
 # ===============================================
 # CONFIGURACIÓN DE LA APLICACIÓN
@@ -46,8 +60,45 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Request-ID"],
 )
 
+# ===============================================
+# MÉTRICAS
+# ===============================================
+
+# Los engines se crean en el primer uso; la instrumentación se registra como hook
+
+if settings.METRICS_ENABLED:
+    use_pool_class(lambda base: metrics.timed_pool_class(base, "sync"))
+    use_async_pool_class(lambda base: metrics.timed_pool_class(base, "async"))
+    on_engine_created(metrics.instrument_engine)
+    on_async_engine_created(lambda sync_engine: metrics.instrument_engine(sync_engine, label="async"))
+    app.add_middleware(metrics.MetricsMiddleware)
+
+# ===============================================
+# PRESUPUESTO SQL (DESARROLLO / PRUEBAS)
+# ===============================================
+
+if settings.SQL_BUDGET_MODE in ("log", "raise"):
+    on_engine_created(sql_budget.instrument_engine)
+    on_async_engine_created(sql_budget.instrument_engine)
+    app.add_middleware(
+        sql_budget.SQLBudgetMiddleware,
+        mode=settings.SQL_BUDGET_MODE,
+        default_max_statements=settings.SQL_BUDGET_DEFAULT_STATEMENTS,
+        default_max_repeats=settings.SQL_BUDGET_MAX_REPEATS
+    )
+
+# ===============================================
+# LOGGING (ID de correlación y SQL muestreado)
+# ===============================================
+
+on_engine_created(instrument_sql_logging)
+on_async_engine_created(instrument_sql_logging)
+# Se agrega al final para que sea el middleware más externo y cubra a los demás
+app.add_middleware(RequestIdMiddleware)
+
 # ===============================================
 # MIDDLEWARE DE MANEJO DE ERRORES
 # ===============================================
@@ -56,7 +107,7 @@ app.add_middleware(
 async def sqlalchemy_exception_handler(request: Request, exc: SQLAlchemyError):
     """Manejo global de errores de SQLAlchemy"""
     error_msg = str(exc)
-    print(f"❌ SQLAlchemy Error en {request.url}: {error_msg}")
+    logger.error("Error de SQLAlchemy en %s: %s", request.url.path, error_msg)
     
     # Retornar error genérico para no exponer detalles internos
     return JSONResponse(
@@ -71,7 +122,7 @@ async def sqlalchemy_exception_handler(request: Request, exc: SQLAlchemyError):
 async def general_exception_handler(request: Request, exc: Exception):
     """Manejo global de errores generales"""
     error_msg = str(exc)
-    print(f"❌ Error general en {request.url}: {error_msg}")
+    logger.exception("Error general en %s: %s", request.url.path, error_msg, exc_info=exc)
     
     return JSONResponse(
         status_code=500,
@@ -103,6 +154,53 @@ app.include_router(gemini.router, prefix="/api", tags=["🤖 AI Risk Analysis"])
 # Archivos
 app.include_router(files.router, prefix="/api/files", tags=["📁 File Processing"])
 
+# ===============================================
+# BACKEND DE BASE DE DATOS
+# ===============================================
+
+@app.on_event("startup")
+async def select_database_backend():
+    # En modo "auto" la elección prueba MySQL con una conexión bloqueante (hasta
+    # DB_PROBE_TIMEOUT): se hace una vez aquí, fuera del event loop, y no en la
+    # primera petición que abre una sesión asíncrona
+    await run_in_threadpool(select_database_url)
+
+# ===============================================
+# WORKERS DE PROCESAMIENTO DE ARCHIVOS
+# ===============================================
+
+@app.on_event("startup")
+def start_file_workers():
+    file_worker_pool.start()
+
+@app.on_event("startup")
+def start_audit_writer():
+    audit_sink.start()
+
+@app.on_event("startup")
+def start_rescoring_scheduler():
+    rescoring_scheduler.start()
+
+@app.on_event("shutdown")
+def stop_file_workers():
+    file_worker_pool.stop()
+
+@app.on_event("shutdown")
+def stop_password_pool():
+    password_service.shutdown()
+
+@app.on_event("shutdown")
+def stop_audit_writer():
+    audit_sink.stop()
+
+@app.on_event("shutdown")
+def stop_rescoring_scheduler():
+    rescoring_scheduler.stop()
+
+@app.on_event("shutdown")
+def stop_logging():
+    shutdown_logging()
+
 # ===============================================
 # ENDPOINTS DE SALUD Y INFORMACIÓN
 # ===============================================
@@ -117,6 +215,13 @@ async def health_check():
         "message": "MIRIESGO v2 Backend funcionando en modo de desarrollo"
     }
 
+@app.get("/api/metrics", tags=["🏥 Health Check"], response_class=PlainTextResponse, include_in_schema=settings.METRICS_ENABLED)
+async def metrics_endpoint():
+    """Métricas del proceso en formato de texto de Prometheus"""
+    if not settings.METRICS_ENABLED:
+        return PlainTextResponse("Métricas deshabilitadas\n", status_code=404)
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/api/info", tags=["ℹ️ System Info"])
 async def system_info():
     """Información del sistema y configuración"""
@@ -135,5 +240,5 @@ async def system_info():
 
 if __name__ == "__main__":
     import uvicorn
-    print("🌐 Iniciando servidor...")
+    logger.info("Iniciando servidor")
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,257 @@
+"""
+Métricas de la API - MIRIESGO v2
+Latencia por ruta, SQL por petición y espera del pool, en formato de texto de Prometheus.
+Los valores son por proceso: con varios workers cada uno expone los suyos.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import event
+
+# Cubetas (segundos) para latencias HTTP y SQL
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Cubetas para número de sentencias SQL por petición
+STATEMENT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250, 1000)
+
+# ===============================================
+# PRIMITIVAS
+# ===============================================
+
+class Histogram:
+    """Histograma acumulado al estilo Prometheus (la última cubeta es +Inf)"""
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricFamily:
+    """Conjunto de series de una métrica, una por combinación de etiquetas"""
+
+    def __init__(self, name: str, kind: str, help_text: str, label_names: Tuple[str, ...] = (),
+                 buckets: Optional[Tuple[float, ...]] = None):
+        self.name = name
+        self.kind = kind
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self.series: Dict[Tuple[str, ...], object] = {}
+
+    def _labels(self, labels: Tuple[str, ...], extra: str = "") -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, labels)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} {self.kind}"
+        for labels, value in sorted(self.series.items()):
+            if self.kind == "histogram":
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), value.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    le_label = f'le="{le}"'
+                    yield f"{self.name}_bucket{self._labels(labels, le_label)} {cumulative}"
+                yield f"{self.name}_sum{self._labels(labels)} {value.sum}"
+                yield f"{self.name}_count{self._labels(labels)} {value.count}"
+            else:
+                yield f"{self.name}{self._labels(labels)} {value}"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+# ===============================================
+# REGISTRO
+# ===============================================
+
+class MetricsRegistry:
+    """Registro de métricas del proceso, seguro entre hilos"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._families: Dict[str, MetricFamily] = {}
+        self._gauges: Dict[str, tuple] = {}
+
+    def _family(self, name, kind, help_text, label_names, buckets=None) -> MetricFamily:
+        family = self._families.get(name)
+        if family is None:
+            family = self._families[name] = MetricFamily(name, kind, help_text, label_names, buckets)
+        return family
+
+    def inc(self, name: str, help_text: str, labels: Dict[str, str] = None, amount: float = 1):
+        labels = labels or {}
+        with self._lock:
+            family = self._family(name, "counter", help_text, tuple(labels))
+            key = tuple(labels.values())
+            family.series[key] = family.series.get(key, 0) + amount
+
+    def observe(self, name: str, help_text: str, value: float, labels: Dict[str, str] = None,
+                buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        labels = labels or {}
+        with self._lock:
+            family = self._family(name, "histogram", help_text, tuple(labels), buckets)
+            key = tuple(labels.values())
+            histogram = family.series.get(key)
+            if histogram is None:
+                histogram = family.series[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def register_gauge(self, name: str, help_text: str, callback, labels: Dict[str, str] = None):
+        """Gauge calculado al momento de exportar (p. ej. estado del pool)"""
+        _, series = self._gauges.setdefault(name, (help_text, []))
+        series.append((labels or {}, callback))
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for family in self._families.values():
+                lines.extend(family.render())
+        for name, (help_text, series) in self._gauges.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            for labels, callback in series:
+                try:
+                    value = callback()
+                except Exception:
+                    continue
+                label_text = ",".join(f'{key}="{_escape(val)}"' for key, val in labels.items())
+                lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+# ===============================================
+# SQL POR PETICIÓN
+# ===============================================
+
+class RequestSQLStats:
+    """Sentencias y tiempo SQL acumulados durante una petición"""
+    __slots__ = ("statements", "seconds")
+
+    def __init__(self):
+        self.statements = 0
+        self.seconds = 0.0
+
+# El objeto se comparte con el threadpool de las rutas síncronas porque anyio
+# copia el contexto y la copia apunta a la misma instancia
+_request_sql: ContextVar[Optional[RequestSQLStats]] = ContextVar("request_sql", default=None)
+
+def current_request_sql() -> Optional[RequestSQLStats]:
+    return _request_sql.get()
+
+class TimedPoolMixin:
+    """
+    Mide en connect() la espera por una conexión del pool (incluye abrir una nueva si
+    hace falta). SQLAlchemy no tiene un evento previo al checkout, así que se usa una
+    subclase del pool, que recreate() conserva al descartar las conexiones.
+    """
+
+    metrics_label = "sync"
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            registry.observe(
+                "db_pool_checkout_wait_seconds",
+                "Espera para obtener una conexión del pool",
+                time.perf_counter() - start,
+                {"engine": self.metrics_label}
+            )
+
+def timed_pool_class(base: type, label: str = "sync") -> type:
+    """Subclase de base para poolclass (database.use_pool_class / use_async_pool_class)"""
+    return type(f"Timed{base.__name__}", (TimedPoolMixin, base), {"metrics_label": label})
+
+def instrument_engine(engine, label: str = "sync"):
+    """
+    Registrar eventos del engine: sentencias, tiempo SQL y estado del pool.
+    Para el engine asíncrono se pasa su sync_engine; label distingue las series de cada uno.
+    """
+    engine_labels = {"engine": label}
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        registry.inc("db_statements_total", "Sentencias SQL ejecutadas", engine_labels)
+        registry.observe("db_statement_duration_seconds", "Duración de las sentencias SQL", elapsed, engine_labels)
+        stats = _request_sql.get()
+        if stats is not None:
+            stats.statements += 1
+            stats.seconds += elapsed
+
+    # La espera por conexión la mide la clase de pool (ver timed_pool_class). Los gauges
+    # leen engine.pool en cada lectura: dispose() reemplaza la instancia del pool
+    pool = engine.pool
+    if hasattr(pool, "checkedout"):
+        registry.register_gauge("db_pool_checked_out", "Conexiones del pool en uso",
+                                lambda: engine.pool.checkedout(), engine_labels)
+    if hasattr(pool, "size"):
+        registry.register_gauge("db_pool_size", "Tamaño configurado del pool",
+                                lambda: engine.pool.size(), engine_labels)
+
+# ===============================================
+# MIDDLEWARE
+# ===============================================
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI que mide latencia y SQL por ruta. Usa la plantilla de la ruta
+    (p. ej. /api/reports/{identifier}) para no crear una serie por cada valor.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestSQLStats()
+        token = _request_sql.set(stats)
+        status_code = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            _request_sql.reset(token)
+            route = scope.get("route")
+            labels = {"method": scope["method"], "route": getattr(route, "path", "unmatched")}
+
+            registry.inc("http_requests_total", "Peticiones HTTP atendidas",
+                         {**labels, "status": str(status_code)})
+            registry.observe("http_request_duration_seconds", "Latencia de las peticiones HTTP",
+                             elapsed, labels)
+            registry.observe("http_request_sql_statements", "Sentencias SQL por petición",
+                             stats.statements, labels, buckets=STATEMENT_BUCKETS)
+            registry.observe("http_request_sql_seconds", "Tiempo SQL por petición",
+                             stats.seconds, labels)
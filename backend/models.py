@@ -1,6 +1,6 @@
 from sqlalchemy import (
     Boolean, Column, ForeignKey, Integer, String, Date, DECIMAL, 
-    TIMESTAMP, Enum, Text
+    TIMESTAMP, Enum, Text, Index
 )
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
@@ -42,6 +42,12 @@ class User(Base):
 
 class Client(Base):
     __tablename__ = "clients"
+    __table_args__ = (
+        # Soporta la paginación por llave (full_name, id) del listado de clientes
+        Index("idx_clients_full_name_id", "full_name", "id"),
+        # Clientes cuyas marcas cambiaron desde la última corrida del recálculo de puntajes
+        Index("idx_clients_updated_at", "updated_at"),
+    )
     id = Column(Integer, primary_key=True, index=True, autoincrement=True, unique=True)
     national_identifier = Column(String(20), nullable=False, unique=True, index=True)
     full_name = Column(String(255), nullable=False)
@@ -63,8 +69,28 @@ class ClientDataHistory(Base):
     
     client = relationship("Client", back_populates="data_history")
 
+# Sirve las lecturas "últimos N por tipo" sin ordenar todo el historial
+Index(
+    "idx_client_data_history_latest",
+    ClientDataHistory.client_id,
+    ClientDataHistory.data_type,
+    ClientDataHistory.date_modified.desc()
+)
+
+class ClientCurrentContact(Base):
+    """Proyección del valor vigente de cada tipo de dato de contacto del cliente"""
+    __tablename__ = "client_current_contacts"
+    client_id = Column(Integer, ForeignKey("clients.id"), primary_key=True)
+    data_type = Column(Enum("address", "phone", "email"), primary_key=True)
+    value = Column(String(255), nullable=False)
+    date_modified = Column(TIMESTAMP, server_default=func.now())
+
 class ClientFlag(Base):
     __tablename__ = "client_flags"
+    __table_args__ = (
+        # Marcas agregadas desde la última corrida del recálculo de puntajes
+        Index("idx_client_flags_created_at", "created_at"),
+    )
     id = Column(Integer, primary_key=True, autoincrement=True, unique=True)
     client_id = Column(Integer, ForeignKey("clients.id"), nullable=False)
     flag = Column(String(50), nullable=False)
@@ -74,9 +100,15 @@ class ClientFlag(Base):
 
 class Loan(Base):
     __tablename__ = "loans"
+    __table_args__ = (
+        # Clientes con préstamos modificados desde la última corrida del recálculo de puntajes
+        Index("idx_loans_updated_at", "updated_at"),
+    )
     id = Column(Integer, primary_key=True, index=True, autoincrement=True, unique=True)
     client_id = Column(Integer, ForeignKey("clients.id"), nullable=False)
     company_id = Column(Integer, ForeignKey("companies.id"), nullable=False)
+    # Número del préstamo en los archivos de ancho fijo; llave del upsert de la ingesta
+    loan_number = Column(String(50), unique=True, nullable=True)
     origination_date = Column(Date, nullable=False)
     original_amount = Column(DECIMAL(15, 2), nullable=False)
     current_balance = Column(DECIMAL(15, 2), nullable=False)
@@ -84,6 +116,7 @@ class Loan(Base):
     modality = Column(Enum('Diario', 'Semanal', 'Quincenal', 'Mensual', 'Anual'), nullable=False)
     interest_rate = Column(DECIMAL(5, 2), nullable=False)
     installments = Column(Integer, nullable=False)
+    days_late = Column(Integer, default=0)
     last_report_date = Column(Date, nullable=False)
     created_at = Column(TIMESTAMP, server_default=func.now())
     updated_at = Column(TIMESTAMP, server_default=func.now(), onupdate=func.now())
@@ -94,6 +127,9 @@ class Loan(Base):
 
 class Payment(Base):
     __tablename__ = "payments"
+    __table_args__ = (
+        Index("idx_payments_updated_at", "updated_at"),
+    )
     id = Column(Integer, primary_key=True, autoincrement=True, unique=True)
     loan_id = Column(Integer, ForeignKey("loans.id"), nullable=False)
     installment_number = Column(Integer, nullable=False)
@@ -105,4 +141,18 @@ class Payment(Base):
     created_at = Column(TIMESTAMP, server_default=func.now())
     updated_at = Column(TIMESTAMP, server_default=func.now(), onupdate=func.now())
     
-    loan = relationship("Loan", back_populates="payments")
\ No newline at end of file
+    loan = relationship("Loan", back_populates="payments")
+
+class CompanyPortfolioStats(Base):
+    """Agregados precalculados de cartera por empresa; company_id = 0 es el consolidado general"""
+    __tablename__ = "company_portfolio_stats"
+    company_id = Column(Integer, primary_key=True, autoincrement=False)
+    total_clients = Column(Integer, nullable=False, default=0)
+    active_clients_up_to_date = Column(Integer, nullable=False, default=0)
+    clients_with_arrears = Column(Integer, nullable=False, default=0)
+    clients_in_legal = Column(Integer, nullable=False, default=0)
+    mora_1_30 = Column(Integer, nullable=False, default=0)
+    mora_31_60 = Column(Integer, nullable=False, default=0)
+    mora_61_90 = Column(Integer, nullable=False, default=0)
+    mora_91_plus = Column(Integer, nullable=False, default=0)
+    updated_at = Column(TIMESTAMP, server_default=func.now(), onupdate=func.now())
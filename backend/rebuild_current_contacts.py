@@ -0,0 +1,23 @@
+"""
+Script para reconstruir la proyección de datos de contacto vigentes
+(tabla client_current_contacts) a partir de client_data_history.
+"""
+from database import SessionLocal, engine
+import models, crud
+
+def main():
+    models.ClientCurrentContact.__table__.create(bind=engine, checkfirst=True)
+
+    db = SessionLocal()
+    try:
+        crud.rebuild_current_contacts(db)
+        total = db.query(models.ClientCurrentContact).count()
+        print(f"✅ Proyección reconstruida: {total} datos de contacto vigentes")
+    except Exception as e:
+        db.rollback()
+        print(f"❌ Error reconstruyendo la proyección: {e}")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+"""
+Script para reconstruir los agregados de cartera del dashboard
+(tabla company_portfolio_stats) a partir de la tabla de préstamos.
+"""
+from database import SessionLocal, engine
+import models, crud
+
+def main():
+    models.CompanyPortfolioStats.__table__.create(bind=engine, checkfirst=True)
+
+    db = SessionLocal()
+    try:
+        crud.rebuild_portfolio_stats(db)
+        general = db.get(models.CompanyPortfolioStats, crud.GENERAL_STATS_ID)
+        companies = db.query(models.CompanyPortfolioStats).count() - 1
+        print(f"✅ Agregados reconstruidos: {companies} empresas, {general.total_clients} clientes")
+    except Exception as e:
+        db.rollback()
+        print(f"❌ Error reconstruyendo agregados: {e}")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
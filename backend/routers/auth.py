@@ -5,18 +5,28 @@ Manejo de login, logout y verificación de tokens con base de datos MySQL
 
 import sys
 import os
+import hashlib
+import hmac
+import logging
+import uuid
 from datetime import datetime, timedelta
 from typing import Optional
 from fastapi import APIRouter, Depends, HTTPException, status, Request
 from fastapi.security import OAuth2PasswordRequestForm, HTTPBearer, HTTPAuthorizationCredentials
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from passlib.context import CryptContext
 from jose import JWTError, jwt
 
 # Agregar path para importar database
 sys.path.append(os.path.dirname(os.path.abspath(__file__)) + '/../..')
 
-from database import get_db, User, Company, Session as UserSession, AuditLog, UserRole
+from database import get_db, get_async_db, User, Company, Session as UserSession, AuditLog, UserRole
+from cache import identity_cache, invalidate_identity
+from config import settings
+from services.audit_service import audit_sink
+from sql_budget import sql_budget
+from services.password_service import hash_password, verify_password, verify_password_async
 
 # ===============================================
 # CONFIGURACIÓN
@@ -24,7 +34,7 @@ from database import get_db, User, Company, Session as UserSession, AuditLog, Us
 
 router = APIRouter()
 security = HTTPBearer(auto_error=False)
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+logger = logging.getLogger("miriesgo.auth")
 
 # Configuración JWT
 SECRET_KEY = "miriesgo_v2_secret_key_change_in_production_2024"
@@ -60,14 +70,6 @@ class LoginRequest(BaseModel):
 # FUNCIONES AUXILIARES
 # ===============================================
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Verificar contraseña"""
-    return pwd_context.verify(plain_password, hashed_password)
-
-def hash_password(password: str) -> str:
-    """Cifrar contraseña"""
-    return pwd_context.hash(password)
-
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Crear token JWT"""
     to_encode = data.copy()
@@ -76,21 +78,30 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     else:
         expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     
-    to_encode.update({"exp": expire})
+    # jti hace único cada token aunque se emitan dos en el mismo segundo
+    to_encode.update({"exp": expire, "jti": uuid.uuid4().hex})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def create_user_session(db: Session, user_id: int, token: str, request: Request) -> UserSession:
+def token_digest(token: str) -> str:
+    """
+    Digest HMAC-SHA256 del token de sesión.
+    A diferencia de bcrypt es determinista, así que la sesión se busca por
+    sessions.token_hash (índice único) con una sola consulta puntual.
+    """
+    return hmac.new(settings.SESSION_TOKEN_KEY.encode(), token.encode(), hashlib.sha256).hexdigest()
+
+async def create_user_session(db: AsyncSession, user_id: int, token: str, request: Request) -> UserSession:
     """Crear sesión de usuario"""
     # Cerrar sesiones anteriores del usuario
-    db.query(UserSession).filter(UserSession.user_id == user_id).update({
-        "is_active": False
-    })
+    await db.execute(
+        update(UserSession).where(UserSession.user_id == user_id).values(is_active=False)
+    )
     
     # Crear nueva sesión
     session = UserSession(
         user_id=user_id,
-        token_hash=hash_password(token),  # Hash del token para seguridad
+        token_hash=token_digest(token),  # Digest del token para buscar la sesión
         ip_address=request.client.host if request.client else None,
         user_agent=request.headers.get("user-agent"),
         expires_at=datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES),
@@ -99,38 +110,34 @@ def create_user_session(db: Session, user_id: int, token: str, request: Request)
     )
     
     db.add(session)
-    db.commit()
+    await db.commit()
     return session
 
-def log_auth_action(db: Session, action: str, user_id: int, ip_address: str = None, 
-                   success: bool = True, details: str = None):
-    """Registrar acción de autenticación"""
-    try:
-        audit_log = AuditLog(
-            user_id=user_id if success else None,
-            action=action,
-            table_name="authentication",
-            record_id=user_id,
-            new_values={
-                "success": success,
-                "ip_address": ip_address,
-                "details": details,
-                "timestamp": datetime.utcnow().isoformat()
-            },
-            ip_address=ip_address,
-            created_user=f"auth_system"
-        )
-        db.add(audit_log)
-        db.commit()
-    except Exception as e:
-        print(f"Error logging auth action: {e}")
+async def log_auth_action(db: Session, action: str, user_id: int, ip_address: str = None, 
+                   success: bool = True, details: str = None, critical: bool = False):
+    """Registrar acción de autenticación (en el buffer de auditoría, sin commit propio)"""
+    await audit_sink.record_async(
+        user_id=user_id if success else None,
+        action=action,
+        table_name="authentication",
+        record_id=user_id,
+        new_values={
+            "success": success,
+            "ip_address": ip_address,
+            "details": details,
+            "timestamp": datetime.utcnow().isoformat()
+        },
+        ip_address=ip_address,
+        created_user=f"auth_system",
+        critical=critical
+    )
 
 # ===============================================
 # DEPENDENCIAS
 # ===============================================
 
-def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security), 
-                    db: Session = Depends(get_db)) -> dict:
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security), 
+                          db: AsyncSession = Depends(get_async_db)) -> dict:
     """Obtener usuario actual desde token JWT"""
     if not credentials:
         raise HTTPException(
@@ -155,40 +162,68 @@ def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(securit
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    # Buscar usuario en base de datos
-    user = db.query(User).filter(User.email == email).first()
-    if user is None:
+    # Una sola consulta puntual por sessions.token_hash: si la identidad está en
+    # caché solo se lee la sesión; si no, la sesión junto con su usuario
+    token_hash = token_digest(credentials.credentials)
+    cached = identity_cache.get(("v2", email))
+    if cached is not None:
+        identity, locked_until = cached
+        session = (await db.execute(
+            select(UserSession).where(UserSession.token_hash == token_hash)
+        )).scalar_one_or_none()
+    else:
+        row = (await db.execute(
+            select(UserSession, User)
+            .join(User, User.id == UserSession.user_id)
+            .where(UserSession.token_hash == token_hash)
+        )).first()
+        session, user = row if row else (None, None)
+        if user is not None:
+            identity = {
+                "user_id": user.id,
+                "email": user.email,
+                "full_name": user.full_name,
+                "role": user.role.value,
+                "company_id": user.company_id,
+                "is_active": user.is_active
+            }
+            locked_until = user.locked_until
+            identity_cache.set(("v2", user.email), (identity, locked_until))
+
+    # Verificar que la sesión exista, no haya sido revocada y no haya expirado
+    now = datetime.utcnow()
+    if session is None or not session.is_active or session.expires_at <= now:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Usuario no encontrado",
+            detail="Sesión inválida, cerrada o expirada",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
     # Verificar que el usuario esté activo
-    if not user.is_active:
+    if not identity["is_active"]:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Usuario inactivo",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    # Verificar si la cuenta está bloqueada
-    if user.locked_until and user.locked_until > datetime.utcnow():
+    # Verificar si la cuenta está bloqueada (se evalúa siempre porque depende de la hora)
+    if locked_until and locked_until > now:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Cuenta temporalmente bloqueada",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
+    # Registrar actividad como máximo una vez por intervalo para no escribir en cada petición
+    if not session.last_activity or (now - session.last_activity).total_seconds() >= settings.SESSION_ACTIVITY_UPDATE_SECONDS:
+        await db.execute(
+            update(UserSession).where(UserSession.id == session.id).values(last_activity=now)
+        )
+        await db.commit()
+    
     # Retornar datos del usuario
-    return {
-        "user_id": user.id,
-        "email": user.email,
-        "full_name": user.full_name,
-        "role": user.role.value,
-        "company_id": user.company_id,
-        "is_active": user.is_active
-    }
+    return {**identity, "session_id": session.id}
 
 # ===============================================
 # ENDPOINTS
@@ -198,19 +233,21 @@ def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(securit
 async def login(
     request: Request,
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Endpoint de login con email y contraseña
     """
     try:
-        print(f"🔑 Intento de login para: {form_data.username}")
+        logger.debug("Intento de login", extra={"email": form_data.username})
         
         # Buscar usuario por email
-        user = db.query(User).filter(User.email == form_data.username).first()
+        user = (await db.execute(
+            select(User).where(User.email == form_data.username)
+        )).scalar_one_or_none()
         
         if not user:
-            log_auth_action(db, "LOGIN_FAILED", None, request.client.host if request.client else None, 
+            await log_auth_action(db, "LOGIN_FAILED", None, request.client.host if request.client else None, 
                           False, "Usuario no encontrado")
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
@@ -220,7 +257,7 @@ async def login(
         
         # Verificar que el usuario esté activo
         if not user.is_active:
-            log_auth_action(db, "LOGIN_FAILED", user.id, request.client.host if request.client else None, 
+            await log_auth_action(db, "LOGIN_FAILED", user.id, request.client.host if request.client else None, 
                           False, "Usuario inactivo")
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
@@ -229,7 +266,7 @@ async def login(
         
         # Verificar si la cuenta está bloqueada
         if user.locked_until and user.locked_until > datetime.utcnow():
-            log_auth_action(db, "LOGIN_FAILED", user.id, request.client.host if request.client else None, 
+            await log_auth_action(db, "LOGIN_FAILED", user.id, request.client.host if request.client else None, 
                           False, "Cuenta bloqueada")
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
@@ -237,23 +274,24 @@ async def login(
             )
         
         # Verificar contraseña
-        if not verify_password(form_data.password, user.password_hash):
+        if not await verify_password_async(form_data.password, user.password_hash):
             # Incrementar intentos fallidos
             user.login_attempts += 1
             
             # Bloquear cuenta después de 5 intentos fallidos
             if user.login_attempts >= 5:
                 user.locked_until = datetime.utcnow() + timedelta(minutes=30)
-                db.commit()
-                log_auth_action(db, "ACCOUNT_LOCKED", user.id, request.client.host if request.client else None, 
-                              False, "Demasiados intentos fallidos")
+                await db.commit()
+                invalidate_identity(user.email)
+                await log_auth_action(db, "ACCOUNT_LOCKED", user.id, request.client.host if request.client else None, 
+                              False, "Demasiados intentos fallidos", critical=True)
                 raise HTTPException(
                     status_code=status.HTTP_401_UNAUTHORIZED,
                     detail="Cuenta bloqueada por demasiados intentos fallidos"
                 )
             
-            db.commit()
-            log_auth_action(db, "LOGIN_FAILED", user.id, request.client.host if request.client else None, 
+            await db.commit()
+            await log_auth_action(db, "LOGIN_FAILED", user.id, request.client.host if request.client else None, 
                           False, "Contraseña incorrecta")
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
@@ -274,22 +312,20 @@ async def login(
         )
         
         # Crear sesión de usuario
-        create_user_session(db, user.id, access_token, request)
+        await create_user_session(db, user.id, access_token, request)
         
         # Obtener información de la empresa si aplica
         company_name = None
         if user.company_id:
-            company = db.query(Company).filter(Company.id == user.company_id).first()
+            company = await db.get(Company, user.company_id)
             if company:
                 company_name = company.name
         
-        db.commit()
-        
         # Log de login exitoso
-        log_auth_action(db, "LOGIN_SUCCESS", user.id, request.client.host if request.client else None, 
+        await log_auth_action(db, "LOGIN_SUCCESS", user.id, request.client.host if request.client else None, 
                        True, "Login exitoso")
         
-        print(f"✅ Login exitoso para: {user.email}")
+        logger.info("Login exitoso", extra={"user_id": user.id})
         
         return TokenResponse(
             access_token=access_token,
@@ -309,7 +345,7 @@ async def login(
     except HTTPException:
         raise
     except Exception as e:
-        print(f"❌ Error en login: {e}")
+        logger.exception("Error en login")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Error interno del servidor"
@@ -319,45 +355,45 @@ async def login(
 async def logout(
     request: Request,
     current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Endpoint de logout - cerrar sesión actual
     """
     try:
-        # Cerrar todas las sesiones activas del usuario
-        db.query(UserSession).filter(
-            UserSession.user_id == current_user["user_id"]
-        ).update({"is_active": False})
-        
-        db.commit()
+        # Cerrar solo la sesión de este token
+        await db.execute(
+            update(UserSession).where(UserSession.id == current_user["session_id"]).values(is_active=False)
+        )
+        await db.commit()
         
         # Log de logout
-        log_auth_action(db, "LOGOUT", current_user["user_id"], 
+        await log_auth_action(db, "LOGOUT", current_user["user_id"], 
                        request.client.host if request.client else None, True, "Logout exitoso")
         
-        print(f"🚪 Logout exitoso para: {current_user['email']}")
+        logger.info("Logout exitoso", extra={"user_id": current_user["user_id"]})
         
         return {"message": "Sesión cerrada exitosamente"}
         
     except Exception as e:
-        print(f"❌ Error en logout: {e}")
+        logger.exception("Error en logout")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Error cerrando sesión"
         )
 
 @router.get("/me", response_model=UserLoginResponse)
+@sql_budget(4)
 async def get_current_user_info(
     current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Obtener información del usuario actual
     """
     try:
         # Buscar usuario completo
-        user = db.query(User).filter(User.id == current_user["user_id"]).first()
+        user = await db.get(User, current_user["user_id"])
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -367,7 +403,7 @@ async def get_current_user_info(
         # Obtener información de la empresa
         company_name = None
         if user.company_id:
-            company = db.query(Company).filter(Company.id == user.company_id).first()
+            company = await db.get(Company, user.company_id)
             if company:
                 company_name = company.name
         
@@ -393,7 +429,7 @@ async def get_current_user_info(
 async def refresh_token(
     request: Request,
     current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Refrescar token de acceso
@@ -411,7 +447,7 @@ async def refresh_token(
         )
         
         # Actualizar sesión
-        create_user_session(db, current_user["user_id"], access_token, request)
+        await create_user_session(db, current_user["user_id"], access_token, request)
         
         return {
             "access_token": access_token,
@@ -428,17 +464,19 @@ async def refresh_token(
 @router.get("/sessions")
 async def get_user_sessions(
     current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Obtener sesiones activas del usuario actual
     """
     try:
-        sessions = db.query(UserSession).filter(
-            UserSession.user_id == current_user["user_id"],
-            UserSession.is_active == True,
-            UserSession.expires_at > datetime.utcnow()
-        ).all()
+        sessions = (await db.execute(
+            select(UserSession).where(
+                UserSession.user_id == current_user["user_id"],
+                UserSession.is_active == True,
+                UserSession.expires_at > datetime.utcnow()
+            )
+        )).scalars().all()
         
         return {
             "active_sessions": len(sessions),
@@ -1,49 +1,92 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Literal, Optional
+import base64
+import json
 
 import crud, schemas, auth, models
-from database import get_db
+from database import get_db, SessionLocal
+from sql_budget import sql_budget, separate_sql_budget
 
 router = APIRouter()
 
+# Tamaño de página por defecto y máximo del listado de clientes
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Sentencias por página: clientes, sus marcas y su historial de contacto.
+# El listado JSON suma la del usuario autenticado; el NDJSON presupuesta cada página
+PAGE_SQL_BUDGET = 3
+
+def encode_cursor(client: models.Client) -> str:
+    """Cursor opaco con la llave (full_name, id) del último cliente entregado"""
+    raw = json.dumps([client.full_name, client.id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        full_name, client_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return str(full_name), int(client_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor de paginación inválido")
+
+def stream_clients_ndjson(after: Optional[tuple], page_size: int, history_limit: Optional[int]):
+    """
+    Generador NDJSON que recorre todos los clientes página a página.
+    Usa su propia sesión porque la respuesta se sigue enviando después de
+    que FastAPI cierra las dependencias; solo una página vive en memoria.
+    """
+    db = SessionLocal()
+    try:
+        while True:
+            # Cada página tiene su propio presupuesto SQL; el bloque no abarca el yield
+            with separate_sql_budget(PAGE_SQL_BUDGET, label="página NDJSON"):
+                page = crud.get_clients_page(db, limit=page_size, after=after)
+                history = crud.get_contact_history(db, [client.id for client in page], limit=history_limit)
+                lines = [crud.to_client_schema(client, history[client.id]).model_dump_json() + "\n" for client in page]
+            yield "".join(lines)
+            if len(page) < page_size:
+                return
+            after = (page[-1].full_name, page[-1].id)
+            db.expunge_all()
+    finally:
+        db.close()
+
 @router.get("/", response_model=List[schemas.ClientSchema])
+@sql_budget(PAGE_SQL_BUDGET + 1)
 def read_all_clients(
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, description="Valor de X-Next-Cursor de la página anterior"),
+    format: Literal["json", "ndjson"] = Query("json", description="'ndjson' transmite todos los clientes desde el cursor"),
+    history_limit: Optional[int] = Query(None, ge=1, description="Últimas N entradas de historial por tipo de dato"),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_active_user)
 ):
     """
-    Endpoint para obtener una lista de todos los clientes.
-    Requiere autenticación.
+    Endpoint para listar clientes ordenados por nombre, con paginación por cursor.
+    Si hay más resultados, el cursor de la siguiente página se envía en el
+    encabezado X-Next-Cursor. Con format=ndjson se transmiten todos los clientes
+    restantes, un JSON por línea. history_limit limita el historial de contacto
+    a las últimas N entradas de cada tipo. Requiere autenticación.
     """
-    clients_db = crud.get_all_clients(db)
-    
-    # Helper function to convert ClientDataHistory to HistoricEntry with proper dateModified
-    def to_historic_entry(history_item):
-        return schemas.HistoricEntry(
-            value=history_item.value,
-            dateModified=history_item.date_modified
+    after = decode_cursor(cursor) if cursor else None
+
+    if format == "ndjson":
+        return StreamingResponse(
+            stream_clients_ndjson(after, limit, history_limit),
+            media_type="application/x-ndjson"
         )
 
-    # Convertir cada cliente de la DB al esquema Pydantic
-    clients_schema = []
-    for client in clients_db:
-        addresses = sorted([h for h in client.data_history if h.data_type == 'address'], key=lambda x: x.date_modified, reverse=True)
-        phones = sorted([h for h in client.data_history if h.data_type == 'phone'], key=lambda x: x.date_modified, reverse=True)
-        emails = sorted([h for h in client.data_history if h.data_type == 'email'], key=lambda x: x.date_modified, reverse=True)
-        
-        clients_schema.append(schemas.ClientSchema(
-            id=client.id,
-            nationalIdentifier=client.national_identifier,
-            fullName=client.full_name,
-            birthDate=client.birth_date,
-            addresses=[to_historic_entry(a) for a in addresses],
-            phones=[to_historic_entry(p) for p in phones],
-            emails=[to_historic_entry(e) for e in emails],
-            flags=[f.flag for f in client.flags]
-        ))
-    
-    return clients_schema
+    # Se pide un registro extra para saber si existe una página siguiente
+    clients_db = crud.get_clients_page(db, limit=limit + 1, after=after)
+    if len(clients_db) > limit:
+        clients_db = clients_db[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(clients_db[-1])
+
+    history = crud.get_contact_history(db, [client.id for client in clients_db], limit=history_limit)
+    return [crud.to_client_schema(client, history[client.id]) for client in clients_db]
 
 
 @router.put("/{client_id}", response_model=schemas.ClientSchema)
@@ -62,27 +105,5 @@ def update_client_info(
     if not updated_client_db:
         raise HTTPException(status_code=404, detail="Cliente no encontrado")
         
-    # Recargar el cliente con sus relaciones para asegurar que la respuesta esté completa
-    db.refresh(updated_client_db)
-    
-    # Helper function to convert ClientDataHistory to HistoricEntry with proper dateModified
-    def to_historic_entry(history_item):
-        return schemas.HistoricEntry(
-            value=history_item.value,
-            dateModified=history_item.date_modified
-        )
-
-    addresses = sorted([h for h in updated_client_db.data_history if h.data_type == 'address'], key=lambda x: x.date_modified, reverse=True)
-    phones = sorted([h for h in updated_client_db.data_history if h.data_type == 'phone'], key=lambda x: x.date_modified, reverse=True)
-    emails = sorted([h for h in updated_client_db.data_history if h.data_type == 'email'], key=lambda x: x.date_modified, reverse=True)
-
-    return schemas.ClientSchema(
-        id=updated_client_db.id,
-        nationalIdentifier=updated_client_db.national_identifier,
-        fullName=updated_client_db.full_name,
-        birthDate=updated_client_db.birth_date,
-        addresses=[to_historic_entry(a) for a in addresses],
-        phones=[to_historic_entry(p) for p in phones],
-        emails=[to_historic_entry(e) for e in emails],
-        flags=[f.flag for f in updated_client_db.flags]
-    )
\ No newline at end of file
+    history = crud.get_contact_history(db, [updated_client_db.id])[updated_client_db.id]
+    return crud.to_client_schema(updated_client_db, history)
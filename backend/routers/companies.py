@@ -10,13 +10,16 @@ from typing import List, Optional
 from fastapi import APIRouter, Depends, HTTPException, status, Query
 from fastapi.security import HTTPBearer
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import and_, or_, select, func
 
 # Agregar path para importar database
 sys.path.append(os.path.dirname(os.path.abspath(__file__)) + '/../..')
 
-from database import get_db, Company, User, CompanyStatus, AuditLog
+from database import get_db, get_async_db, Company, User, CompanyStatus, AuditLog
 from .auth import get_current_user
+from services.audit_service import audit_sink
+from sql_budget import sql_budget
 
 # ===============================================
 # CONFIGURACIÓN
@@ -84,30 +87,27 @@ class CompaniesListResponse(BaseModel):
 # FUNCIONES AUXILIARES
 # ===============================================
 
-def log_company_action(db: Session, action: str, company_id: int, performed_by: str, 
-                      old_values=None, new_values=None):
-    """Registrar acción en logs de auditoría"""
-    try:
-        audit_log = AuditLog(
-            action=action,
-            table_name="companies",
-            record_id=company_id,
-            old_values=old_values,
-            new_values=new_values,
-            created_user=performed_by
-        )
-        db.add(audit_log)
-        db.commit()
-    except Exception as e:
-        print(f"Error logging action: {e}")
+async def log_company_action(db: Session, action: str, company_id: int, performed_by: str, 
+                      old_values=None, new_values=None, critical: bool = False):
+    """Registrar acción en logs de auditoría (en el buffer de auditoría, sin commit propio)"""
+    await audit_sink.record_async(
+        action=action,
+        table_name="companies",
+        record_id=company_id,
+        old_values=old_values,
+        new_values=new_values,
+        created_user=performed_by,
+        critical=critical
+    )
 
 # ===============================================
 # ENDPOINTS
 # ===============================================
 
 @router.get("/", response_model=CompaniesListResponse)
+@sql_budget(4)
 async def get_all_companies(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(get_current_user),
     page: int = Query(1, ge=1),
     size: int = Query(20, ge=1, le=100),
@@ -128,15 +128,15 @@ async def get_all_companies(
             )
 
         # Construir query base
-        query = db.query(Company)
+        query = select(Company)
         
         # Aplicar filtros
         if active_only:
-            query = query.filter(Company.status == CompanyStatus.active)
+            query = query.where(Company.status == CompanyStatus.active)
         
         if search:
             search_term = f"%{search}%"
-            query = query.filter(
+            query = query.where(
                 or_(
                     Company.name.ilike(search_term),
                     Company.nit.ilike(search_term),
@@ -145,14 +145,16 @@ async def get_all_companies(
             )
         
         if status_filter:
-            query = query.filter(Company.status == CompanyStatus(status_filter))
+            query = query.where(Company.status == CompanyStatus(status_filter))
 
         # Contar total
-        total = query.count()
+        total = (await db.execute(
+            select(func.count()).select_from(query.subquery())
+        )).scalar_one()
         
         # Aplicar paginación
         offset = (page - 1) * size
-        companies = query.offset(offset).limit(size).all()
+        companies = (await db.execute(query.offset(offset).limit(size))).scalars().all()
         
         # Calcular páginas
         pages = (total + size - 1) // size
@@ -261,7 +263,7 @@ async def create_company(
         db.refresh(new_company)
 
         # Log de auditoría
-        log_company_action(
+        await log_company_action(
             db, "CREATE_COMPANY", new_company.id, 
             current_user.get("email", "system"),
             new_values={"name": new_company.name, "nit": company_data.nit}
@@ -340,7 +342,7 @@ async def update_company(
             "status": company.status.value
         }
         
-        log_company_action(
+        await log_company_action(
             db, "UPDATE_COMPANY", company.id,
             current_user.get("email", "system"),
             old_values=old_values,
@@ -404,11 +406,12 @@ async def delete_company(
         db.commit()
 
         # Log de auditoría
-        log_company_action(
+        await log_company_action(
             db, "DELETE_COMPANY", company.id,
             current_user.get("email", "system"),
             old_values={"status": "active"},
-            new_values={"status": "inactive"}
+            new_values={"status": "inactive"},
+            critical=True
         )
 
         return {"message": "Empresa eliminada exitosamente"}
@@ -1,48 +1,59 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query
 from sqlalchemy.orm import Session
 import schemas, auth, models, crud
 from database import get_db
+from sql_budget import sql_budget
 
 router = APIRouter()
 
+def _mora_distribution(stats: dict) -> dict:
+    return {
+        "1-30": stats["mora_1_30"],
+        "31-60": stats["mora_31_60"],
+        "61-90": stats["mora_61_90"],
+        "91+": stats["mora_91_plus"],
+    }
+
 @router.get("", response_model=schemas.DashboardResponse)
+@sql_budget(8)
 def get_dashboard_data(
+    live: bool = Query(False, description="Calcular los agregados en línea en lugar de leer los precalculados"),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_active_user)
 ):
     """
     Endpoint para obtener los datos consolidados del dashboard.
-    Esta implementación obtiene datos reales de la base de datos.
+    Por defecto lee los agregados de company_portfolio_stats, que se mantienen
+    al escribir préstamos. Con live=true los calcula en una sola consulta agrupada.
     """
+    companies = crud.get_all_companies(db)
+    if live:
+        portfolio_stats = crud.compute_portfolio_breakdown(db, [company.id for company in companies])
+    else:
+        portfolio_stats = crud.get_portfolio_stats(db)
 
-    # --- Datos generales de la base de datos ---
-    total_clients = db.query(models.Client).count()
-    clients_with_arrears = db.query(models.Loan.client_id).filter(models.Loan.status.in_(['En Mora', 'Castigado'])).distinct().count()
-    clients_in_legal = db.query(models.Loan.client_id).filter(models.Loan.status.in_(['En Jurídica', 'Embargo'])).distinct().count()
-    active_clients_up_to_date = total_clients - clients_with_arrears - clients_in_legal
-
+    # --- Datos generales ---
+    general_stats = portfolio_stats[crud.GENERAL_STATS_ID]
     general_data = schemas.GeneralDashboardData(
-        total_clients=total_clients,
-        active_clients_up_to_date=active_clients_up_to_date,
-        clients_with_arrears=clients_with_arrears,
-        clients_in_legal=clients_in_legal,
-        mora_distribution={
-            "1-30": 120, "31-60": 75, "61-90": 40, "91+": 25
-        }
+        total_clients=general_stats["total_clients"],
+        active_clients_up_to_date=general_stats["active_clients_up_to_date"],
+        clients_with_arrears=general_stats["clients_with_arrears"],
+        clients_in_legal=general_stats["clients_in_legal"],
+        mora_distribution=_mora_distribution(general_stats)
     )
 
-    # --- Datos por empresa de la base de datos ---
-    all_companies = crud.get_all_companies(db)
+    # --- Datos por empresa ---
+    empty_stats = dict.fromkeys(crud.PORTFOLIO_STATS_FIELDS, 0)
     company_data = []
-    for company in all_companies:
-        company_clients = db.query(models.Loan.client_id).filter(models.Loan.company_id == company.id).distinct().count()
+    for company in companies:
+        company_stats = portfolio_stats.get(company.id, empty_stats)
         company_data.append(schemas.CompanyAnalyticsData(
             company=schemas.CompanySchema.from_orm(company),
-            total_clients=company_clients,
-            active_clients_up_to_date=int(company_clients * 0.8),
-            clients_with_arrears=int(company_clients * 0.15),
-            clients_in_legal=int(company_clients * 0.05),
-            mora_distribution={ "1-30": 30, "31-60": 15, "61-90": 8, "91+": 5 }
+            total_clients=company_stats["total_clients"],
+            active_clients_up_to_date=company_stats["active_clients_up_to_date"],
+            clients_with_arrears=company_stats["clients_with_arrears"],
+            clients_in_legal=company_stats["clients_in_legal"],
+            mora_distribution=_mora_distribution(company_stats)
         ))
 
-    return schemas.DashboardResponse(general=general_data, company=company_data)
\ No newline at end of file
+    return schemas.DashboardResponse(general=general_data, company=company_data)
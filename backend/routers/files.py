@@ -1,50 +1,124 @@
 from fastapi import APIRouter, Depends, UploadFile, File, HTTPException
+from sqlalchemy.orm import Session
 import schemas, auth, models
+from config import settings
+from database import get_db, FileUpload, FileUploadStatus
+from services import file_processor_service
 import os
-import shutil
+import uuid
 
 router = APIRouter()
 
-UPLOAD_DIRECTORY = "uploads"
+UPLOAD_DIRECTORY = settings.UPLOAD_DIRECTORY
+
+# Tamaño de los bloques con los que se copia el archivo a disco
+UPLOAD_CHUNK_SIZE = 1024 * 1024
 
 @router.post("/upload", response_model=schemas.ProcessResult)
-async def upload_file(
+def upload_file(
     file: UploadFile = File(...),
+    db: Session = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_active_user)
 ):
     """
-    Endpoint para cargar un archivo plano.
-    NOTA: Esta es una implementación SIMULADA. No procesa el archivo,
-    simplemente lo guarda y devuelve un resultado exitoso.
+    Endpoint para cargar un archivo plano de ancho fijo.
+    El archivo se copia a disco por bloques y se encola en file_uploads;
+    el progreso se consulta en GET /api/files/{upload_id}/status.
+    La ruta es síncrona: la copia y las consultas corren en el threadpool, no en el event loop.
     """
     if not file.filename.endswith(".txt"):
         raise HTTPException(status_code=400, detail="Formato de archivo no válido. Solo se aceptan archivos .txt.")
 
-    file_path = os.path.join(UPLOAD_DIRECTORY, file.filename)
+    stored_filename = f"{uuid.uuid4().hex}_{os.path.basename(file.filename)}"
+    file_path = os.path.join(UPLOAD_DIRECTORY, stored_filename)
 
     try:
+        file_size = 0
         with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+            while chunk := file.file.read(UPLOAD_CHUNK_SIZE):
+                buffer.write(chunk)
+                file_size += len(chunk)
     except Exception as e:
         return schemas.ProcessResult(
             status='error',
             message=f"No se pudo guardar el archivo: {str(e)}",
-            fileName=file.filename,
-            totalRecords=0, processedRecords=0, newClients=0, newLoans=0, updatedLoans=0,
+            file_name=file.filename,
+            total_records=0, processed_records=0, new_clients=0, new_loans=0, updated_loans=0,
             errors=[str(e)]
         )
     finally:
         file.file.close()
-    
-    # Simulación de un procesamiento exitoso
+
+    # La empresa la fija el registro de control; sin código se usa la del usuario.
+    # Solo un administrador puede cargar cartera de una empresa distinta a la suya
+    company_code, company_id = file_processor_service.resolve_company(db, file_path)
+    if company_code is not None and company_id is None:
+        os.remove(file_path)
+        raise HTTPException(status_code=400, detail=f"La empresa '{company_code}' del registro de control no existe.")
+    if company_code is None:
+        company_id = current_user.company_id
+    if company_id is None:
+        os.remove(file_path)
+        raise HTTPException(
+            status_code=400,
+            detail="No se pudo determinar la empresa del archivo. Verifique el código del registro de control."
+        )
+    if current_user.role != "admin" and company_id != current_user.company_id:
+        os.remove(file_path)
+        raise HTTPException(status_code=403, detail="No tiene permisos para cargar archivos de otra empresa")
+
+    upload = FileUpload(
+        user_id=current_user.id,
+        company_id=company_id,
+        original_filename=file.filename,
+        stored_filename=stored_filename,
+        file_path=file_path,
+        file_size=file_size,
+        file_type=file.content_type or "text/plain",
+        status=FileUploadStatus.uploaded,
+        created_user=current_user.email
+    )
+    db.add(upload)
+    db.commit()
+    db.refresh(upload)
+
+    # El archivo queda en la cola; los workers de services.job_queue lo procesan
     return schemas.ProcessResult(
         status='success',
-        message=f"Archivo '{file.filename}' recibido y guardado correctamente. El procesamiento en segundo plano ha comenzado.",
-        fileName=file.filename,
-        totalRecords=158,
-        processedRecords=158,
-        newClients=12,
-        newLoans=25,
-        updatedLoans=121,
+        message=f"Archivo '{file.filename}' recibido. El procesamiento en segundo plano ha comenzado.",
+        upload_id=upload.id,
+        file_name=file.filename,
+        total_records=0,
+        processed_records=0,
+        new_clients=0,
+        new_loans=0,
+        updated_loans=0,
         errors=[]
-    )
\ No newline at end of file
+    )
+
+@router.get("/{upload_id}/status", response_model=schemas.FileUploadStatusResponse)
+def get_upload_status(
+    upload_id: int,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_active_user)
+):
+    """
+    Consultar el estado y el progreso del procesamiento de un archivo.
+    """
+    upload = db.query(FileUpload).filter(FileUpload.id == upload_id).first()
+    if not upload:
+        raise HTTPException(status_code=404, detail="Archivo no encontrado")
+
+    if current_user.role != "admin" and upload.company_id != current_user.company_id:
+        raise HTTPException(status_code=403, detail="No tiene permisos para ver este archivo")
+
+    return schemas.FileUploadStatusResponse(
+        id=upload.id,
+        file_name=upload.original_filename,
+        status=upload.status.value,
+        processed_records=upload.processed_records or 0,
+        failed_records=upload.failed_records or 0,
+        error_details=upload.error_details,
+        created_at=upload.created_at,
+        updated_at=upload.updated_at
+    )
@@ -1,41 +1,37 @@
-import os
+import asyncio
 import json
+import hashlib
+import logging
+from typing import Dict, List, Tuple
 from fastapi import APIRouter, Depends, HTTPException
 import schemas, auth, models
+from cache import TTLCache, SingleFlight
 from config import settings
-from google.generativeai import GenerativeModel, configure
-import google.generativeai as genai
+from database import CreditReport, RiskLevel, get_async_sessionmaker
+from services import scorecard_service
+from services.gemini_client import GEMINI_MODEL, CircuitOpenError, get_gemini_client, parse_json_response
 
-# Configura la API de Google
-try:
-    # El nombre del SDK ha cambiado en versiones recientes.
-    genai.configure(api_key=settings.API_KEY)
-except Exception as e:
-    print(f"Error al configurar la API de Google: {e}")
-    # Esto no detendrá la aplicación, pero las llamadas a Gemini fallarán.
+logger = logging.getLogger("miriesgo.gemini")
 
-router = APIRouter()
+# Puntajes de Gemini por hash del reporte simplificado: reabrir el mismo reporte no vuelve
+# a llamar a la IA, y las peticiones idénticas simultáneas comparten una sola llamada
+risk_score_cache = TTLCache(maxsize=settings.RISK_SCORE_CACHE_MAX_ENTRIES, ttl=settings.RISK_SCORE_CACHE_TTL_SECONDS)
+_llm_calls = SingleFlight()
 
-@router.post("/risk-score", response_model=schemas.RiskScore)
-async def calculate_risk_score(
-    request: schemas.RiskScoreRequest,
-    current_user: models.User = Depends(auth.get_current_active_user)
-):
-    """
-    Calcula el puntaje de riesgo de un cliente utilizando la API de Google Gemini.
-    """
-    if not settings.API_KEY or "TU_CLAVE_DE_API" in settings.API_KEY:
-        raise HTTPException(status_code=500, detail="La API Key de Google Gemini no está configurada en el servidor.")
-        
-    try:
-        model = genai.GenerativeModel('gemini-1.5-flash-latest')
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"No se pudo inicializar el modelo de IA: {e}")
+# Evaluación del puntaje -> nivel de riesgo de credit_reports
+RISK_LEVELS = {
+    "Muy Bajo": RiskLevel.low,
+    "Bajo": RiskLevel.low,
+    "Medio": RiskLevel.medium,
+    "Alto": RiskLevel.high,
+    "Muy Alto": RiskLevel.critical,
+}
 
-    report_data = request.report
-    
-    # Simplificar el reporte para no exceder el límite de tokens
-    simplified_report = {
+router = APIRouter()
+
+def simplify_report(report_data: dict) -> dict:
+    """Simplificar el reporte para no exceder el límite de tokens"""
+    return {
         "client": {
             "birthDate": report_data.get("client", {}).get("birthDate"),
             "flags": report_data.get("client", {}).get("flags"),
@@ -50,8 +46,9 @@ async def calculate_risk_score(
             } for loan in report_data.get("loans", [])
         ]
     }
-    
-    prompt = f"""
+
+def build_prompt(simplified_report: dict) -> str:
+    return f"""
     Eres un experto analista de riesgo crediticio para una entidad financiera en Colombia.
     Tu tarea es analizar el siguiente reporte de crédito y generar un puntaje de riesgo y una evaluación.
     
@@ -76,18 +73,260 @@ async def calculate_risk_score(
     }}
     """
 
+def build_batch_prompt(items: List[Tuple[str, dict]]) -> str:
+    """Prompt de varios reportes: las instrucciones van una sola vez y cada reporte con su clave"""
+    reports = [{"key": key, "report": report} for key, report in items]
+    return f"""
+    Eres un experto analista de riesgo crediticio para una entidad financiera en Colombia.
+    Tu tarea es analizar cada uno de los siguientes reportes de crédito, de forma independiente, y generar para cada uno un puntaje de riesgo y una evaluación.
+    
+    El puntaje de riesgo debe estar en una escala de 300 a 850, donde:
+    - 300-579: Muy Malo (Riesgo Muy Alto)
+    - 580-669: Regular (Riesgo Alto)
+    - 670-739: Bueno (Riesgo Medio)
+    - 740-799: Muy Bueno (Riesgo Bajo)
+    - 800-850: Excepcional (Riesgo Muy Bajo)
+    
+    Considera los siguientes factores: historial de pago, nivel de endeudamiento actual vs. original, estado de los créditos (especialmente si hay 'Castigado', 'En Jurídica' o 'Fraude'), y la cantidad de créditos. Las banderas de 'Fraude' o 'Robo de identidad' deben impactar muy negativamente el puntaje.
+    
+    Analiza estos reportes (cada uno identificado por "key"):
+    {json.dumps(reports, ensure_ascii=False)}
+    
+    Devuelve tu respuesta ÚNICAMENTE en formato JSON, sin texto adicional antes o después del JSON.
+    El JSON debe ser un arreglo con un elemento por reporte, con la siguiente estructura exacta:
+    [
+      {{
+        "key": "<la clave del reporte, tal como aparece arriba>",
+        "score": <un número entero entre 300 y 850>,
+        "assessment": "<Una de estas opciones: 'Muy Bajo', 'Bajo', 'Medio', 'Alto', 'Muy Alto'>",
+        "reasoning": "<Una frase corta y concisa (máximo 15 palabras) que justifique el puntaje, ej: 'Excelente historial de pagos y bajo endeudamiento.'>"
+      }}
+    ]
+    """
+
+def estimate_tokens(text: str) -> int:
+    """Aproximación de ~4 caracteres por token, suficiente para empaquetar lotes"""
+    return len(text) // 4 + 1
+
+# Tokens fijos del prompt de lote (instrucciones) y de la respuesta por reporte
+BATCH_PROMPT_TOKENS = estimate_tokens(build_batch_prompt([]))
+BATCH_RESPONSE_TOKENS_PER_ITEM = 60
+
+def pack_batches(items: List[Tuple[str, dict]], token_budget: int, max_items: int) -> List[List[Tuple[str, dict]]]:
+    """
+    Agrupar los reportes en lotes que quepan en token_budget (prompt y respuesta
+    estimados) y no pasen de max_items. Un reporte que solo no cabe va en su propio lote.
+    """
+    batches, current, used = [], [], BATCH_PROMPT_TOKENS
+    for key, report in items:
+        cost = estimate_tokens(json.dumps({"key": key, "report": report}, ensure_ascii=False)) + BATCH_RESPONSE_TOKENS_PER_ITEM
+        if current and (used + cost > token_budget or len(current) >= max_items):
+            batches.append(current)
+            current, used = [], BATCH_PROMPT_TOKENS
+        current.append((key, report))
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+def report_key(simplified_report: dict) -> str:
+    """Hash canónico (claves ordenadas, sin espacios) del reporte simplificado y el modelo"""
+    canonical = json.dumps(simplified_report, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(f"{GEMINI_MODEL}\n{canonical}".encode()).hexdigest()
+
+def llm_configured() -> bool:
+    return settings.GEMINI_BACKEND != "gemini" or bool(settings.API_KEY and "TU_CLAVE_DE_API" not in settings.API_KEY)
+
+async def score_with_llm(simplified_report: dict) -> schemas.RiskScore:
+    """Puntaje de Gemini con el cliente compartido; los errores se reportan como HTTPException"""
+    if not llm_configured():
+        raise HTTPException(status_code=500, detail="La API Key de Google Gemini no está configurada en el servidor.")
+
+    try:
+        text = await get_gemini_client().generate(build_prompt(simplified_report))
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except TimeoutError:
+        raise HTTPException(status_code=504, detail="El servicio de IA no respondió a tiempo.")
+    except Exception as e:
+        logger.error("Error llamando a la API de Gemini: %s", e)
+        raise HTTPException(status_code=503, detail=f"Error al comunicarse con el servicio de IA: {str(e)}")
+
     try:
-        response = model.generate_content(prompt)
-        
-        # Limpiar la respuesta para obtener solo el JSON
-        json_text = response.text.strip().replace('```json', '').replace('```', '')
-        
-        result = json.loads(json_text)
-        
-        return schemas.RiskScore(**result)
-
-    except json.JSONDecodeError:
+        return schemas.RiskScore(**parse_json_response(text))
+    except (json.JSONDecodeError, TypeError, ValueError):
         raise HTTPException(status_code=500, detail="La respuesta de la IA no fue un JSON válido.")
+
+async def score_batch_with_llm(items: List[Tuple[str, dict]]) -> Dict[str, schemas.RiskScore]:
+    """
+    Puntajes de Gemini para un lote de reportes (clave, reporte simplificado) en una sola
+    llamada. Las claves que faltan en la respuesta o llegan inválidas, y los lotes cuya
+    llamada falla, se reintentan partiendo el lote en dos; lo que no se logra puntuar
+    (un reporte solo que falla, o el circuit breaker abierto) no aparece en el resultado.
+    """
+    # Claves cortas en el prompt: los hashes de contenido gastarían tokens
+    keys = {f"r{index}": key for index, (key, _) in enumerate(items)}
+    scores: Dict[str, schemas.RiskScore] = {}
+    try:
+        text = await get_gemini_client().generate(
+            build_batch_prompt([(short, report) for short, (_, report) in zip(keys, items)])
+        )
+        entries = parse_json_response(text)
+        for entry in entries if isinstance(entries, list) else []:
+            if not isinstance(entry, dict) or entry.get("key") not in keys:
+                continue
+            try:
+                scores[keys[entry["key"]]] = schemas.RiskScore(
+                    score=entry.get("score"), assessment=entry.get("assessment"), reasoning=entry.get("reasoning")
+                )
+            except (TypeError, ValueError):
+                continue
+    except CircuitOpenError:
+        return scores
     except Exception as e:
-        print(f"Error llamando a la API de Gemini: {e}")
-        raise HTTPException(status_code=503, detail=f"Error al comunicarse con el servicio de IA: {str(e)}")
\ No newline at end of file
+        logger.warning("Error en el lote de %d reporte(s) para Gemini: %r", len(items), e)
+
+    missing = [item for item in items if item[0] not in scores]
+    if missing and len(items) > 1:
+        if len(missing) < len(items):
+            logger.info("Gemini omitió %d de %d reporte(s) del lote; se reintentan", len(missing), len(items))
+        half = (len(missing) + 1) // 2
+        parts = [missing[:half], missing[half:]] if len(missing) > 1 else [missing]
+        for part_scores in await asyncio.gather(*(score_batch_with_llm(part) for part in parts)):
+            scores.update(part_scores)
+    return scores
+
+async def persist_risk_scores(entries: List[Tuple[dict, schemas.RiskScore, str]], user: models.User):
+    """
+    Guardar los puntajes calculados con la IA en credit_reports (una fila por reporte
+    puntuado por Gemini, no por consulta) en una sola transacción. Se omiten los reportes
+    sin id del cliente, y todos si el usuario no pertenece a una empresa; un error al
+    guardar no afecta la respuesta.
+    """
+    if user.company_id is None:
+        return
+    rows = []
+    for report_data, score, key in entries:
+        client_id = (report_data.get("client") or {}).get("id")
+        if not isinstance(client_id, int):
+            continue
+        summary = report_data.get("debtSummary") or {}
+        rows.append(CreditReport(
+            client_id=client_id,
+            requested_by_user_id=user.id,
+            requested_by_company_id=user.company_id,
+            credit_score=score.score,
+            risk_level=RISK_LEVELS.get(score.assessment),
+            total_active_loans=summary.get("activeCredits", 0),
+            total_debt_amount=summary.get("totalCurrentBalance", 0),
+            report_data={"content_hash": key, "mode": settings.RISK_SCORE_MODE, "risk_score": score.model_dump()},
+            created_user=user.email
+        ))
+    if not rows:
+        return
+    try:
+        async with get_async_sessionmaker()() as db:
+            db.add_all(rows)
+            await db.commit()
+    except Exception as e:
+        logger.error("No se pudo guardar el puntaje en credit_reports: %s", e)
+
+@router.post("/risk-score", response_model=schemas.RiskScore)
+async def calculate_risk_score(
+    request: schemas.RiskScoreRequest,
+    current_user: models.User = Depends(auth.get_current_active_user)
+):
+    """
+    Calcula el puntaje de riesgo de un cliente (escala 300-850).
+    Según RISK_SCORE_MODE usa el scorecard local, Google Gemini (con el scorecard
+    como respaldo si la IA falla) o un promedio ponderado de ambos.
+    Los puntajes de Gemini se reutilizan mientras el reporte simplificado no cambie.
+    """
+    report_data = request.report
+    local_score = scorecard_service.score_report(report_data)
+    if settings.RISK_SCORE_MODE == "scorecard":
+        return local_score
+
+    def final_score(llm_score: schemas.RiskScore) -> schemas.RiskScore:
+        if settings.RISK_SCORE_MODE == "blend":
+            return scorecard_service.blend(local_score, llm_score, settings.RISK_SCORE_LLM_WEIGHT)
+        return llm_score
+
+    simplified_report = simplify_report(report_data)
+    key = report_key(simplified_report)
+    cached = risk_score_cache.get(key)
+    if cached is not None:
+        return final_score(cached)
+
+    async def score_and_store() -> schemas.RiskScore:
+        llm_score = await score_with_llm(simplified_report)
+        risk_score_cache.set(key, llm_score)
+        await persist_risk_scores([(report_data, final_score(llm_score), key)], current_user)
+        return llm_score
+
+    try:
+        llm_score = await _llm_calls.do(key, score_and_store)
+    except HTTPException as e:
+        logger.warning("Puntaje de IA no disponible, se usa el scorecard local: %s", e.detail)
+        return local_score
+    return final_score(llm_score)
+
+@router.post("/risk-score/batch", response_model=List[schemas.BatchRiskScoreItem])
+async def calculate_risk_scores_batch(
+    request: schemas.BatchRiskScoreRequest,
+    current_user: models.User = Depends(auth.get_current_active_user)
+):
+    """
+    Puntaje de riesgo de varios reportes, en el orden recibido (scoring masivo de analistas).
+    Con RISK_SCORE_MODE "llm" o "blend" los reportes que no están en caché se envían a
+    Gemini agrupados en lotes de hasta GEMINI_BATCH_TOKEN_BUDGET tokens, de modo que mil
+    reportes cuestan unas pocas llamadas; los que la IA no logra puntuar usan el scorecard.
+    """
+    reports = request.reports
+    local_scores = scorecard_service.score_reports(reports)
+    if settings.RISK_SCORE_MODE == "scorecard" or not llm_configured():
+        return [
+            schemas.BatchRiskScoreItem(index=index, source="scorecard", **score.model_dump())
+            for index, score in enumerate(local_scores)
+        ]
+
+    keys = [report_key(simplify_report(report)) for report in reports]
+    llm_scores: Dict[str, schemas.RiskScore] = {}
+    pending: Dict[str, dict] = {}
+    for key, report in zip(keys, reports):
+        cached = risk_score_cache.get(key)
+        if cached is not None:
+            llm_scores[key] = cached
+        elif key not in pending:
+            # Reportes idénticos dentro de la petición se envían una sola vez
+            pending[key] = simplify_report(report)
+
+    fresh: Dict[str, schemas.RiskScore] = {}
+    if pending:
+        batches = pack_batches(list(pending.items()), settings.GEMINI_BATCH_TOKEN_BUDGET, settings.GEMINI_BATCH_MAX_ITEMS)
+        for batch_scores in await asyncio.gather(*(score_batch_with_llm(batch) for batch in batches)):
+            fresh.update(batch_scores)
+        for key, score in fresh.items():
+            risk_score_cache.set(key, score)
+        llm_scores.update(fresh)
+        logger.info(
+            "Lote de puntajes: %d reporte(s), %d a Gemini en %d lote(s), %d sin puntaje de IA",
+            len(reports), len(pending), len(batches), len(pending) - len(fresh)
+        )
+
+    results, to_persist = [], []
+    for index, (key, report, local_score) in enumerate(zip(keys, reports, local_scores)):
+        llm_score = llm_scores.get(key)
+        if llm_score is None:
+            results.append(schemas.BatchRiskScoreItem(index=index, source="scorecard", **local_score.model_dump()))
+            continue
+        if settings.RISK_SCORE_MODE == "blend":
+            score = scorecard_service.blend(local_score, llm_score, settings.RISK_SCORE_LLM_WEIGHT)
+        else:
+            score = llm_score
+        results.append(schemas.BatchRiskScoreItem(index=index, source=settings.RISK_SCORE_MODE, **score.model_dump()))
+        if key in fresh:
+            to_persist.append((report, score, key))
+            fresh.pop(key)
+    await persist_risk_scores(to_persist, current_user)
+    return results
@@ -1,21 +1,76 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 import crud, schemas, auth, models
-from database import get_db
+from database import get_db, get_async_db, SessionLocal
+from sql_budget import sql_budget, separate_sql_budget
 
 router = APIRouter()
 
+# Identificadores que se resuelven por bloque en el reporte masivo
+BATCH_REPORT_CHUNK_SIZE = 500
+# Sentencias por bloque: revisión de la caché (hora y clientes cambiados), clientes,
+# marcas, préstamos, historial y cuotas; selectinload consulta las cuotas de a 500
+# préstamos, así que se cuentan hasta 3 consultas de cuotas por bloque
+BATCH_REPORT_CHUNK_SQL_BUDGET = 9
+
+def stream_credit_reports_ndjson(identifiers: List[str], history_limit: Optional[int]):
+    """
+    Generador NDJSON del reporte masivo: un objeto por identificador, en el orden recibido.
+    Usa su propia sesión porque la respuesta se sigue enviando después de
+    que FastAPI cierra las dependencias; solo un bloque vive en memoria.
+    """
+    db = SessionLocal()
+    try:
+        for start in range(0, len(identifiers), BATCH_REPORT_CHUNK_SIZE):
+            chunk = identifiers[start:start + BATCH_REPORT_CHUNK_SIZE]
+            # Cada bloque tiene su propio presupuesto SQL; el bloque no abarca el yield
+            with separate_sql_budget(BATCH_REPORT_CHUNK_SQL_BUDGET, label="bloque NDJSON"):
+                reports = crud.get_cached_credit_reports(db, chunk, history_limit=history_limit)
+                lines = []
+                for identifier in chunk:
+                    report = reports.get(identifier)
+                    item = schemas.BatchCreditReportItem(identifier=identifier, found=report is not None, report=report)
+                    lines.append(item.model_dump_json() + "\n")
+            yield "".join(lines)
+            db.expunge_all()
+    finally:
+        db.close()
+
+@router.post("/batch")
+def get_credit_reports_batch(
+    request: schemas.BatchCreditReportRequest,
+    current_user: models.User = Depends(auth.get_current_active_user)
+):
+    """
+    Obtiene los reportes de crédito de muchos identificadores en una sola petición.
+    La respuesta es NDJSON (un BatchCreditReportItem por línea); los identificadores
+    sin cliente se devuelven con found=false.
+    """
+    return StreamingResponse(
+        stream_credit_reports_ndjson(request.identifiers, request.historyLimit),
+        media_type="application/x-ndjson"
+    )
+
 @router.get("/{identifier}", response_model=schemas.CreditReportSchema)
-def get_credit_report(
+@sql_budget(8)
+async def get_credit_report(
     identifier: str, 
-    db: Session = Depends(get_db),
+    history_limit: Optional[int] = Query(None, ge=1, description="Últimas N entradas de historial por tipo de dato"),
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.User = Depends(auth.get_current_active_user)
 ):
     """
     Obtiene el reporte de crédito completo para un cliente por su identificador nacional.
+    Con history_limit solo se incluyen las últimas N direcciones, teléfonos y correos.
     Este es un endpoint protegido que requiere autenticación.
     """
-    report = crud.get_full_credit_report(db, identifier=identifier)
+    # El reporte (y el esquema Pydantic) se arma dentro de run_sync, donde la carga de relaciones es válida
+    report = await db.run_sync(
+        crud.get_cached_credit_report, identifier=identifier, history_limit=history_limit
+    )
     if report is None:
         raise HTTPException(status_code=404, detail="Reporte no encontrado para el identificador proporcionado.")
     
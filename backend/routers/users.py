@@ -10,14 +10,18 @@ from typing import List, Optional
 from fastapi import APIRouter, Depends, HTTPException, status, Query
 from fastapi.security import HTTPBearer
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_
-from passlib.context import CryptContext
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import and_, or_, select, func
 
 # Agregar path para importar database
 sys.path.append(os.path.dirname(os.path.abspath(__file__)) + '/../..')
 
-from database import get_db, User, Company, Session as UserSession, AuditLog, UserRole
+from database import get_db, get_async_db, User, Company, Session as UserSession, AuditLog, UserRole
 from .auth import get_current_user
+from cache import invalidate_identity
+from services.audit_service import audit_sink
+from sql_budget import sql_budget
+from services.password_service import hash_password, verify_password, hash_password_async
 
 # ===============================================
 # CONFIGURACIÓN
@@ -25,7 +29,6 @@ from .auth import get_current_user
 
 router = APIRouter()
 security = HTTPBearer()
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 # ===============================================
 # MODELOS PYDANTIC PARA REQUESTS/RESPONSES
@@ -88,39 +91,28 @@ class UsersListResponse(BaseModel):
 # FUNCIONES AUXILIARES
 # ===============================================
 
-def hash_password(password: str) -> str:
-    """Cifrar contraseña"""
-    return pwd_context.hash(password)
-
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Verificar contraseña"""
-    return pwd_context.verify(plain_password, hashed_password)
-
-def log_user_action(db: Session, action: str, user_id: int, performed_by: str, 
-                   old_values=None, new_values=None, record_id=None):
-    """Registrar acción en logs de auditoría"""
-    try:
-        audit_log = AuditLog(
-            user_id=user_id,
-            action=action,
-            table_name="users",
-            record_id=record_id or user_id,
-            old_values=old_values,
-            new_values=new_values,
-            created_user=performed_by
-        )
-        db.add(audit_log)
-        db.commit()
-    except Exception as e:
-        print(f"Error logging action: {e}")
+async def log_user_action(db: Session, action: str, user_id: int, performed_by: str, 
+                   old_values=None, new_values=None, record_id=None, critical: bool = False):
+    """Registrar acción en logs de auditoría (en el buffer de auditoría, sin commit propio)"""
+    await audit_sink.record_async(
+        user_id=user_id,
+        action=action,
+        table_name="users",
+        record_id=record_id or user_id,
+        old_values=old_values,
+        new_values=new_values,
+        created_user=performed_by,
+        critical=critical
+    )
 
 # ===============================================
 # ENDPOINTS
 # ===============================================
 
 @router.get("/", response_model=UsersListResponse)
+@sql_budget(4)
 async def get_all_users(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(get_current_user),
     page: int = Query(1, ge=1),
     size: int = Query(20, ge=1, le=100),
@@ -142,15 +134,15 @@ async def get_all_users(
             )
 
         # Construir query base
-        query = db.query(User)
+        query = select(User)
         
         # Aplicar filtros
         if active_only:
-            query = query.filter(User.is_active == True)
+            query = query.where(User.is_active == True)
         
         if search:
             search_term = f"%{search}%"
-            query = query.filter(
+            query = query.where(
                 or_(
                     User.full_name.ilike(search_term),
                     User.email.ilike(search_term),
@@ -159,17 +151,19 @@ async def get_all_users(
             )
         
         if role_filter:
-            query = query.filter(User.role == UserRole(role_filter))
+            query = query.where(User.role == UserRole(role_filter))
             
         if company_filter:
-            query = query.filter(User.company_id == company_filter)
+            query = query.where(User.company_id == company_filter)
 
         # Contar total
-        total = query.count()
+        total = (await db.execute(
+            select(func.count()).select_from(query.subquery())
+        )).scalar_one()
         
         # Aplicar paginación
         offset = (page - 1) * size
-        users = query.offset(offset).limit(size).all()
+        users = (await db.execute(query.offset(offset).limit(size))).scalars().all()
         
         # Calcular páginas
         pages = (total + size - 1) // size
@@ -272,7 +266,7 @@ async def create_user(
                 )
 
         # Crear usuario
-        hashed_password = hash_password(user_data.password)
+        hashed_password = await hash_password_async(user_data.password)
         
         new_user = User(
             full_name=user_data.full_name,
@@ -290,7 +284,7 @@ async def create_user(
         db.refresh(new_user)
 
         # Log de auditoría
-        log_user_action(
+        await log_user_action(
             db, "CREATE_USER", new_user.id, 
             current_user.get("email", "system"),
             new_values={"full_name": new_user.full_name, "role": user_data.role},
@@ -364,6 +358,7 @@ async def update_user(
         user.updated_at = datetime.utcnow()
         
         db.commit()
+        invalidate_identity(user.email)
         db.refresh(user)
 
         # Log de auditoría
@@ -375,7 +370,7 @@ async def update_user(
             "is_active": user.is_active
         }
         
-        log_user_action(
+        await log_user_action(
             db, "UPDATE_USER", user.id,
             current_user.get("email", "system"),
             old_values=old_values,
@@ -435,13 +430,15 @@ async def delete_user(
         })
         
         db.commit()
+        invalidate_identity(user.email)
 
         # Log de auditoría
-        log_user_action(
+        await log_user_action(
             db, "DELETE_USER", user.id,
             current_user.get("email", "system"),
             old_values={"is_active": True},
-            new_values={"is_active": False}
+            new_values={"is_active": False},
+            critical=True
         )
 
         return {"message": "Usuario eliminado exitosamente"}
@@ -530,7 +527,7 @@ async def reset_user_password(
             )
 
         # Actualizar contraseña
-        user.password_hash = hash_password(new_password)
+        user.password_hash = await hash_password_async(new_password)
         user.updated_at = datetime.utcnow()
         
         # Cerrar todas las sesiones del usuario
@@ -539,11 +536,13 @@ async def reset_user_password(
         })
         
         db.commit()
+        invalidate_identity(user.email)
 
         # Log de auditoría
-        log_user_action(
+        await log_user_action(
             db, "RESET_PASSWORD", user.id,
-            current_user.get("email", "system")
+            current_user.get("email", "system"),
+            critical=True
         )
 
         return {"message": "Contraseña actualizada exitosamente"}
@@ -140,6 +140,15 @@ class CreditReportSchema(BaseModel):
     class Config:
         populate_by_name = True
 
+class BatchCreditReportRequest(BaseModel):
+    identifiers: List[str] = Field(..., min_length=1, max_length=50000)
+    historyLimit: Optional[int] = Field(None, ge=1)
+
+class BatchCreditReportItem(BaseModel):
+    identifier: str
+    found: bool
+    report: Optional[CreditReportSchema] = None
+
 # -- Gemini & Risk Score Schemas --
 class RiskScoreRequest(BaseModel):
     report: Any # Se deja Any por flexibilidad con el formato que envía el frontend
@@ -149,6 +158,13 @@ class RiskScore(BaseModel):
     assessment: str
     reasoning: str
 
+class BatchRiskScoreRequest(BaseModel):
+    reports: List[Any] = Field(..., min_length=1, max_length=5000)
+
+class BatchRiskScoreItem(RiskScore):
+    index: int # Posición del reporte en la petición
+    source: str # "scorecard", "llm" o "blend"
+
 # -- Dashboard Schemas --
 class GeneralDashboardData(BaseModel):
     total_clients: int
@@ -173,10 +189,21 @@ class DashboardResponse(BaseModel):
 class ProcessResult(BaseModel):
     status: str # 'success' or 'error'
     message: str
+    upload_id: Optional[int] = None
     file_name: str
     total_records: int
     processed_records: int
     new_clients: int
     new_loans: int
     updated_loans: int
-    errors: List[str]
\ No newline at end of file
+    errors: List[str]
+
+class FileUploadStatusResponse(BaseModel):
+    id: int
+    file_name: str
+    status: str # 'uploaded', 'processing', 'completed' o 'failed'
+    processed_records: int
+    failed_records: int
+    error_details: Optional[str] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
@@ -0,0 +1,177 @@
+"""
+Servicio de auditoría - MIRIESGO v2
+Registro de eventos en audit_logs con buffer en memoria e inserciones multi-fila
+"""
+
+import sys
+import os
+import logging
+import queue
+import threading
+import time
+from typing import Dict, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import insert
+
+# Agregar path para importar database
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + '/../..')
+
+from database import SessionLocal, AuditLog
+from config import settings
+
+logger = logging.getLogger("miriesgo.audit")
+
+# Marca que detiene el hilo escritor
+_STOP = object()
+
+class AuditSink:
+    """
+    Cola de eventos de auditoría que un hilo escritor vacía con INSERT multi-fila
+    cuando se junta un lote (batch_size) o pasa el intervalo (flush_interval).
+    Los eventos críticos, los que llegan con la cola llena y los que llegan
+    cuando el escritor no está corriendo (scripts, pruebas) se escriben de inmediato;
+    desde rutas async (record_async) esa escritura va al threadpool, no al event loop.
+    Nunca usa la sesión de la petición: no interfiere con su transacción.
+    """
+
+    def __init__(self, batch_size: int, flush_interval: float, max_queue: int):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+
+    # -- Registro --
+
+    def record(self, action: str, table_name: str, created_user: str, record_id: int = None,
+               user_id: int = None, old_values=None, new_values=None, ip_address: str = None,
+               user_agent: str = None, critical: bool = False):
+        """Registrar un evento desde código síncrono; con critical=True se escribe antes de retornar"""
+        row = self._row(action, table_name, created_user, record_id, user_id, old_values,
+                        new_values, ip_address, user_agent)
+        if critical or not self._enqueue(row):
+            self._write([row])
+
+    async def record_async(self, action: str, table_name: str, created_user: str, record_id: int = None,
+                           user_id: int = None, old_values=None, new_values=None, ip_address: str = None,
+                           user_agent: str = None, critical: bool = False):
+        """Como record, para rutas async: la escritura inmediata corre en el threadpool"""
+        row = self._row(action, table_name, created_user, record_id, user_id, old_values,
+                        new_values, ip_address, user_agent)
+        if critical or not self._enqueue(row):
+            await run_in_threadpool(self._write, [row])
+
+    @staticmethod
+    def _row(action, table_name, created_user, record_id, user_id, old_values, new_values,
+             ip_address, user_agent) -> Dict:
+        # Sin created_at/updated_at: los pone la base con su reloj al insertar, como en
+        # el resto de tablas. El desfase con el evento es a lo sumo flush_interval.
+        return {
+            "user_id": user_id,
+            "action": action,
+            "table_name": table_name,
+            "record_id": record_id,
+            "old_values": old_values,
+            "new_values": new_values,
+            "ip_address": ip_address,
+            "user_agent": user_agent,
+            "created_user": created_user,
+        }
+
+    def _enqueue(self, row: Dict) -> bool:
+        """Encolar para el escritor; False si no está corriendo o la cola está llena"""
+        if not self.running:
+            return False
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            return False
+        return True
+
+    # -- Escritura --
+
+    def _write(self, rows: List[Dict]):
+        db = SessionLocal()
+        try:
+            db.execute(insert(AuditLog), rows)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error("Error escribiendo %d evento(s) de auditoría: %s", len(rows), e)
+        finally:
+            db.close()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                self._queue.task_done()
+                break
+
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    self._queue.task_done()
+                    stopping = True
+                    break
+                batch.append(item)
+
+            try:
+                self._write(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    # -- Ciclo de vida --
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+        self._thread.start()
+
+    def flush(self):
+        """Esperar a que todos los eventos encolados estén escritos"""
+        if self.running:
+            self._queue.join()
+
+    def stop(self, timeout: float = 10.0):
+        """Escribir lo pendiente y detener el hilo escritor (al apagar el servidor)"""
+        if not self.running:
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        self._thread = None
+
+        # Eventos que llegaron después de la marca de parada
+        pending = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            self._queue.task_done()
+            if item is not _STOP:
+                pending.append(item)
+        if pending:
+            self._write(pending)
+
+
+audit_sink = AuditSink(
+    batch_size=settings.AUDIT_BATCH_SIZE,
+    flush_interval=settings.AUDIT_FLUSH_SECONDS,
+    max_queue=settings.AUDIT_QUEUE_MAX
+)
@@ -0,0 +1,529 @@
+"""
+Servicio de procesamiento de archivos planos - MIRIESGO v2
+Ingesta en streaming de archivos de ancho fijo (formato TransUnion Sector Real)
+
+Los registros se escriben en las tablas que leen reportes, listado de clientes,
+dashboard y scorecard (modelos de backend/models.py): clientes, historial y
+contacto vigente, préstamos (por loan_number) y cuotas.
+"""
+
+import sys
+import os
+from dataclasses import dataclass, field, fields, replace
+from datetime import date, datetime
+from decimal import Decimal
+from itertools import islice
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import func, insert, select, tuple_, update
+from sqlalchemy.orm import Session
+
+# Agregar path para importar database
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + '/../..')
+
+from database import SessionLocal, FileUpload, FileUploadStatus
+from database.bulk import bulk_upsert_loans
+from config import settings
+import crud, models
+
+# ===============================================
+# ESTRUCTURA DEL ARCHIVO
+# ===============================================
+
+# Cada campo se define como (nombre, inicio, fin) con posiciones base 0
+# y fin exclusivo, tal como se recortan con line[inicio:fin].
+
+CONTROL_RECORD_TYPE = "1"
+DETAIL_RECORD_TYPE = "2"
+
+CONTROL_LAYOUT = (
+    ("record_type", 0, 1),
+    ("company_code", 1, 11),
+    ("cutoff_date", 11, 19),
+    ("total_records", 19, 28),
+)
+
+DETAIL_LAYOUT = (
+    ("record_type", 0, 1),
+    ("national_identifier", 1, 21),
+    ("full_name", 21, 81),
+    ("birth_date", 81, 89),
+    ("phone", 89, 109),
+    ("email", 109, 169),
+    ("address", 169, 249),
+    ("city", 249, 279),
+    ("loan_number", 279, 299),
+    ("loan_type", 299, 301),
+    ("original_amount", 301, 316),
+    ("current_balance", 316, 331),
+    ("monthly_payment", 331, 346),
+    ("interest_rate", 346, 351),
+    ("start_date", 351, 359),
+    ("end_date", 359, 367),
+    ("last_payment_date", 367, 375),
+    ("status", 375, 377),
+    ("days_late", 377, 381),
+    ("installment_number", 381, 384),
+    ("expected_payment_date", 384, 392),
+    ("actual_payment_date", 392, 400),
+    ("amount_paid", 400, 415),
+    ("payment_status", 415, 416),
+)
+
+DETAIL_RECORD_LENGTH = DETAIL_LAYOUT[-1][2]
+
+# Hipotecario, vehículo, libre inversión, comercial y tarjeta de crédito. El modelo de
+# lectura no guarda el tipo: el código solo se valida
+LOAN_TYPE_CODES = ("01", "02", "03", "04", "05")
+
+# Código del archivo -> estado del préstamo. El modelo de lectura no tiene
+# "reestructurado" (04): el préstamo sigue vigente con sus nuevas condiciones
+LOAN_STATUS_CODES = {
+    "01": "Vigente",
+    "02": "Pagado",
+    "03": "En Mora",
+    "04": "Vigente",
+    "05": "Cancelado",
+}
+
+PAYMENT_STATUS_CODES = {
+    "0": "Pendiente",
+    "1": "Pagado",
+    "2": "En Mora",
+}
+
+# Modalidad -> días entre cuotas. El archivo no trae la modalidad: se deduce del
+# intervalo entre el inicio del préstamo y la fecha esperada de la cuota
+MODALITY_PERIODS = (
+    ("Diario", 1),
+    ("Semanal", 7),
+    ("Quincenal", 15),
+    ("Mensual", 30),
+    ("Anual", 365),
+)
+
+# Máximo de mensajes de error que se conservan en FileUpload.error_details
+MAX_REPORTED_ERRORS = 50
+
+# ===============================================
+# PARSEO LÍNEA A LÍNEA
+# ===============================================
+
+class RecordError(ValueError):
+    """Error de formato en un registro del archivo"""
+
+
+@dataclass
+class IngestionStats:
+    """Contadores acumulados durante la ingesta de un archivo"""
+    total_records: int = 0
+    processed_records: int = 0
+    failed_records: int = 0
+    new_clients: int = 0
+    new_loans: int = 0
+    updated_loans: int = 0
+    errors: List[str] = field(default_factory=list)
+
+    def add_error(self, message: str, records: int = 1):
+        """Contar records líneas fallidas con un mismo mensaje de error"""
+        self.failed_records += records
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(message)
+
+    def snapshot(self) -> "IngestionStats":
+        return replace(self, errors=list(self.errors))
+
+    def restore(self, snapshot: "IngestionStats"):
+        """Volver a los contadores de snapshot (lote revertido)"""
+        for f in fields(self):
+            setattr(self, f.name, getattr(snapshot, f.name))
+        self.errors = list(snapshot.errors)
+
+
+def _slice_fields(line: str, layout) -> Dict[str, str]:
+    return {name: line[start:end].strip() for name, start, end in layout}
+
+def _parse_date(value: str) -> Optional[date]:
+    if not value or value.strip("0") == "":
+        return None
+    return datetime.strptime(value, "%Y%m%d").date()
+
+def _parse_amount(value: str) -> Decimal:
+    """Montos sin separador decimal, con dos decimales implícitos"""
+    return Decimal(int(value or "0")) / 100
+
+def _modality(start_date: date, end_date: date, installment_number: int,
+              expected_payment_date: Optional[date]) -> Tuple[str, int]:
+    """Modalidad y número de cuotas; sin cuota en la línea se asume mensual"""
+    period = 30.0
+    if installment_number > 0 and expected_payment_date and expected_payment_date > start_date:
+        period = (expected_payment_date - start_date).days / installment_number
+    modality, days = min(MODALITY_PERIODS, key=lambda item: abs(item[1] - period))
+    return modality, max(round((end_date - start_date).days / days), 1)
+
+def _address(address: str, city: str) -> Optional[str]:
+    """El modelo de lectura guarda la ciudad dentro de la dirección"""
+    if not address:
+        return city or None
+    if not city or address.endswith(city):
+        return address
+    return f"{address}, {city}"
+
+def parse_control_record(line: str) -> Dict:
+    """Parsear el registro de control (tipo 1)"""
+    raw = _slice_fields(line, CONTROL_LAYOUT)
+    if raw["record_type"] != CONTROL_RECORD_TYPE:
+        raise RecordError("El primer registro debe ser de control (tipo 1)")
+    return {
+        "company_code": raw["company_code"],
+        "cutoff_date": _parse_date(raw["cutoff_date"]),
+        "total_records": int(raw["total_records"] or "0"),
+    }
+
+def parse_detail_record(line: str) -> Dict:
+    """Parsear un registro de detalle (tipo 2) a valores tipados"""
+    if len(line) < DETAIL_RECORD_LENGTH:
+        raise RecordError(f"longitud {len(line)}, se esperaban {DETAIL_RECORD_LENGTH} caracteres")
+
+    raw = _slice_fields(line, DETAIL_LAYOUT)
+    if raw["record_type"] != DETAIL_RECORD_TYPE:
+        raise RecordError(f"tipo de registro inválido '{raw['record_type']}'")
+    if not raw["national_identifier"] or not raw["loan_number"]:
+        raise RecordError("identificación o número de préstamo vacío")
+
+    try:
+        if raw["loan_type"] not in LOAN_TYPE_CODES:
+            raise KeyError(raw["loan_type"])
+        loan_status = LOAN_STATUS_CODES[raw["status"]]
+        payment_status = PAYMENT_STATUS_CODES[raw["payment_status"]]
+        days_late = int(raw["days_late"] or "0")
+        start_date = _parse_date(raw["start_date"])
+        end_date = _parse_date(raw["end_date"])
+        installment_number = int(raw["installment_number"] or "0")
+        expected_payment_date = _parse_date(raw["expected_payment_date"])
+        if start_date is None or end_date is None:
+            raise RecordError("fechas de inicio o vencimiento vacías")
+        if installment_number > 0 and expected_payment_date is None:
+            raise RecordError("fecha esperada de la cuota vacía")
+        modality, installments = _modality(start_date, end_date, installment_number, expected_payment_date)
+
+        record = {
+            "client": {
+                "national_identifier": raw["national_identifier"],
+                "full_name": raw["full_name"],
+                "birth_date": _parse_date(raw["birth_date"]),
+            },
+            "contacts": {
+                "phone": raw["phone"] or None,
+                "email": raw["email"] or None,
+                "address": _address(raw["address"], raw["city"]),
+            },
+            "loan": {
+                "loan_number": raw["loan_number"],
+                "origination_date": start_date,
+                "original_amount": _parse_amount(raw["original_amount"]),
+                "current_balance": _parse_amount(raw["current_balance"]),
+                "status": loan_status,
+                "modality": modality,
+                "interest_rate": _parse_amount(raw["interest_rate"]),
+                "installments": installments,
+                "days_late": days_late,
+            },
+            "payment": None,
+        }
+        if installment_number > 0:
+            record["payment"] = {
+                "installment_number": installment_number,
+                "expected_payment_date": expected_payment_date,
+                "actual_payment_date": _parse_date(raw["actual_payment_date"]),
+                "amount_paid": _parse_amount(raw["amount_paid"]),
+                "status": payment_status,
+                "days_late": days_late if payment_status == "En Mora" else 0,
+            }
+    except KeyError as e:
+        raise RecordError(f"código desconocido {e}")
+    except ValueError as e:
+        raise RecordError(str(e))
+    return record
+
+def iter_detail_records(file_path: str) -> Iterator[Tuple[int, Optional[Dict], Optional[str]]]:
+    """
+    Generador que recorre el archivo línea a línea sin cargarlo en memoria.
+    Produce (número_de_línea, registro, error); el registro de control se omite.
+    """
+    with open(file_path, "r", encoding="latin-1", newline="") as fh:
+        for line_number, line in enumerate(fh, start=1):
+            line = line.rstrip("\r\n")
+            if not line.strip():
+                continue
+            if line_number == 1 and line.startswith(CONTROL_RECORD_TYPE):
+                continue
+            try:
+                yield line_number, parse_detail_record(line), None
+            except RecordError as e:
+                yield line_number, None, f"Línea {line_number}: {e}"
+
+def read_control_record(file_path: str) -> Optional[Dict]:
+    """Leer únicamente la primera línea del archivo como registro de control"""
+    with open(file_path, "r", encoding="latin-1", newline="") as fh:
+        first_line = fh.readline().rstrip("\r\n")
+    try:
+        return parse_control_record(first_line)
+    except (RecordError, ValueError):
+        return None
+
+def resolve_company(db: Session, file_path: str) -> Tuple[Optional[str], Optional[int]]:
+    """
+    Código de empresa del registro de control y el id de esa empresa.
+    Retorna (None, None) si el archivo no trae código y (código, None) si no existe.
+    """
+    control = read_control_record(file_path)
+    if not control or not control["company_code"]:
+        return None, None
+    company_id = db.execute(
+        select(models.Company.id).where(models.Company.transunion_code == control["company_code"])
+    ).scalar_one_or_none()
+    return control["company_code"], company_id
+
+# ===============================================
+# ESCRITURA POR LOTES
+# ===============================================
+
+def _chunks(iterable, size: int):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def _upsert_clients(db: Session, records: List[Dict], stats: IngestionStats) -> Dict[str, int]:
+    """Insertar clientes nuevos y actualizar los existentes; retorna identificación -> id"""
+    by_identifier = {r["client"]["national_identifier"]: r["client"] for r in records}
+    existing = dict(db.execute(
+        select(models.Client.national_identifier, models.Client.id)
+        .where(models.Client.national_identifier.in_(by_identifier.keys()))
+    ).all())
+
+    new_rows = [values for identifier, values in by_identifier.items() if identifier not in existing]
+    updated_rows = [
+        {"id": existing[identifier], **values}
+        for identifier, values in by_identifier.items() if identifier in existing
+    ]
+    if new_rows:
+        db.execute(insert(models.Client), new_rows)
+        stats.new_clients += len(new_rows)
+        existing.update(db.execute(
+            select(models.Client.national_identifier, models.Client.id)
+            .where(models.Client.national_identifier.in_([r["national_identifier"] for r in new_rows]))
+        ).all())
+    if updated_rows:
+        db.execute(update(models.Client), updated_rows)
+    return existing
+
+def _upsert_contacts(db: Session, records: List[Dict], client_ids: Dict[str, int]):
+    """
+    Registrar en client_data_history los datos de contacto que cambiaron y mantener
+    al día la proyección client_current_contacts, como crud.update_client
+    """
+    by_client = {client_ids[r["client"]["national_identifier"]]: r["contacts"] for r in records}
+    current = {
+        (client_id, data_type): value
+        for client_id, data_type, value in db.execute(
+            select(models.ClientCurrentContact.client_id, models.ClientCurrentContact.data_type,
+                   models.ClientCurrentContact.value)
+            .where(models.ClientCurrentContact.client_id.in_(by_client.keys()))
+        ).all()
+    }
+
+    changed = [
+        {"client_id": client_id, "data_type": data_type, "value": value}
+        for client_id, contacts in by_client.items()
+        for data_type, value in contacts.items()
+        if value and current.get((client_id, data_type)) != value
+    ]
+    if not changed:
+        return
+
+    now = db.execute(select(func.current_timestamp())).scalar()
+    rows = [{**row, "date_modified": now} for row in changed]
+    db.execute(insert(models.ClientDataHistory), rows)
+    new_rows = [row for row in rows if (row["client_id"], row["data_type"]) not in current]
+    updated_rows = [row for row in rows if (row["client_id"], row["data_type"]) in current]
+    if new_rows:
+        db.execute(insert(models.ClientCurrentContact), new_rows)
+    if updated_rows:
+        db.execute(update(models.ClientCurrentContact), updated_rows)
+
+def _reject_foreign_loans(records: List[Dict], loan_numbers, stats: IngestionStats):
+    """Contar como fallidas las líneas de préstamos que ya son de otra empresa"""
+    lines = {}
+    for r in records:
+        number = r["loan"]["loan_number"]
+        if number in loan_numbers:
+            lines[number] = lines.get(number, 0) + 1
+    for number, count in lines.items():
+        stats.add_error(f"Préstamo {number}: pertenece a otra empresa ({count} líneas omitidas)", records=count)
+
+def _upsert_loans(db: Session, records: List[Dict], client_ids: Dict[str, int], company_id: int,
+                  report_date: date, stats: IngestionStats) -> Dict[str, int]:
+    """
+    Insertar o actualizar préstamos por loan_number; retorna loan_number -> id.
+    Los préstamos que ya pertenecen a otra empresa no se escriben: sus líneas
+    cuentan como fallidas y quedan fuera del resultado.
+    """
+    numbers = {r["loan"]["loan_number"] for r in records}
+    foreign = set(db.execute(
+        select(models.Loan.loan_number)
+        .where(models.Loan.loan_number.in_(numbers), models.Loan.company_id != company_id)
+    ).scalars())
+
+    rows = [
+        {
+            **r["loan"],
+            "client_id": client_ids[r["client"]["national_identifier"]],
+            "company_id": company_id,
+            "last_report_date": report_date,
+        }
+        for r in records if r["loan"]["loan_number"] not in foreign
+    ]
+    result = bulk_upsert_loans(db, rows, batch_size=len(rows), table=models.Loan.__table__)
+    stats.new_loans += result.inserted
+    stats.updated_loans += result.updated
+    # Los conflictos del upsert son préstamos que otra carga registró entre la consulta y la escritura
+    foreign.update(result.conflicts)
+    _reject_foreign_loans(records, foreign, stats)
+
+    return dict(db.execute(
+        select(models.Loan.loan_number, models.Loan.id)
+        .where(models.Loan.loan_number.in_(numbers - foreign))
+    ).all())
+
+def _upsert_payments(db: Session, records: List[Dict], loan_ids: Dict[str, int]):
+    """Insertar o actualizar cuotas por (loan_id, installment_number) de los préstamos escritos"""
+    by_key = {}
+    for r in records:
+        if r["payment"] and r["loan"]["loan_number"] in loan_ids:
+            loan_id = loan_ids[r["loan"]["loan_number"]]
+            by_key[(loan_id, r["payment"]["installment_number"])] = {**r["payment"], "loan_id": loan_id}
+    if not by_key:
+        return
+
+    existing = {
+        (loan_id, installment): payment_id
+        for payment_id, loan_id, installment in db.execute(
+            select(models.Payment.id, models.Payment.loan_id, models.Payment.installment_number)
+            .where(tuple_(models.Payment.loan_id, models.Payment.installment_number).in_(list(by_key.keys())))
+        ).all()
+    }
+    new_rows = [values for key, values in by_key.items() if key not in existing]
+    updated_rows = [{"id": existing[key], **values} for key, values in by_key.items() if key in existing]
+    if new_rows:
+        db.execute(insert(models.Payment), new_rows)
+    if updated_rows:
+        db.execute(update(models.Payment), updated_rows)
+
+def _write_batch(db: Session, records: List[Dict], company_id: int, report_date: date,
+                 stats: IngestionStats) -> int:
+    """Escribir un lote sin confirmarlo; retorna cuántos registros se escribieron"""
+    # Los agregados del dashboard se ajustan con el aporte de los clientes del lote
+    # antes y después de escribirlo, en la misma transacción
+    known_ids = db.execute(
+        select(models.Client.id)
+        .where(models.Client.national_identifier.in_({r["client"]["national_identifier"] for r in records}))
+    ).scalars().all()
+    before = crud.portfolio_snapshot(db, known_ids)
+
+    client_ids = _upsert_clients(db, records, stats)
+    _upsert_contacts(db, records, client_ids)
+    loan_ids = _upsert_loans(db, records, client_ids, company_id, report_date, stats)
+    _upsert_payments(db, records, loan_ids)
+    crud.apply_portfolio_delta(db, before, crud.portfolio_snapshot(db, client_ids.values()))
+    return sum(1 for r in records if r["loan"]["loan_number"] in loan_ids)
+
+# ===============================================
+# PROCESAMIENTO COMPLETO
+# ===============================================
+
+def _commit_lines(db: Session, upload: FileUpload, lines: List[Tuple[int, Dict]], report_date: date,
+                  stats: IngestionStats):
+    """
+    Escribir y confirmar las líneas [(número de línea, registro)] de un lote.
+    Si el lote falla se revierte, los contadores vuelven a su valor previo y se
+    reintenta por mitades hasta aislar las líneas que fallan.
+    """
+    before = stats.snapshot()
+    try:
+        stats.processed_records += _write_batch(db, [record for _, record in lines], upload.company_id,
+                                                report_date, stats)
+        upload.processed_records = stats.processed_records
+        upload.failed_records = stats.failed_records
+        db.commit()
+        return
+    except Exception as e:
+        db.rollback()
+        stats.restore(before)
+        if len(lines) == 1:
+            stats.add_error(f"Línea {lines[0][0]}: {e}")
+            return
+
+    middle = len(lines) // 2
+    _commit_lines(db, upload, lines[:middle], report_date, stats)
+    _commit_lines(db, upload, lines[middle:], report_date, stats)
+
+def ingest_file(db: Session, upload: FileUpload, batch_size: Optional[int] = None) -> IngestionStats:
+    """
+    Procesar el archivo asociado a un FileUpload.
+    Cada lote se confirma en su propia transacción junto con el progreso del FileUpload;
+    un lote que falla se reintenta por partes y solo se descartan sus líneas con error.
+    """
+    batch_size = batch_size or settings.INGESTION_BATCH_SIZE
+    stats = IngestionStats()
+    # Fecha de reporte de los préstamos: la de corte del registro de control
+    control = read_control_record(upload.file_path)
+    report_date = (control and control["cutoff_date"]) or date.today()
+
+    upload.status = FileUploadStatus.processing
+    upload.processed_records = 0
+    upload.failed_records = 0
+    db.commit()
+
+    try:
+        for chunk in _chunks(iter_detail_records(upload.file_path), batch_size):
+            lines = []
+            for line_number, record, error in chunk:
+                stats.total_records += 1
+                if error:
+                    stats.add_error(error)
+                else:
+                    lines.append((line_number, record))
+
+            if lines:
+                _commit_lines(db, upload, lines, report_date, stats)
+            else:
+                upload.processed_records = stats.processed_records
+                upload.failed_records = stats.failed_records
+                db.commit()
+
+        upload.status = FileUploadStatus.completed
+    except Exception as e:
+        db.rollback()
+        stats.errors.append(f"Error procesando archivo: {e}")
+        upload.status = FileUploadStatus.failed
+
+    upload.processed_records = stats.processed_records
+    upload.failed_records = stats.failed_records
+    upload.error_details = "\n".join(stats.errors) or None
+    db.commit()
+    return stats
+
+def process_fixed_width_file(upload_id: int, batch_size: Optional[int] = None) -> Optional[IngestionStats]:
+    """Procesar un archivo registrado en file_uploads usando una sesión propia"""
+    db = SessionLocal()
+    try:
+        upload = db.query(FileUpload).filter(FileUpload.id == upload_id).first()
+        if not upload:
+            return None
+        return ingest_file(db, upload, batch_size=batch_size)
+    finally:
+        db.close()
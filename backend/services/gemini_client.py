@@ -0,0 +1,243 @@
+"""
+Cliente de Gemini - MIRIESGO v2
+Cliente asíncrono y reutilizable para las llamadas de puntaje a la IA: concurrencia
+acotada con semáforo, plazo por intento y por llamada, reintentos con jitter y un
+circuit breaker que, con el servicio caído, falla de inmediato para que la ruta
+responda con el puntaje de respaldo (scorecard local).
+
+El backend "fake" responde en local de forma determinista, con latencia y fallos
+configurables, para pruebas y benchmarks sin red.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import re
+import time
+from typing import Optional
+
+from config import settings
+from metrics import registry
+from services import scorecard_service
+
+logger = logging.getLogger("miriesgo.gemini")
+
+GEMINI_MODEL = 'gemini-1.5-flash-latest'
+
+class CircuitOpenError(Exception):
+    """El circuit breaker está abierto: no se llama al servicio"""
+
+# ===============================================
+# BACKENDS
+# ===============================================
+
+class GeminiBackend:
+    """
+    Google Gemini. El SDK es pesado y la mayoría de los workers nunca lo usa: se importa
+    y configura en la primera llamada, y el GenerativeModel se reutiliza entre llamadas.
+    """
+
+    def __init__(self, api_key: str, model_name: str = GEMINI_MODEL):
+        self.api_key = api_key
+        self.model_name = model_name
+        self._model = None
+
+    def _get_model(self):
+        if self._model is None:
+            import google.generativeai as genai
+            try:
+                # El nombre del SDK ha cambiado en versiones recientes.
+                genai.configure(api_key=self.api_key)
+            except Exception as e:
+                logger.warning("Error al configurar la API de Google: %s", e)
+                # Esto no detendrá la aplicación, pero las llamadas a Gemini fallarán.
+            self._model = genai.GenerativeModel(self.model_name)
+        return self._model
+
+    async def generate(self, prompt: str) -> str:
+        response = await self._get_model().generate_content_async(prompt)
+        return response.text
+
+
+class FakeBackend:
+    """
+    Backend local para pruebas: responde el JSON que pide el prompt con un puntaje
+    derivado del hash del reporte; a los prompts de lote, el arreglo con una entrada
+    por clave. latency simula la ida y vuelta; failures hace fallar las primeras N
+    llamadas, failure_rate una fracción al azar y drop_rate omite esa fracción de las
+    claves de un lote.
+    """
+
+    def __init__(self, latency: float = 0.0, failures: int = 0, failure_rate: float = 0.0,
+                 drop_rate: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.failures = failures
+        self.failure_rate = failure_rate
+        self.drop_rate = drop_rate
+        self.calls = 0
+        self._random = random.Random(seed)
+
+    async def generate(self, prompt: str) -> str:
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.calls <= self.failures or self._random.random() < self.failure_rate:
+            raise RuntimeError("Fallo simulado del backend fake")
+
+        keys = _BATCH_KEY.findall(prompt)
+        if not keys:
+            return json.dumps(self._score(prompt))
+        return json.dumps([
+            {"key": key, **self._score(f"{key}\n{prompt}")}
+            for key in keys if self._random.random() >= self.drop_rate
+        ])
+
+    @staticmethod
+    def _score(text: str) -> dict:
+        digest = int(hashlib.sha256(text.encode()).hexdigest(), 16)
+        score = 300 + digest % 551
+        return {
+            "score": score,
+            "assessment": scorecard_service.assessment_for(score),
+            "reasoning": "Puntaje simulado por el backend de pruebas."
+        }
+
+# Claves de los reportes en el prompt de lote ({"key": "r0", "report": ...})
+_BATCH_KEY = re.compile(r'\{"key": "(r\d+)", "report"')
+
+# ===============================================
+# CIRCUIT BREAKER
+# ===============================================
+
+class CircuitBreaker:
+    """
+    Cerrado: las llamadas pasan. Tras failure_threshold fallos seguidos se abre y
+    rechaza todo durante reset_timeout segundos; luego deja pasar una llamada de
+    prueba (semiabierto) y se cierra si tiene éxito o vuelve a abrirse si falla.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def release_probe(self):
+        """Libera la llamada de prueba sin contarla (p. ej. si se canceló)"""
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._probing or self.failures >= self.failure_threshold:
+            if self.opened_at is None or self._probing:
+                logger.warning("Circuit breaker de Gemini abierto tras %d fallo(s)", self.failures)
+            self.opened_at = time.monotonic()
+        self._probing = False
+
+# ===============================================
+# CLIENTE
+# ===============================================
+
+class GeminiClient:
+    """
+    generate(prompt) con a lo sumo max_concurrency llamadas en curso por proceso.
+    Cada intento tiene timeout segundos; la llamada completa (espera del semáforo y
+    reintentos incluidos) tiene deadline segundos. Los reintentos esperan un backoff
+    exponencial con jitter completo.
+    """
+
+    def __init__(self, backend, max_concurrency: int, timeout: float, deadline: float,
+                 retries: int, backoff: float, breaker: CircuitBreaker):
+        self.backend = backend
+        self.timeout = timeout
+        self.deadline = deadline
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker = breaker
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def generate(self, prompt: str) -> str:
+        if not self.breaker.allow():
+            _count("circuit_open")
+            raise CircuitOpenError("El servicio de IA está temporalmente deshabilitado por fallos repetidos")
+        try:
+            text = await asyncio.wait_for(self._generate_with_retries(prompt), self.deadline)
+        except asyncio.CancelledError:
+            # La cancelación no dice nada del servicio; si era la llamada de prueba,
+            # hay que soltarla o el breaker quedaría semiabierto para siempre
+            self.breaker.release_probe()
+            raise
+        except Exception as e:
+            self.breaker.record_failure()
+            _count("timeout" if isinstance(e, asyncio.TimeoutError) else "error")
+            raise
+        self.breaker.record_success()
+        _count("ok")
+        return text
+
+    async def _generate_with_retries(self, prompt: str) -> str:
+        for attempt in range(self.retries + 1):
+            try:
+                # El semáforo cubre solo el intento: el backoff no ocupa un cupo
+                async with self._semaphore:
+                    return await asyncio.wait_for(self.backend.generate(prompt), self.timeout)
+            except Exception as e:
+                if attempt == self.retries:
+                    raise
+                delay = random.uniform(0, self.backoff * 2 ** attempt)
+                logger.info("Reintento %d de Gemini en %.2f s: %r", attempt + 1, delay, e)
+                await asyncio.sleep(delay)
+
+
+def _count(outcome: str):
+    registry.inc("gemini_calls_total", "Llamadas de puntaje a Gemini por resultado", {"outcome": outcome})
+
+def parse_json_response(text: str):
+    """JSON de la respuesta, sin el bloque ```json``` con el que a veces la envuelve el modelo"""
+    return json.loads(re.sub(r"```(?:json)?", "", text).strip())
+
+_client: Optional[GeminiClient] = None
+
+def get_gemini_client() -> GeminiClient:
+    """Cliente del proceso, creado en el primer uso según la configuración"""
+    global _client
+    if _client is None:
+        if settings.GEMINI_BACKEND == "fake":
+            backend = FakeBackend(latency=settings.GEMINI_FAKE_LATENCY_SECONDS)
+        else:
+            backend = GeminiBackend(settings.API_KEY)
+        _client = GeminiClient(
+            backend,
+            max_concurrency=settings.GEMINI_MAX_CONCURRENCY,
+            timeout=settings.GEMINI_TIMEOUT_SECONDS,
+            deadline=settings.GEMINI_DEADLINE_SECONDS,
+            retries=settings.GEMINI_RETRIES,
+            backoff=settings.GEMINI_RETRY_BACKOFF_SECONDS,
+            breaker=CircuitBreaker(settings.GEMINI_BREAKER_FAILURES, settings.GEMINI_BREAKER_RESET_SECONDS)
+        )
+    return _client
@@ -0,0 +1,171 @@
+"""
+Cola de trabajos de archivos - MIRIESGO v2
+Cola persistente sobre file_uploads.status y pool de procesos que la consumen
+"""
+
+import sys
+import os
+import logging
+import time
+import multiprocessing
+from datetime import timedelta
+from typing import List, Optional
+
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+
+# Agregar path para importar database
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + '/../..')
+
+from database import SessionLocal, FileUpload, FileUploadStatus
+from config import settings
+from services import file_processor_service
+from logging_setup import configure_logging
+
+logger = logging.getLogger("miriesgo.files")
+
+# ===============================================
+# OPERACIONES DE LA COLA
+# ===============================================
+
+def claim_next_upload(db: Session) -> Optional[int]:
+    """
+    Reclamar el archivo pendiente más antiguo.
+    El UPDATE condicionado al estado 'uploaded' garantiza que solo un worker
+    gane la carrera por cada archivo, sin depender de bloqueos del motor.
+    """
+    while True:
+        upload_id = db.execute(
+            select(FileUpload.id)
+            .where(FileUpload.status == FileUploadStatus.uploaded)
+            .order_by(FileUpload.id)
+            .limit(1)
+        ).scalar_one_or_none()
+        if upload_id is None:
+            return None
+
+        result = db.execute(
+            update(FileUpload)
+            .where(FileUpload.id == upload_id, FileUpload.status == FileUploadStatus.uploaded)
+            .values(status=FileUploadStatus.processing)
+        )
+        db.commit()
+        if result.rowcount == 1:
+            return upload_id
+
+def requeue_stale_uploads(db: Session, stale_after_minutes: int) -> int:
+    """
+    Devolver a la cola los archivos que quedaron en 'processing' sin progreso,
+    por ejemplo tras la caída de un worker. La ingesta es idempotente.
+    """
+    # updated_at lo escribe el motor: se compara con su propio reloj, no con el de la aplicación
+    now = db.execute(select(func.current_timestamp())).scalar()
+    cutoff = now - timedelta(minutes=stale_after_minutes)
+    result = db.execute(
+        update(FileUpload)
+        .where(FileUpload.status == FileUploadStatus.processing, FileUpload.updated_at < cutoff)
+        .values(status=FileUploadStatus.uploaded)
+    )
+    db.commit()
+    return result.rowcount
+
+# ===============================================
+# WORKERS
+# ===============================================
+
+def run_worker(stop_event=None, poll_interval: Optional[float] = None):
+    """Bucle de un worker: reclamar, procesar y esperar cuando no hay trabajo"""
+    # Los workers son procesos 'spawn': no heredan la configuración de logging
+    configure_logging()
+    poll_interval = poll_interval or settings.FILE_WORKER_POLL_SECONDS
+    while stop_event is None or not stop_event.is_set():
+        db = SessionLocal()
+        try:
+            upload_id = claim_next_upload(db)
+        except Exception as e:
+            logger.exception("Error reclamando archivos de la cola")
+            upload_id = None
+        finally:
+            db.close()
+
+        if upload_id is None:
+            if stop_event is not None:
+                stop_event.wait(poll_interval)
+            else:
+                time.sleep(poll_interval)
+            continue
+
+        try:
+            file_processor_service.process_fixed_width_file(upload_id)
+        except Exception as e:
+            logger.exception("Error procesando el archivo %s", upload_id)
+
+
+class FileWorkerPool:
+    """
+    Pool de procesos que consumen la cola de archivos.
+    Se usan procesos 'spawn' para no heredar conexiones abiertas del servidor
+    y para que el parseo no compita por el GIL con el event loop de la API.
+    """
+
+    def __init__(self, workers: int, poll_interval: float):
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self._context = multiprocessing.get_context("spawn")
+        self._stop_event = None
+        self._processes: List[multiprocessing.Process] = []
+
+    def start(self):
+        if self.workers <= 0 or self._processes:
+            return
+
+        db = SessionLocal()
+        try:
+            requeued = requeue_stale_uploads(db, settings.FILE_WORKER_STALE_MINUTES)
+            if requeued:
+                logger.info("%d archivo(s) devueltos a la cola", requeued)
+        finally:
+            db.close()
+
+        self._stop_event = self._context.Event()
+        for index in range(self.workers):
+            process = self._context.Process(
+                target=run_worker,
+                args=(self._stop_event, self.poll_interval),
+                name=f"file-worker-{index}",
+                daemon=True
+            )
+            process.start()
+            self._processes.append(process)
+        logger.info("%d worker(s) de archivos iniciados", self.workers)
+
+    def stop(self, timeout: float = 10.0):
+        if not self._processes:
+            return
+        self._stop_event.set()
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+        self._processes = []
+
+
+file_worker_pool = FileWorkerPool(
+    workers=settings.FILE_WORKERS,
+    poll_interval=settings.FILE_WORKER_POLL_SECONDS
+)
+
+# ===============================================
+# EJECUCIÓN INDEPENDIENTE
+# ===============================================
+
+if __name__ == "__main__":
+    # Permite correr los workers fuera del servidor API (FILE_WORKERS=0 en la API)
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else max(settings.FILE_WORKERS, 1)
+    pool = FileWorkerPool(workers=workers, poll_interval=settings.FILE_WORKER_POLL_SECONDS)
+    pool.start()
+    try:
+        for process in pool._processes:
+            process.join()
+    except KeyboardInterrupt:
+        pool.stop()
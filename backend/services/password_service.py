@@ -0,0 +1,71 @@
+"""
+Servicio de contraseñas - MIRIESGO v2
+Hash y verificación bcrypt en un pool de hilos dedicado y acotado
+"""
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from passlib.context import CryptContext
+
+from config import settings
+
+# ===============================================
+# CONFIGURACIÓN
+# ===============================================
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+# bcrypt libera el GIL mientras calcula, así que varios hilos aprovechan varios núcleos.
+# El tamaño del pool acota cuántos hashes corren a la vez; el resto espera en cola
+# sin ocupar el event loop ni los hilos del threadpool de FastAPI.
+# El pool se crea en el primer uso y se vuelve a crear si shutdown() lo detuvo
+# (p. ej. otro ciclo de vida de la app en el mismo proceso, como en las pruebas).
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.PASSWORD_HASH_WORKERS,
+                thread_name_prefix="password-hash"
+            )
+        return _executor
+
+# ===============================================
+# API ASÍNCRONA (rutas async def)
+# ===============================================
+
+async def hash_password_async(password: str) -> str:
+    """Cifrar contraseña sin bloquear el event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), pwd_context.hash, password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Verificar contraseña sin bloquear el event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), pwd_context.verify, plain_password, hashed_password)
+
+# ===============================================
+# API SÍNCRONA (rutas def, scripts y crud)
+# ===============================================
+
+def hash_password(password: str) -> str:
+    """Cifrar contraseña en el pool; bloquea al llamador pero respeta el límite de concurrencia"""
+    return _get_executor().submit(pwd_context.hash, password).result()
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    """Verificar contraseña en el pool; bloquea al llamador pero respeta el límite de concurrencia"""
+    return _get_executor().submit(pwd_context.verify, plain_password, hashed_password).result()
+
+def shutdown(wait: bool = True):
+    """Detener el pool al apagar el servidor; el siguiente hash crea uno nuevo"""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=wait)
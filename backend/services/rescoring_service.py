@@ -0,0 +1,322 @@
+"""
+Servicio de recálculo de puntajes - MIRIESGO v2
+Corrida por lotes que vuelve a calcular con el scorecard local el puntaje de los clientes
+cuyos préstamos o cuotas cambiaron desde la última corrida completada, por bloques y en
+varios procesos, y lo escribe con INSERT multi-fila en credit_reports. Cada corrida queda
+registrada en scoring_runs con su throughput.
+
+Los tableros de riesgo leen el último credit_reports de cada cliente en lugar de calcular
+el puntaje en línea.
+"""
+
+import sys
+import os
+import logging
+import multiprocessing
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from itertools import repeat
+from typing import List, Optional
+
+import numpy as np
+from sqlalchemy import case, func, insert, or_, select, union, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+# Agregar path para importar database
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + '/../..')
+
+from database import SessionLocal, CreditReport, JobLock, ReportType, ScoringRun, ScoringRunStatus, User
+from config import settings
+from services import scorecard_service
+import models
+
+logger = logging.getLogger("miriesgo.scoring")
+
+JOB_USER = "rescoring_job"
+# Estados de préstamo que cuentan como activos (los mismos del resumen de deuda)
+CLOSED_LOAN_STATUSES = ("Pagado", "Cancelado")
+# Nivel de riesgo de credit_reports por evaluación (índice en scorecard_service.ASSESSMENTS)
+RISK_LEVEL_VALUES = ("critical", "high", "medium", "low", "low")
+
+# ===============================================
+# SELECCIÓN DE CLIENTES
+# ===============================================
+
+def changed_client_ids(db: Session, since: Optional[datetime]) -> np.ndarray:
+    """
+    Clientes con préstamos, cuotas o marcas modificados después de since (todos si es None).
+    Las marcas agregadas se ven por client_flags.created_at; las borradas, por
+    clients.updated_at, que crud.update_client actualiza al cambiar las marcas.
+    """
+    if since is None:
+        statement = select(models.Loan.client_id).distinct()
+    else:
+        statement = union(
+            select(models.Loan.client_id).where(models.Loan.updated_at > since),
+            select(models.Loan.client_id)
+            .join(models.Payment, models.Payment.loan_id == models.Loan.id)
+            .where(models.Payment.updated_at > since),
+            select(models.ClientFlag.client_id).where(models.ClientFlag.created_at > since),
+            select(models.Client.id).where(models.Client.updated_at > since)
+        )
+    return np.unique(np.array(db.execute(statement).scalars().all(), dtype=np.int64))
+
+def last_completed_run(db: Session) -> Optional[ScoringRun]:
+    return db.execute(
+        select(ScoringRun)
+        .where(ScoringRun.status == ScoringRunStatus.completed)
+        .order_by(ScoringRun.started_at.desc())
+        .limit(1)
+    ).scalar_one_or_none()
+
+# ===============================================
+# CANDADO DE LA CORRIDA
+# ===============================================
+
+RUN_LOCK = "rescoring"
+
+def acquire_run_lock(db: Session, now: datetime) -> Optional[str]:
+    """
+    Tomar el candado de la corrida entre procesos; retorna el token o None si otro lo tiene.
+    El UPDATE condicionado a que el candado esté libre o vencido es atómico: de dos
+    procesos que lo intentan a la vez, solo uno afecta la fila.
+    """
+    if db.get(JobLock, RUN_LOCK) is None:
+        try:
+            db.add(JobLock(name=RUN_LOCK))
+            db.commit()
+        except IntegrityError:
+            # Otro proceso creó la fila al mismo tiempo
+            db.rollback()
+
+    token = uuid.uuid4().hex
+    result = db.execute(
+        update(JobLock)
+        .where(
+            JobLock.name == RUN_LOCK,
+            or_(JobLock.locked_until.is_(None), JobLock.locked_until < now)
+        )
+        .values(locked_by=token, locked_until=now + timedelta(minutes=settings.RESCORING_STALE_MINUTES))
+    )
+    db.commit()
+    return token if result.rowcount == 1 else None
+
+def release_run_lock(db: Session, token: str):
+    """Liberar el candado si sigue siendo nuestro (pudo vencer y tomarlo otro proceso)"""
+    db.execute(
+        update(JobLock)
+        .where(JobLock.name == RUN_LOCK, JobLock.locked_by == token)
+        .values(locked_by=None, locked_until=None)
+    )
+    db.commit()
+
+# ===============================================
+# BLOQUES (se ejecutan en los procesos del pool)
+# ===============================================
+
+def _loan_summary(db: Session, client_ids: List[int]) -> dict:
+    """client_id -> (empresa del préstamo más reciente, préstamos activos, saldo total)"""
+    latest = (
+        select(
+            models.Loan.client_id,
+            func.max(models.Loan.id).label("loan_id"),
+            func.sum(case((models.Loan.status.in_(CLOSED_LOAN_STATUSES), 0), else_=1)).label("active"),
+            func.sum(models.Loan.current_balance).label("balance"),
+        )
+        .where(models.Loan.client_id.in_(client_ids))
+        .group_by(models.Loan.client_id)
+        .subquery()
+    )
+    rows = db.execute(
+        select(latest.c.client_id, models.Loan.company_id, latest.c.active, latest.c.balance)
+        .join(models.Loan, models.Loan.id == latest.c.loan_id)
+    ).all()
+    return {client_id: (company_id, active, balance) for client_id, company_id, active, balance in rows}
+
+def score_chunk(client_ids: List[int], run_id: int, user_id: int) -> int:
+    """Calcular y escribir los puntajes de un bloque de clientes; retorna las filas escritas"""
+    db = SessionLocal()
+    try:
+        ids, features = scorecard_service.features_from_db(db, client_ids)
+        result = scorecard_service.score_features(features)
+        summary = _loan_summary(db, ids.tolist())
+
+        rows = []
+        for index, client_id in enumerate(ids.tolist()):
+            if client_id not in summary:
+                continue
+            company_id, active, balance = summary[client_id]
+            score = result.risk_score(index)
+            rows.append({
+                "client_id": client_id,
+                "requested_by_user_id": user_id,
+                "requested_by_company_id": company_id,
+                "report_type": ReportType.basic,
+                "credit_score": score.score,
+                "risk_level": RISK_LEVEL_VALUES[result.assessment_codes[index]],
+                "total_active_loans": active,
+                "total_debt_amount": balance,
+                "report_data": {"source": "batch", "run_id": run_id, "risk_score": score.model_dump()},
+                "created_user": JOB_USER,
+            })
+        if rows:
+            db.execute(insert(CreditReport), rows)
+            db.commit()
+        return len(rows)
+    finally:
+        db.close()
+
+# ===============================================
+# CORRIDA
+# ===============================================
+
+def _job_user_id(db: Session) -> int:
+    """credit_reports exige un usuario solicitante: se usa RESCORING_USER_EMAIL"""
+    user_id = db.execute(select(User.id).where(User.email == settings.RESCORING_USER_EMAIL)).scalar_one_or_none()
+    if user_id is None:
+        raise RuntimeError(f"No existe el usuario {settings.RESCORING_USER_EMAIL} (RESCORING_USER_EMAIL)")
+    return user_id
+
+def run_rescoring(workers: Optional[int] = None, chunk_size: Optional[int] = None,
+                  full: bool = False) -> Optional[ScoringRun]:
+    """
+    Ejecutar una corrida. Con full=True recalcula todos los clientes con préstamos.
+    Retorna la corrida registrada, o None si ya hay otra en curso.
+    """
+    workers = workers if workers is not None else settings.RESCORING_WORKERS
+    chunk_size = chunk_size or settings.RESCORING_CHUNK_SIZE
+
+    db = SessionLocal()
+    try:
+        # Se usa el reloj de la base: updated_at lo escribe el motor, no la aplicación
+        now = db.execute(select(func.current_timestamp())).scalar()
+        token = acquire_run_lock(db, now)
+        if token is None:
+            logger.info("Recálculo de puntajes omitido: otra corrida sigue en curso")
+            return None
+
+        try:
+            previous = None if full else last_completed_run(db)
+            run = ScoringRun(
+                status=ScoringRunStatus.running,
+                changed_since=previous.started_at if previous else None,
+                started_at=now,
+                workers=max(workers, 1),
+                created_user=JOB_USER
+            )
+            db.add(run)
+            db.commit()
+
+            start = time.perf_counter()
+            try:
+                user_id = _job_user_id(db)
+                client_ids = changed_client_ids(db, run.changed_since)
+                chunks = [client_ids[i:i + chunk_size].tolist() for i in range(0, client_ids.size, chunk_size)]
+
+                if workers <= 1 or len(chunks) <= 1:
+                    scored = sum(score_chunk(chunk, run.id, user_id) for chunk in chunks)
+                else:
+                    # Procesos 'spawn', como los workers de archivos: no heredan conexiones abiertas
+                    with ProcessPoolExecutor(
+                        max_workers=min(workers, len(chunks)),
+                        mp_context=multiprocessing.get_context("spawn")
+                    ) as pool:
+                        scored = sum(pool.map(score_chunk, chunks, repeat(run.id), repeat(user_id)))
+
+                elapsed = time.perf_counter() - start
+                run.status = ScoringRunStatus.completed
+                run.clients_scored = scored
+                run.chunks = len(chunks)
+                run.duration_seconds = round(elapsed, 3)
+                run.clients_per_second = round(scored / elapsed, 2) if elapsed else 0
+                logger.info(
+                    "Recálculo de puntajes %s: %d clientes en %d bloques, %.1f s (%.0f clientes/s)",
+                    run.id, scored, len(chunks), elapsed, scored / elapsed if elapsed else 0
+                )
+            except Exception as e:
+                db.rollback()
+                run.status = ScoringRunStatus.failed
+                run.duration_seconds = round(time.perf_counter() - start, 3)
+                run.error_details = str(e)
+                logger.exception("Error en el recálculo de puntajes %s", run.id)
+
+            run.finished_at = db.execute(select(func.current_timestamp())).scalar()
+            db.commit()
+            db.refresh(run)
+            return run
+        finally:
+            # Sesión aparte: la de la corrida puede haber quedado en un estado inválido
+            with SessionLocal() as lock_db:
+                release_run_lock(lock_db, token)
+    finally:
+        db.close()
+
+# ===============================================
+# PROGRAMACIÓN
+# ===============================================
+
+class RescoringScheduler:
+    """
+    Hilo que ejecuta el recálculo cada interval_minutes. Si hay varios procesos del
+    servidor, las corridas no se superponen: la siguiente se omite mientras otra
+    tenga el candado de job_locks.
+    """
+
+    def __init__(self, interval_minutes: int):
+        self.interval_minutes = interval_minutes
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval_minutes * 60):
+            try:
+                run_rescoring()
+            except Exception:
+                logger.exception("Error programando el recálculo de puntajes")
+
+    def start(self):
+        if self.interval_minutes <= 0 or self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="rescoring-scheduler", daemon=True)
+        self._thread.start()
+        logger.info("Recálculo de puntajes programado cada %d minuto(s)", self.interval_minutes)
+
+    def stop(self, timeout: float = 5.0):
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+
+rescoring_scheduler = RescoringScheduler(settings.RESCORING_INTERVAL_MINUTES)
+
+# ===============================================
+# EJECUCIÓN INDEPENDIENTE
+# ===============================================
+
+if __name__ == "__main__":
+    # Para cron o ejecución manual (RESCORING_INTERVAL_MINUTES=0 en la API):
+    #   python -m services.rescoring_service [--full] [--workers N] [--chunk-size N]
+    import argparse
+    from logging_setup import configure_logging
+
+    parser = argparse.ArgumentParser(description="Recálculo de puntajes por lotes")
+    parser.add_argument("--full", action="store_true", help="Recalcular todos los clientes con préstamos")
+    parser.add_argument("--workers", type=int, default=settings.RESCORING_WORKERS)
+    parser.add_argument("--chunk-size", type=int, default=settings.RESCORING_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    configure_logging()
+    result = run_rescoring(workers=args.workers, chunk_size=args.chunk_size, full=args.full)
+    if result is None:
+        print("Otra corrida sigue en curso")
+    else:
+        print(f"Corrida {result.id}: {result.status.value}, {result.clients_scored} clientes, "
+              f"{result.duration_seconds} s ({result.clients_per_second} clientes/s)")
+        sys.exit(0 if result.status == ScoringRunStatus.completed else 1)
@@ -0,0 +1,280 @@
+"""
+Servicio de scorecard de riesgo - MIRIESGO v2
+Puntaje crediticio local y determinista en la escala 300-850, calculado con arreglos
+numpy: una sola pasada vectorizada sirve igual para un cliente que para un millón.
+
+Usa los mismos factores que el prompt de Gemini: historial de pagos, saldo actual frente
+al monto original, estado de los créditos, cantidad de créditos y banderas del cliente.
+"""
+
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import case, func, select
+from sqlalchemy.orm import Session
+
+import models, schemas
+
+# ===============================================
+# TABLA DE PUNTOS
+# ===============================================
+
+SCORE_MIN, SCORE_MAX = 300, 850
+BASE_POINTS = 680
+
+# Límite inferior de cada banda -> evaluación (las bandas del prompt de Gemini)
+ASSESSMENT_BOUNDS = np.array([580, 670, 740, 800])
+ASSESSMENTS = ("Muy Alto", "Alto", "Medio", "Bajo", "Muy Bajo")
+
+# Severidad del peor estado entre los créditos del cliente y sus puntos
+STATUS_SEVERITY = {
+    "Vigente": 0, "Pagado": 0, "Cancelado": 0,
+    "Siniestrado": 1,
+    "En Mora": 2,
+    "En Jurídica": 3, "Embargo": 3,
+    "Castigado": 4,
+    "Fraudulento": 5,
+}
+SEVERITY_POINTS = np.array([0, -20, -80, -160, -220, -300])
+
+# Cuotas pagadas sobre cuotas vencidas (pagadas + en mora) -> puntos
+PAYMENT_RATIO = (0.0, 0.5, 0.8, 0.95, 1.0)
+PAYMENT_POINTS = (-200, -120, -40, 40, 90)
+
+# Saldo actual sobre monto original -> puntos
+UTILIZATION_RATIO = (0.0, 0.3, 0.6, 0.9, 1.2)
+UTILIZATION_POINTS = (60, 40, 0, -40, -80)
+
+# Cantidad de créditos -> puntos (historial corto o demasiados créditos restan)
+CREDIT_COUNTS = (0, 1, 3, 6, 10)
+CREDIT_POINTS = (-30, 0, 20, 0, -40)
+
+# Puntos por bandera del cliente (se suman si tiene varias)
+FLAG_POINTS = {
+    "Fraude": -250,
+    "Robo de identidad": -200,
+    "Estafa": -200,
+    "Proceso jurídico": -100,
+    "Múltiples moras": -80,
+    "Cliente VIP": 20,
+}
+
+# Factores en el orden de las columnas de contribuciones
+PAYMENTS, UTILIZATION, STATUS, CREDITS, FLAGS = range(5)
+
+# Justificaciones (máximo 15 palabras, como pide el prompt); se guardan como códigos
+REASONS = (
+    "Excelente historial de pagos y bajo endeudamiento.",
+    "Historial de pagos con cuotas en mora.",
+    "Saldo actual alto frente al monto original de los créditos.",
+    "Historial crediticio corto o con demasiados créditos.",
+    "Banderas de fraude o alerta en el perfil del cliente.",
+    # Factor estado, por severidad (1-5)
+    "Tiene créditos siniestrados.",
+    "Tiene créditos en mora.",
+    "Tiene créditos en jurídica o con embargo.",
+    "Tiene créditos castigados.",
+    "Tiene créditos reportados como fraudulentos.",
+)
+_FACTOR_REASON = np.array([1, 2, 0, 3, 4])
+_STATUS_REASON_OFFSET = 4
+
+# ===============================================
+# VARIABLES Y RESULTADO
+# ===============================================
+
+@dataclass
+class ScorecardFeatures:
+    """Variables por cliente: un arreglo por variable, todos del mismo largo"""
+    credits: np.ndarray
+    original_amount: np.ndarray
+    current_balance: np.ndarray
+    worst_status: np.ndarray
+    installments_paid: np.ndarray
+    installments_late: np.ndarray
+    flag_points: np.ndarray
+
+    def __len__(self) -> int:
+        return self.credits.size
+
+    @classmethod
+    def empty(cls, size: int) -> "ScorecardFeatures":
+        return cls(
+            credits=np.zeros(size, dtype=np.int64),
+            original_amount=np.zeros(size),
+            current_balance=np.zeros(size),
+            worst_status=np.zeros(size, dtype=np.int64),
+            installments_paid=np.zeros(size, dtype=np.int64),
+            installments_late=np.zeros(size, dtype=np.int64),
+            flag_points=np.zeros(size),
+        )
+
+
+@dataclass
+class ScorecardResult:
+    """
+    Puntajes de una pasada. Evaluación y justificación se guardan como códigos
+    (índices en ASSESSMENTS y REASONS) para no crear millones de cadenas.
+    """
+    scores: np.ndarray
+    assessment_codes: np.ndarray
+    reason_codes: np.ndarray
+
+    def __len__(self) -> int:
+        return self.scores.size
+
+    def risk_score(self, index: int) -> schemas.RiskScore:
+        return schemas.RiskScore(
+            score=int(self.scores[index]),
+            assessment=ASSESSMENTS[self.assessment_codes[index]],
+            reasoning=REASONS[self.reason_codes[index]]
+        )
+
+    def risk_scores(self) -> List[schemas.RiskScore]:
+        return [self.risk_score(index) for index in range(len(self))]
+
+# ===============================================
+# CÁLCULO VECTORIZADO
+# ===============================================
+
+def assessment_codes(scores: np.ndarray) -> np.ndarray:
+    return np.searchsorted(ASSESSMENT_BOUNDS, scores, side="right").astype(np.int8)
+
+def assessment_for(score: int) -> str:
+    return ASSESSMENTS[int(assessment_codes(np.array([score]))[0])]
+
+def contributions(features: ScorecardFeatures) -> np.ndarray:
+    """Puntos de cada factor por cliente: matriz (clientes, factores)"""
+    size = len(features)
+    due = features.installments_paid + features.installments_late
+    on_time = np.divide(features.installments_paid, due, out=np.ones(size), where=due > 0)
+    utilization = np.divide(
+        features.current_balance, features.original_amount,
+        out=np.zeros(size), where=features.original_amount > 0
+    )
+
+    points = np.empty((size, 5))
+    # Sin cuotas vencidas o sin créditos el factor es neutro
+    points[:, PAYMENTS] = np.where(due > 0, np.interp(on_time, PAYMENT_RATIO, PAYMENT_POINTS), 0.0)
+    points[:, UTILIZATION] = np.where(
+        features.credits > 0, np.interp(utilization, UTILIZATION_RATIO, UTILIZATION_POINTS), 0.0
+    )
+    points[:, STATUS] = SEVERITY_POINTS[features.worst_status]
+    points[:, CREDITS] = np.interp(features.credits, CREDIT_COUNTS, CREDIT_POINTS)
+    points[:, FLAGS] = features.flag_points
+    return points
+
+def score_features(features: ScorecardFeatures) -> ScorecardResult:
+    """Puntaje, evaluación y factor principal de cada cliente en una sola pasada"""
+    points = contributions(features)
+    scores = np.clip(np.rint(BASE_POINTS + points.sum(axis=1)), SCORE_MIN, SCORE_MAX).astype(np.int16)
+
+    # La justificación es el factor que más resta; si ninguno resta, la positiva
+    worst = points.argmin(axis=1)
+    reasons = np.where(
+        worst == STATUS, _STATUS_REASON_OFFSET + features.worst_status, _FACTOR_REASON[worst]
+    )
+    reasons = np.where(points.min(axis=1) < 0, reasons, 0).astype(np.int8)
+    return ScorecardResult(scores=scores, assessment_codes=assessment_codes(scores), reason_codes=reasons)
+
+# ===============================================
+# VARIABLES DESDE REPORTES
+# ===============================================
+
+def _field(data: dict, *keys, default=None):
+    """El frontend envía el reporte en camelCase o tal como lo genera la API (snake_case)"""
+    for key in keys:
+        if data.get(key) is not None:
+            return data[key]
+    return default
+
+def features_from_reports(reports: Sequence[dict]) -> ScorecardFeatures:
+    """Variables de reportes de crédito con la forma de CreditReportSchema"""
+    features = ScorecardFeatures.empty(len(reports))
+    for index, report in enumerate(reports):
+        loans = report.get("loans") or []
+        features.credits[index] = len(loans)
+        for loan in loans:
+            features.original_amount[index] += float(_field(loan, "original_amount", "originalAmount", default=0))
+            features.current_balance[index] += float(_field(loan, "current_balance", "currentBalance", default=0))
+            severity = STATUS_SEVERITY.get(loan.get("status"), 0)
+            features.worst_status[index] = max(features.worst_status[index], severity)
+            for payment in loan.get("payments") or []:
+                status = payment.get("status")
+                features.installments_paid[index] += status == "Pagado"
+                features.installments_late[index] += status == "En Mora"
+        flags = (report.get("client") or {}).get("flags") or []
+        features.flag_points[index] = sum(FLAG_POINTS.get(flag, 0) for flag in set(flags))
+    return features
+
+def score_reports(reports: Sequence[dict]) -> List[schemas.RiskScore]:
+    return score_features(features_from_reports(reports)).risk_scores()
+
+def score_report(report: dict) -> schemas.RiskScore:
+    return score_reports([report])[0]
+
+def blend(local: schemas.RiskScore, remote: schemas.RiskScore, remote_weight: float) -> schemas.RiskScore:
+    """Promedio ponderado del scorecard y del LLM; la justificación es la del LLM"""
+    remote_weight = min(max(remote_weight, 0.0), 1.0)
+    score = int(round(remote_weight * remote.score + (1 - remote_weight) * local.score))
+    score = min(max(score, SCORE_MIN), SCORE_MAX)
+    return schemas.RiskScore(score=score, assessment=assessment_for(score), reasoning=remote.reasoning)
+
+# ===============================================
+# VARIABLES DESDE LA BASE DE DATOS
+# ===============================================
+
+def _positions(client_ids: np.ndarray, rows) -> Tuple[np.ndarray, np.ndarray]:
+    """Filas (client_id, ...) -> posiciones en client_ids y matriz de valores"""
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty((0, 0))
+    data = np.array(rows, dtype=float)
+    return np.searchsorted(client_ids, data[:, 0].astype(np.int64)), data[:, 1:]
+
+def features_from_db(db: Session, client_ids: Optional[Sequence[int]] = None) -> Tuple[np.ndarray, ScorecardFeatures]:
+    """
+    Variables de todos los clientes (o de client_ids) con tres consultas agrupadas:
+    préstamos, cuotas y banderas. Retorna los ids ordenados y sus variables.
+    """
+    if client_ids is None:
+        ids = np.array(db.execute(select(models.Client.id).order_by(models.Client.id)).scalars().all(), dtype=np.int64)
+    else:
+        ids = np.unique(np.asarray(client_ids, dtype=np.int64))
+    features = ScorecardFeatures.empty(ids.size)
+    if not ids.size:
+        return ids, features
+
+    def scoped(statement, column):
+        return statement if client_ids is None else statement.where(column.in_(ids.tolist()))
+
+    severity = case(STATUS_SEVERITY, value=models.Loan.status, else_=0)
+    loans = scoped(select(
+        models.Loan.client_id, func.count(), func.sum(models.Loan.original_amount),
+        func.sum(models.Loan.current_balance), func.max(severity)
+    ), models.Loan.client_id).group_by(models.Loan.client_id)
+    positions, values = _positions(ids, db.execute(loans).all())
+    if positions.size:
+        features.credits[positions] = values[:, 0]
+        features.original_amount[positions] = values[:, 1]
+        features.current_balance[positions] = values[:, 2]
+        features.worst_status[positions] = values[:, 3]
+
+    payments = scoped(select(
+        models.Loan.client_id,
+        func.sum(case((models.Payment.status == "Pagado", 1), else_=0)),
+        func.sum(case((models.Payment.status == "En Mora", 1), else_=0))
+    ).join(models.Payment, models.Payment.loan_id == models.Loan.id), models.Loan.client_id).group_by(models.Loan.client_id)
+    positions, values = _positions(ids, db.execute(payments).all())
+    if positions.size:
+        features.installments_paid[positions] = values[:, 0]
+        features.installments_late[positions] = values[:, 1]
+
+    flags = scoped(select(
+        models.ClientFlag.client_id, func.sum(case(FLAG_POINTS, value=models.ClientFlag.flag, else_=0))
+    ), models.ClientFlag.client_id).group_by(models.ClientFlag.client_id)
+    positions, values = _positions(ids, db.execute(flags).all())
+    if positions.size:
+        features.flag_points[positions] = values[:, 0]
+
+    return ids, features
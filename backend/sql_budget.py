@@ -0,0 +1,192 @@
+"""
+Presupuesto de SQL por petición - MIRIESGO v2
+Detector de N+1 para desarrollo y pruebas: cuenta las sentencias de cada petición,
+agrupa las que tienen la misma forma y avisa (o falla) cuando una ruta excede su presupuesto.
+
+Uso en rutas:
+    @router.get("/...")
+    @sql_budget(5)
+    def endpoint(...): ...
+
+Uso en pruebas:
+    with assert_sql_budget(3):
+        crud.get_full_credit_report(db, "123")
+"""
+
+import logging
+import re
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional, Tuple
+
+from sqlalchemy import event
+
+logger = logging.getLogger("miriesgo.sql_budget")
+
+# Placeholders de parámetros de los distintos drivers (?, %s, %(name)s, :name)
+_PLACEHOLDER = r"(?:\?|%s|%\(\w+\)s|:\w+)"
+_IN_LIST = re.compile(r"\(\s*" + _PLACEHOLDER + r"(?:\s*,\s*" + _PLACEHOLDER + r")*\s*\)")
+_NUMBER = re.compile(r"\b\d+\b")
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_SPACES = re.compile(r"\s+")
+
+class SQLBudgetExceeded(AssertionError):
+    """Una petición o bloque ejecutó más SQL del presupuestado"""
+
+
+def statement_shape(statement: str) -> str:
+    """Forma normalizada de una sentencia: sin literales y con las listas IN colapsadas"""
+    shape = _STRING.sub("?", statement)
+    shape = _NUMBER.sub("?", shape)
+    shape = _IN_LIST.sub("(?...)", shape)
+    return _SPACES.sub(" ", shape).strip()
+
+
+class SQLTracker:
+    """Sentencias ejecutadas dentro de una petición o bloque, agrupadas por forma"""
+
+    def __init__(self, max_statements: Optional[int], max_repeats: Optional[int], label: str,
+                 raise_on_violation: bool = True):
+        self.max_statements = max_statements
+        self.max_repeats = max_repeats
+        self.label = label
+        self.raise_on_violation = raise_on_violation
+        self.shapes: Counter = Counter()
+
+    @property
+    def statements(self) -> int:
+        return sum(self.shapes.values())
+
+    def record(self, statement: str):
+        self.shapes[statement_shape(statement)] += 1
+
+    def repeated(self) -> List[Tuple[str, int]]:
+        """Formas que superan max_repeats: el síntoma típico de un N+1"""
+        if self.max_repeats is None:
+            return []
+        return [(shape, count) for shape, count in self.shapes.most_common() if count > self.max_repeats]
+
+    def violations(self) -> List[str]:
+        problems = []
+        if self.max_statements is not None and self.statements > self.max_statements:
+            problems.append(f"{self.statements} sentencias (presupuesto {self.max_statements})")
+        for shape, count in self.repeated():
+            problems.append(f"{count}x {shape[:200]}")
+        return problems
+
+    def check(self, raise_on_violation: Optional[bool] = None):
+        if raise_on_violation is None:
+            raise_on_violation = self.raise_on_violation
+        problems = self.violations()
+        if not problems:
+            return
+        message = f"Presupuesto SQL excedido en {self.label}: " + "; ".join(problems)
+        if raise_on_violation:
+            raise SQLBudgetExceeded(message)
+        logger.warning(message)
+
+
+_tracker: ContextVar[Optional[SQLTracker]] = ContextVar("sql_budget_tracker", default=None)
+_instrumented = set()
+
+def instrument_engine(engine):
+    """Registrar el contador de sentencias en el engine (idempotente)"""
+    if id(engine) in _instrumented:
+        return
+    _instrumented.add(id(engine))
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _count_statement(conn, cursor, statement, parameters, context, executemany):
+        tracker = _tracker.get()
+        if tracker is not None:
+            tracker.record(statement)
+
+# ===============================================
+# PRESUPUESTOS DECLARADOS
+# ===============================================
+
+def sql_budget(max_statements: int, max_repeats: Optional[int] = None):
+    """
+    Declarar el presupuesto de una ruta. No envuelve la función (FastAPI ve la
+    misma firma); solo la marca para que el middleware la evalúe.
+    """
+    def decorator(func):
+        func.__sql_budget__ = (max_statements, max_repeats)
+        return func
+    return decorator
+
+@contextmanager
+def assert_sql_budget(max_statements: Optional[int] = None, max_repeats: Optional[int] = None,
+                      label: str = "bloque"):
+    """Context manager para pruebas: falla si el bloque excede el presupuesto"""
+    from database import get_engine
+    instrument_engine(get_engine())
+
+    tracker = SQLTracker(max_statements, max_repeats, label)
+    token = _tracker.set(tracker)
+    try:
+        yield tracker
+    finally:
+        _tracker.reset(token)
+    tracker.check(raise_on_violation=True)
+
+@contextmanager
+def separate_sql_budget(max_statements: int, max_repeats: Optional[int] = None, label: str = "bloque"):
+    """
+    Presupuesto propio para un bloque dentro de una petición, p. ej. cada página de
+    una respuesta en streaming: sus sentencias no cuentan para la petición. Solo actúa
+    si el middleware está rastreando la petición, y con su mismo modo.
+    """
+    outer = _tracker.get()
+    if outer is None:
+        yield None
+        return
+
+    tracker = SQLTracker(max_statements, max_repeats, f"{outer.label} ({label})", outer.raise_on_violation)
+    token = _tracker.set(tracker)
+    try:
+        yield tracker
+    finally:
+        _tracker.reset(token)
+    tracker.check()
+
+# ===============================================
+# MIDDLEWARE
+# ===============================================
+
+class SQLBudgetMiddleware:
+    """
+    Middleware ASGI que rastrea las sentencias de cada petición. Usa el presupuesto
+    declarado con @sql_budget o, si no hay, los valores por defecto. En modo 'raise'
+    la excepción se lanza al terminar la petición (el TestClient la propaga a la prueba).
+    """
+
+    def __init__(self, app, mode: str = "log", default_max_statements: Optional[int] = None,
+                 default_max_repeats: Optional[int] = None):
+        self.app = app
+        self.mode = mode
+        self.default_max_statements = default_max_statements
+        self.default_max_repeats = default_max_repeats
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        tracker = SQLTracker(self.default_max_statements, self.default_max_repeats,
+                             f"{scope['method']} {scope['path']}", self.mode == "raise")
+        token = _tracker.set(tracker)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _tracker.reset(token)
+
+        # El presupuesto declarado reemplaza por completo a los valores por defecto
+        budget = getattr(scope.get("endpoint"), "__sql_budget__", None)
+        if budget is not None:
+            tracker.max_statements, tracker.max_repeats = budget
+        route = scope.get("route")
+        if route is not None:
+            tracker.label = f"{scope['method']} {route.path}"
+        tracker.check()
@@ -0,0 +1,104 @@
+"""
+Fixtures de las pruebas de la API - MIRIESGO v2
+Las pruebas corren la aplicación en proceso contra una base SQLite temporal sembrada
+con el generador de cartera sintética (el mismo esquema que usa benchmarks.api_suite).
+
+Uso (desde backend/):
+    python -m pytest tests
+"""
+
+import os
+import sys
+import tempfile
+from datetime import date
+
+# La configuración se lee al importar config: el entorno se fija antes de importar la app.
+# La URL de SQLite es relativa al directorio de trabajo, que pasa a ser uno temporal
+WORKDIR = tempfile.mkdtemp(prefix="miriesgo_tests_")
+os.environ.update({
+    "DB_BACKEND": "sqlite",
+    "UPLOAD_DIRECTORY": "uploads",
+    "FILE_WORKERS": "0",
+    "RESCORING_INTERVAL_MINUTES": "0",
+    "GEMINI_BACKEND": "fake",
+    "RISK_SCORE_MODE": "scorecard",
+    "LOG_LEVEL": "WARNING",
+    "LOG_FORMAT": "text",
+    # Las rutas con @sql_budget fallan en las pruebas si exceden su presupuesto
+    "SQL_BUDGET_MODE": "raise",
+})
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [BACKEND_DIR, os.path.dirname(BACKEND_DIR)]
+
+import pytest
+
+CUTOFF = date(2025, 6, 30)
+COMPANIES = 2
+CLIENTS = 200
+SEED = 11
+ANALYST_EMAIL = "analista.pruebas@miriesgo.local"
+
+
+def pytest_sessionstart(session):
+    # Después de resolver testpaths, antes de que se cree el engine
+    os.chdir(WORKDIR)
+
+
+@pytest.fixture(scope="session")
+def portfolio():
+    """Base sembrada: PortfolioSpec, [(id, código)] de las empresas y usuarios de prueba"""
+    # La app registra sus hooks (clase de pool, métricas) antes de que se cree el engine
+    import main  # noqa: F401
+    from benchmarks.api_suite import BENCH_EMAIL, ensure_bench_user, prepare_schema
+    from benchmarks.synthetic_portfolio import PortfolioSpec, build_portfolio, ensure_companies
+    from database import SessionLocal, User, UserRole
+    from services.password_service import hash_password
+
+    prepare_schema()
+    spec = PortfolioSpec(companies=COMPANIES, clients=CLIENTS, seed=SEED, cutoff=CUTOFF)
+    build_portfolio(spec)
+    ensure_bench_user()
+
+    db = SessionLocal()
+    try:
+        companies = ensure_companies(db, COMPANIES)
+        db.add(User(
+            full_name="Analista Pruebas",
+            national_identifier="TEST-ANALYST",
+            email=ANALYST_EMAIL,
+            phone="0000000000",
+            password_hash=hash_password("AnalystPass123!"),
+            role=UserRole.analyst,
+            company_id=companies[0][0],
+            created_user="pruebas"
+        ))
+        db.commit()
+    finally:
+        db.close()
+    return {"spec": spec, "companies": companies, "admin": BENCH_EMAIL, "analyst": ANALYST_EMAIL}
+
+
+@pytest.fixture(scope="session")
+def client(portfolio):
+    from fastapi.testclient import TestClient
+    from main import app
+
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+def _headers(email: str) -> dict:
+    # Las rutas de backend/auth.py validan su propio JWT (sin sesión)
+    import auth
+    return {"Authorization": f"Bearer {auth.create_access_token({'sub': email})}"}
+
+
+@pytest.fixture
+def admin_headers(portfolio) -> dict:
+    return _headers(portfolio["admin"])
+
+
+@pytest.fixture
+def analyst_headers(portfolio) -> dict:
+    return _headers(portfolio["analyst"])
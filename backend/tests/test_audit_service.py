@@ -0,0 +1,44 @@
+"""Buffer de auditoría"""
+
+import asyncio
+import threading
+
+from sqlalchemy import func, select
+
+from database import SessionLocal, AuditLog
+from services.audit_service import AuditSink, audit_sink
+
+
+def test_immediate_async_write_runs_off_the_event_loop(portfolio, monkeypatch):
+    sink = AuditSink(batch_size=10, flush_interval=0.1, max_queue=10)
+    writer_threads = []
+    write = sink._write
+    monkeypatch.setattr(sink, "_write", lambda rows: (writer_threads.append(threading.current_thread()), write(rows)))
+
+    async def scenario():
+        # Sin hilo escritor la escritura es inmediata, pero no en el hilo del loop
+        await sink.record_async(action="PRUEBA_AUDITORIA", table_name="pruebas", created_user="pruebas", critical=True)
+        return threading.current_thread()
+
+    loop_thread = asyncio.run(scenario())
+    assert writer_threads and writer_threads[0] is not loop_thread
+
+    with SessionLocal() as db:
+        row = db.execute(select(AuditLog).where(AuditLog.action == "PRUEBA_AUDITORIA")).scalar_one()
+        now = db.execute(select(func.current_timestamp())).scalar()
+        # La marca de tiempo es la del reloj de la base, no la hora local del proceso
+        assert abs((now - row.created_at).total_seconds()) < 60
+
+
+def test_login_is_audited(client, portfolio):
+    from benchmarks.api_suite import BENCH_PASSWORD
+
+    response = client.post("/api/auth/login", data={"username": portfolio["admin"], "password": BENCH_PASSWORD})
+    assert response.status_code == 200
+
+    # Con la app arrancada el evento va a la cola del escritor
+    audit_sink.flush()
+    with SessionLocal() as db:
+        assert db.execute(
+            select(func.count()).select_from(AuditLog).where(AuditLog.action == "LOGIN_SUCCESS")
+        ).scalar() >= 1
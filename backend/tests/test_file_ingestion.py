@@ -0,0 +1,217 @@
+"""Ingesta de archivos de ancho fijo y lectura de lo cargado por la API"""
+
+import os
+from collections import defaultdict
+
+import pytest
+
+from services import file_processor_service as fps
+
+# Clientes del archivo: identificaciones distintas a las de la cartera sembrada
+FILE_IDENTIFIER_BASE = 2_000_000_000
+FILE_CLIENTS = 60
+
+
+@pytest.fixture(scope="module")
+def generated_files(portfolio, tmp_path_factory):
+    """Un archivo por empresa sembrada (SYN0000, SYN0001) con clientes nuevos"""
+    from benchmarks.synthetic_portfolio import PortfolioSpec, build_portfolio
+
+    directory = str(tmp_path_factory.mktemp("cargas"))
+    spec = PortfolioSpec(
+        companies=len(portfolio["companies"]), clients=FILE_CLIENTS, seed=5,
+        cutoff=portfolio["spec"].cutoff, identifier_base=FILE_IDENTIFIER_BASE
+    )
+    build_portfolio(spec, load_db=False, fixed_width_dir=directory)
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory))
+
+
+def _expected(path: str) -> dict:
+    """identificación -> {loan_number: [líneas]} y contacto, leídos del archivo"""
+    clients = defaultdict(lambda: {"loans": defaultdict(list), "contacts": None})
+    for _, record, error in fps.iter_detail_records(path):
+        assert error is None
+        client = clients[record["client"]["national_identifier"]]
+        client["loans"][record["loan"]["loan_number"]].append(record)
+        client["contacts"] = record["contacts"]
+    return clients
+
+
+def _ingest(path: str, company_id: int):
+    from database import SessionLocal, FileUpload, FileUploadStatus
+
+    db = SessionLocal()
+    try:
+        upload = FileUpload(
+            user_id=1, company_id=company_id, original_filename=os.path.basename(path),
+            stored_filename=os.path.basename(path), file_path=path, file_size=os.path.getsize(path),
+            file_type="text/plain", status=FileUploadStatus.uploaded, created_user="pruebas"
+        )
+        db.add(upload)
+        db.commit()
+        stats = fps.ingest_file(db, upload, batch_size=500)
+        return stats, upload.status
+    finally:
+        db.close()
+
+
+def test_ingested_file_is_readable_through_reports(client, admin_headers, portfolio, generated_files):
+    path = generated_files[0]
+    expected = _expected(path)
+    stats, status = _ingest(path, portfolio["companies"][0][0])
+
+    assert status.value == "completed"
+    assert stats.failed_records == 0 and stats.errors == []
+    assert stats.new_clients == len(expected)
+    assert stats.new_loans == sum(len(c["loans"]) for c in expected.values())
+
+    for identifier, data in list(expected.items())[:10]:
+        response = client.get(f"/api/reports/{identifier}", headers=admin_headers)
+        assert response.status_code == 200, response.text
+        report = response.json()
+
+        assert len(report["loans"]) == len(data["loans"])
+        file_loans = sorted(data["loans"].values(), key=lambda lines: lines[0]["loan"]["origination_date"])
+        report_loans = sorted(report["loans"], key=lambda loan: loan["origination_date"])
+        for lines, loan in zip(file_loans, report_loans):
+            assert loan["status"] == lines[0]["loan"]["status"]
+            assert loan["modality"] == lines[0]["loan"]["modality"]
+            assert loan["installments"] == len(lines)
+            assert loan["last_report_date"] == portfolio["spec"].cutoff.isoformat()
+            assert len(loan["payments"]) == len(lines)
+        assert report["client"]["phones"][0]["value"] == data["contacts"]["phone"]
+        assert report["client"]["emails"][0]["value"] == data["contacts"]["email"]
+
+    # Los agregados del dashboard se ajustaron por lote con el aporte de los clientes cargados
+    import crud, models
+    from database import SessionLocal
+    with SessionLocal() as db:
+        company_ids = [company_id for (company_id,) in db.query(models.Company.id)]
+        assert crud.get_portfolio_stats(db) == crud.compute_portfolio_breakdown(db, company_ids)
+
+
+def test_reingesting_updates_instead_of_duplicating(client, admin_headers, portfolio, generated_files):
+    path = generated_files[0]
+    expected = _expected(path)
+    identifier = next(iter(expected))
+    before = client.get(f"/api/reports/{identifier}", headers=admin_headers).json()
+
+    stats, status = _ingest(path, portfolio["companies"][0][0])
+    assert status.value == "completed"
+    assert stats.new_clients == 0 and stats.new_loans == 0
+
+    from sqlalchemy import func, select
+    from database import SessionLocal
+    import models
+    loan_numbers = [number for c in expected.values() for number in c["loans"]]
+    with SessionLocal() as db:
+        stored = db.execute(
+            select(func.count()).select_from(models.Loan).where(models.Loan.loan_number.in_(loan_numbers))
+        ).scalar()
+    assert stored == len(loan_numbers)
+
+    after = client.get(f"/api/reports/{identifier}", headers=admin_headers).json()
+    assert [len(loan["payments"]) for loan in after["loans"]] == [len(loan["payments"]) for loan in before["loans"]]
+    # Sin cambios de contacto no se agrega historial
+    assert len(after["client"]["phones"]) == len(before["client"]["phones"])
+
+
+def test_bulk_upsert_keeps_loans_with_their_company(portfolio):
+    from database import SessionLocal
+    from database.bulk import bulk_upsert_loans
+    import models
+
+    (own_company, _), (other_company, _) = portfolio["companies"]
+    with SessionLocal() as db:
+        loan = db.query(models.Loan).filter(models.Loan.company_id == own_company).first()
+        other_client = db.query(models.Loan.client_id).filter(models.Loan.company_id == other_company).limit(1).scalar()
+        number, client_id, balance = loan.loan_number, loan.client_id, loan.current_balance
+
+        result = bulk_upsert_loans(db, [{
+            "loan_number": number, "client_id": other_client, "company_id": other_company,
+            "current_balance": balance + 1
+        }], table=models.Loan.__table__)
+        db.commit()
+
+        assert result.conflicts == [number]
+        assert result.updated == 0 and result.inserted == 0
+        db.expire_all()
+        stored = db.get(models.Loan, loan.id)
+        assert (stored.company_id, stored.client_id, stored.current_balance) == (own_company, client_id, balance)
+
+
+def test_ingestion_skips_loans_of_another_company(portfolio, generated_files):
+    path = generated_files[0]
+    (own_company, _), (other_company, _) = portfolio["companies"]
+    _ingest(path, own_company)
+
+    stats, status = _ingest(path, other_company)
+    assert status.value == "completed"
+    assert stats.processed_records == 0 and stats.updated_loans == 0 and stats.new_loans == 0
+    assert stats.failed_records == stats.total_records
+    assert all("pertenece a otra empresa" in error for error in stats.errors)
+
+    from sqlalchemy import select
+    from database import SessionLocal
+    import models
+    loan_numbers = [number for c in _expected(path).values() for number in c["loans"]]
+    with SessionLocal() as db:
+        companies = set(db.execute(
+            select(models.Loan.company_id).where(models.Loan.loan_number.in_(loan_numbers))
+        ).scalars())
+    assert companies == {own_company}
+
+
+def test_failed_batch_only_discards_its_bad_lines(portfolio, tmp_path, monkeypatch):
+    from benchmarks.synthetic_portfolio import PortfolioSpec, build_portfolio
+
+    spec = PortfolioSpec(companies=len(portfolio["companies"]), clients=20, seed=9,
+                         cutoff=portfolio["spec"].cutoff, identifier_base=3_000_000_000)
+    build_portfolio(spec, load_db=False, fixed_width_dir=str(tmp_path))
+    path = str(tmp_path / f"{portfolio['companies'][0][1]}_{spec.cutoff:%Y%m%d}.txt")
+    expected = _expected(path)
+    bad_loan = next(iter(next(iter(expected.values()))["loans"]))
+    bad_lines = [line for line, record, _ in fps.iter_detail_records(path)
+                 if record["loan"]["loan_number"] == bad_loan]
+
+    write_batch = fps._write_batch
+    def failing_write_batch(db, records, *args):
+        # Falla después de escribir y de sumar contadores: todo debe revertirse
+        written = write_batch(db, records, *args)
+        if any(r["loan"]["loan_number"] == bad_loan for r in records):
+            raise ValueError("lote inválido")
+        return written
+    monkeypatch.setattr(fps, "_write_batch", failing_write_batch)
+
+    stats, status = _ingest(path, portfolio["companies"][0][0])
+    assert status.value == "completed"
+    assert stats.failed_records == len(bad_lines)
+    assert stats.processed_records == stats.total_records - len(bad_lines)
+    assert stats.errors == [f"Línea {line}: lote inválido" for line in bad_lines][:fps.MAX_REPORTED_ERRORS]
+    assert stats.new_clients == sum(1 for c in expected.values() if set(c["loans"]) != {bad_loan})
+    assert stats.new_loans == sum(len(c["loans"]) for c in expected.values()) - 1
+
+
+def _upload(client, headers, path):
+    with open(path, "rb") as fh:
+        return client.post("/api/files/upload", headers=headers, files={"file": (os.path.basename(path), fh, "text/plain")})
+
+
+def test_upload_rejects_files_of_another_company(client, analyst_headers, admin_headers, generated_files):
+    own_file, other_file = generated_files
+
+    assert _upload(client, analyst_headers, own_file).status_code == 200
+    response = _upload(client, analyst_headers, other_file)
+    assert response.status_code == 403
+    # El administrador puede cargar cartera de cualquier empresa
+    assert _upload(client, admin_headers, other_file).status_code == 200
+
+
+def test_upload_rejects_unknown_company_code(client, admin_headers, generated_files, tmp_path):
+    path = tmp_path / "desconocida.txt"
+    with open(generated_files[0], encoding="latin-1") as fh:
+        lines = fh.readlines()
+    lines[0] = lines[0][:1] + "NOEXISTE".ljust(10) + lines[0][11:]
+    path.write_text("".join(lines), encoding="latin-1")
+
+    assert _upload(client, admin_headers, str(path)).status_code == 400
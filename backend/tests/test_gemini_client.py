@@ -0,0 +1,49 @@
+"""Cliente de Gemini: breaker y semáforo"""
+
+import asyncio
+
+import pytest
+
+from services import gemini_client
+from services.gemini_client import CircuitBreaker, FakeBackend, GeminiClient
+
+
+def make_client(backend, retries=0, backoff=0.0, max_concurrency=1):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.0)
+    return GeminiClient(backend, max_concurrency=max_concurrency, timeout=5.0, deadline=5.0,
+                        retries=retries, backoff=backoff, breaker=breaker)
+
+
+def test_cancelled_probe_releases_half_open_breaker():
+    async def scenario():
+        client = make_client(FakeBackend(latency=1.0))
+        client.breaker.record_failure()
+        assert client.breaker.state == "half_open"
+
+        probe = asyncio.create_task(client.generate("hola"))
+        await asyncio.sleep(0.01)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+        # Otra llamada de prueba debe poder pasar
+        assert client.breaker.allow()
+
+    asyncio.run(scenario())
+
+
+def test_backoff_does_not_hold_a_concurrency_slot(monkeypatch):
+    # Backoff fijo (el máximo del jitter) para que la espera sea determinista
+    monkeypatch.setattr(gemini_client.random, "uniform", lambda low, high: high)
+
+    async def scenario():
+        client = make_client(FakeBackend(failures=1), retries=1, backoff=0.5)
+        retrying = asyncio.create_task(client.generate("primero"))
+        await asyncio.sleep(0.01)
+
+        # Mientras la primera espera su backoff, la segunda llamada entra al semáforo
+        other = await asyncio.wait_for(client.generate("segundo"), 0.25)
+        assert other
+        await retrying
+
+    asyncio.run(scenario())
@@ -0,0 +1,34 @@
+"""Cola de archivos sobre file_uploads.status"""
+
+from datetime import timedelta
+
+from sqlalchemy import func, select, update
+
+from database import SessionLocal, FileUpload, FileUploadStatus
+from services.job_queue import requeue_stale_uploads
+
+
+def test_requeue_only_uploads_without_recent_progress(portfolio):
+    with SessionLocal() as db:
+        uploads = [
+            FileUpload(
+                user_id=1, company_id=portfolio["companies"][0][0], original_filename=f"cola_{index}.txt",
+                stored_filename=f"cola_{index}.txt", file_path=f"uploads/cola_{index}.txt", file_size=0,
+                file_type="text/plain", status=FileUploadStatus.processing, created_user="pruebas"
+            )
+            for index in range(2)
+        ]
+        db.add_all(uploads)
+        db.commit()
+        recent, stale = (upload.id for upload in uploads)
+
+        # El reloj de referencia es el de la base, el mismo que escribe updated_at
+        now = db.execute(select(func.current_timestamp())).scalar()
+        db.execute(update(FileUpload).where(FileUpload.id == stale).values(updated_at=now - timedelta(hours=2)))
+        db.commit()
+
+        assert requeue_stale_uploads(db, stale_after_minutes=30) == 1
+        statuses = dict(db.execute(
+            select(FileUpload.id, FileUpload.status).where(FileUpload.id.in_([recent, stale]))
+        ).all())
+    assert statuses == {recent: FileUploadStatus.processing, stale: FileUploadStatus.uploaded}
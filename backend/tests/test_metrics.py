@@ -0,0 +1,21 @@
+"""Métricas de la base de datos"""
+
+from cache import identity_cache
+from database import get_engine
+
+
+def test_pool_checkout_wait_is_measured_by_the_pool_class(client, admin_headers):
+    pool_class = type(get_engine().pool)
+    assert pool_class.__name__ == "TimedQueuePool"
+
+    # dispose() recrea el pool con la misma clase
+    get_engine().dispose()
+    assert type(get_engine().pool) is pool_class
+
+    # Sin la identidad en caché, la autenticación usa el engine asíncrono
+    identity_cache.clear()
+    assert client.get("/api/dashboard", headers=admin_headers).status_code == 200
+    text = client.get("/api/metrics").text
+    assert 'db_pool_checkout_wait_seconds_count{engine="sync"}' in text
+    assert 'db_pool_checkout_wait_seconds_count{engine="async"}' in text
+    assert 'db_pool_checked_out{engine="sync"}' in text
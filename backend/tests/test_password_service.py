@@ -0,0 +1,12 @@
+"""Pool de hashing de contraseñas"""
+
+from services import password_service
+
+
+def test_hashing_works_after_shutdown():
+    hashed = password_service.hash_password("clave-de-prueba")
+    password_service.shutdown()
+
+    # Un nuevo ciclo de vida de la app vuelve a usar el servicio
+    assert password_service.verify_password("clave-de-prueba", hashed)
+    assert password_service.verify_password("clave-de-prueba", password_service.hash_password("clave-de-prueba"))
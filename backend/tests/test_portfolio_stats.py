@@ -0,0 +1,85 @@
+"""Agregados del dashboard en company_portfolio_stats"""
+
+from sqlalchemy import insert, select
+
+import crud, models
+from database import SessionLocal
+
+
+def _live(db):
+    return crud.compute_portfolio_breakdown(db, [company_id for (company_id,) in db.query(models.Company.id)])
+
+
+def _stored(db):
+    return {
+        s.company_id: {field: getattr(s, field) for field in crud.PORTFOLIO_STATS_FIELDS}
+        for s in db.query(models.CompanyPortfolioStats)
+    }
+
+
+def test_loan_updates_keep_stats_equal_to_a_full_recompute(portfolio):
+    with SessionLocal() as db:
+        assert _stored(db) == _live(db)
+        up_to_date = db.execute(
+            select(models.Loan.id).where(models.Loan.status == "Vigente", models.Loan.days_late == 0).limit(3)
+        ).scalars().all()
+
+        crud.update_loan(db, up_to_date[0], {"status": "En Jurídica", "days_late": 150})
+        crud.update_loan(db, up_to_date[1], {"status": "En Mora", "days_late": 20})
+        own_company = db.get(models.Loan, up_to_date[2]).company_id
+        other_company = next(company_id for company_id, _ in portfolio["companies"] if company_id != own_company)
+        crud.update_loan(db, up_to_date[2], {"company_id": other_company})
+
+        assert _stored(db) == _live(db)
+        # Devolverlo a su empresa: los archivos de la cartera sembrada lo siguen reportando allí
+        crud.update_loan(db, up_to_date[2], {"company_id": own_company})
+        assert _stored(db) == _live(db)
+
+
+def test_statuses_of_the_canonical_model_count_as_arrears(portfolio):
+    with SessionLocal() as db:
+        loan = db.execute(select(models.Loan).where(models.Loan.status == "Vigente").limit(1)).scalar_one()
+        before = crud.compute_portfolio_breakdown(db, client_ids=[loan.client_id])
+        db.execute(insert(models.Loan), [{
+            "client_id": loan.client_id, "company_id": loan.company_id, "origination_date": loan.origination_date,
+            "original_amount": 1000, "current_balance": 1000, "status": "defaulted", "modality": "Mensual",
+            "interest_rate": 20, "installments": 12, "days_late": 95, "last_report_date": loan.last_report_date,
+        }])
+        after = crud.compute_portfolio_breakdown(db, client_ids=[loan.client_id])
+        db.rollback()
+
+    general_before, general_after = before[crud.GENERAL_STATS_ID], after[crud.GENERAL_STATS_ID]
+    if general_before["clients_in_legal"] == 0:
+        assert general_after["clients_with_arrears"] == 1
+    assert general_after["mora_91_plus"] == 1
+
+
+def test_reading_stats_never_writes(portfolio):
+    with SessionLocal() as db:
+        stored = _stored(db)
+        db.query(models.CompanyPortfolioStats).delete()
+        db.commit()
+        try:
+            assert crud.get_portfolio_stats(db) == _live(db)
+            assert db.query(models.CompanyPortfolioStats).count() == 0
+        finally:
+            crud.rebuild_portfolio_stats(db)
+        assert _stored(db) == stored
+
+
+def test_general_row_counts_every_client(portfolio):
+    with SessionLocal() as db:
+        general = _live(db)[crud.GENERAL_STATS_ID]
+        assert general["total_clients"] == db.query(models.Client).count()
+
+        # Un cliente sin préstamos cuenta en el general como al día y en ninguna empresa
+        client = models.Client(national_identifier="SIN-PRESTAMOS", full_name="Cliente Sin Préstamos")
+        db.add(client)
+        db.flush()
+        contribution = crud.compute_portfolio_breakdown(db, client_ids=[client.id])
+        after = _live(db)
+        db.rollback()
+
+    assert contribution == {crud.GENERAL_STATS_ID: {**dict.fromkeys(crud.PORTFOLIO_STATS_FIELDS, 0),
+                                                    "total_clients": 1, "active_clients_up_to_date": 1}}
+    assert after[crud.GENERAL_STATS_ID]["total_clients"] == general["total_clients"] + 1
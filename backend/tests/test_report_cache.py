@@ -0,0 +1,60 @@
+"""Caché de reportes de crédito entre procesos"""
+
+import time
+
+from sqlalchemy import select, update
+
+import crud, models
+from database import SessionLocal
+
+
+def _report_name(identifier):
+    # Una sesión por petición, como en la API
+    with SessionLocal() as db:
+        return crud.get_cached_credit_report(db, identifier).client.fullName
+
+
+def _rename(client_id, name):
+    with SessionLocal() as db:
+        db.execute(update(models.Client).where(models.Client.id == client_id).values(full_name=name))
+        db.commit()
+
+
+def test_writes_from_another_process_invalidate_the_cache(portfolio, monkeypatch):
+    monkeypatch.setattr(crud.settings, "REPORT_CACHE_UPLOAD_CHECK_SECONDS", 0)
+    with SessionLocal() as db:
+        client_id, identifier, original_name = db.execute(
+            select(models.Client.id, models.Client.national_identifier, models.Client.full_name)
+            .order_by(models.Client.id).limit(1)
+        ).one()
+
+    assert _report_name(identifier) == original_name
+    # Otro worker escribe sin pasar por invalidate_credit_reports de este proceso
+    _rename(client_id, "Nombre Cambiado")
+    try:
+        assert _report_name(identifier) == "Nombre Cambiado"
+    finally:
+        _rename(client_id, original_name)
+
+
+def test_other_writes_only_evict_the_changed_clients(portfolio, monkeypatch):
+    monkeypatch.setattr(crud.settings, "REPORT_CACHE_UPLOAD_CHECK_SECONDS", 0)
+    # Sin margen: solo cuenta lo escrito después de la revisión anterior
+    monkeypatch.setattr(crud.settings, "REPORT_CACHE_WRITE_LAG_SECONDS", 0)
+    with SessionLocal() as db:
+        (changed_id, changed), (_, unchanged) = db.execute(
+            select(models.Client.id, models.Client.national_identifier).order_by(models.Client.id.desc()).limit(2)
+        ).all()
+
+    _report_name(changed)
+    _report_name(unchanged)
+    # Las escrituras de pruebas anteriores quedan antes de la próxima revisión
+    time.sleep(1.1)
+    with SessionLocal() as db:
+        original_name = db.get(models.Client, changed_id).full_name
+    _rename(changed_id, "Nombre Cambiado")
+    try:
+        assert _report_name(changed) == "Nombre Cambiado"
+        assert crud.report_cache.get(unchanged) is not None
+    finally:
+        _rename(changed_id, original_name)
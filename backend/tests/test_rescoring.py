@@ -0,0 +1,64 @@
+"""Recálculo de puntajes: candado entre procesos y selección de clientes"""
+
+from datetime import timedelta
+
+from sqlalchemy import func, select
+
+import crud, models, schemas
+from database import SessionLocal
+from services import rescoring_service
+from services.rescoring_service import acquire_run_lock, changed_client_ids, release_run_lock
+
+
+def _now(db):
+    return db.execute(select(func.current_timestamp())).scalar()
+
+
+def test_run_lock_is_exclusive_until_released_or_expired():
+    with SessionLocal() as db, SessionLocal() as other:
+        now = _now(db)
+        token = acquire_run_lock(db, now)
+        assert token is not None
+        assert acquire_run_lock(other, now) is None
+        # Mientras otro proceso tiene el candado, la corrida se omite
+        assert rescoring_service.run_rescoring(workers=1) is None
+
+        release_run_lock(db, token)
+        second = acquire_run_lock(other, now)
+        assert second is not None
+
+        # Un candado vencido (proceso caído) lo puede tomar otro
+        expired = now + timedelta(minutes=rescoring_service.settings.RESCORING_STALE_MINUTES, seconds=1)
+        third = acquire_run_lock(db, expired)
+        assert third is not None
+        # El dueño anterior ya no puede liberar un candado que no es suyo
+        release_run_lock(other, second)
+        assert acquire_run_lock(other, expired) is None
+        release_run_lock(db, third)
+
+
+def test_flag_changes_select_the_client_for_rescoring(portfolio):
+    with SessionLocal() as db:
+        # CURRENT_TIMESTAMP de SQLite tiene resolución de segundos; se elige un cliente
+        # con marcas que no haya cambiado por otra vía en ese intervalo
+        since = _now(db) - timedelta(seconds=1)
+        recent = set(changed_client_ids(db, since).tolist())
+        client = next(
+            client for client in db.execute(select(models.Client).join(models.ClientFlag).limit(50)).unique().scalars()
+            if client.id not in recent
+        )
+        contacts = {c.data_type: c.value for c in db.query(models.ClientCurrentContact).filter_by(client_id=client.id)}
+        flags = [flag.flag for flag in client.flags]
+
+        def set_flags(new_flags):
+            crud.update_client(db, client.id, schemas.ClientUpdateData(
+                fullName=client.full_name, address=contacts.get("address", ""), phone=contacts.get("phone", ""),
+                email=contacts.get("email", ""), flags=new_flags
+            ))
+
+        # Quitar una marca no deja fila en client_flags: la señal es clients.updated_at
+        set_flags(flags[1:])
+        assert client.id in changed_client_ids(db, since)
+
+        set_flags(flags)
+        assert client.id in changed_client_ids(db, since)
@@ -0,0 +1,88 @@
+"""Presupuestos SQL declarados con @sql_budget (SQL_BUDGET_MODE=raise en conftest)"""
+
+import pytest
+
+import crud, models, sql_budget
+from cache import identity_cache
+from database import SessionLocal
+from routers import dashboard
+
+
+@pytest.fixture
+def tracked(monkeypatch):
+    """Trackers evaluados por el middleware: [(etiqueta, sentencias, presupuesto)]"""
+    seen = []
+    check = sql_budget.SQLTracker.check
+
+    def recording_check(self, raise_on_violation=None):
+        seen.append((self.label, self.statements, self.max_statements))
+        return check(self, raise_on_violation)
+
+    monkeypatch.setattr(sql_budget.SQLTracker, "check", recording_check)
+    # En frío: identidad y reportes salen de la base, no de la caché
+    identity_cache.clear()
+    crud.report_cache.clear()
+    return seen
+
+
+def _session_headers(client, portfolio):
+    from benchmarks.api_suite import BENCH_PASSWORD
+    response = client.post("/api/auth/login", data={"username": portfolio["admin"], "password": BENCH_PASSWORD})
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+def _identifier():
+    with SessionLocal() as db:
+        return db.query(models.Client.national_identifier).order_by(models.Client.id.desc()).first()[0]
+
+
+@pytest.mark.parametrize("path, route, budget", [
+    ("/api/dashboard", "GET /api/dashboard", 8),
+    ("/api/reports/{identifier}", "GET /api/reports/{identifier}", 8),
+    ("/api/clients/?limit=1000", "GET /api/clients/", 4),
+    ("/api/clients/?format=ndjson&limit=50", "GET /api/clients/ (página NDJSON)", 3),
+])
+def test_legacy_routes_stay_within_their_budget(client, admin_headers, tracked, path, route, budget):
+    response = client.get(path.format(identifier=_identifier()), headers=admin_headers)
+    assert response.status_code == 200
+
+    counted = [(statements, limit) for label, statements, limit in tracked if label == route]
+    assert counted and all(0 < statements <= limit == budget for statements, limit in counted)
+
+
+def test_auth_me_stays_within_its_budget(client, portfolio, tracked):
+    headers = _session_headers(client, portfolio)
+    identity_cache.clear()
+
+    response = client.get("/api/auth/me", headers=headers)
+    assert response.status_code == 200
+    counted = [(statements, limit) for label, statements, limit in tracked if label == "GET /api/auth/me"]
+    assert counted and all(0 < statements <= limit == 4 for statements, limit in counted)
+
+
+def test_exceeding_a_budget_fails_the_request(client, admin_headers, monkeypatch):
+    identity_cache.clear()
+    monkeypatch.setattr(dashboard.get_dashboard_data, "__sql_budget__", (1, None))
+
+    with pytest.raises(sql_budget.SQLBudgetExceeded):
+        client.get("/api/dashboard", headers=admin_headers)
+
+
+def test_batch_report_budgets_each_chunk(client, admin_headers, tracked):
+    from routers.reports import BATCH_REPORT_CHUNK_SIZE, BATCH_REPORT_CHUNK_SQL_BUDGET
+    with SessionLocal() as db:
+        known = [identifier for (identifier,) in db.query(models.Client.national_identifier)]
+    # Más bloques que SQL_BUDGET_MAX_REPEATS: sin presupuesto por bloque la petición fallaría
+    chunks = 7
+    identifiers = (known * chunks)[:BATCH_REPORT_CHUNK_SIZE * chunks]
+    identifiers += [f"NOEXISTE{i}" for i in range(BATCH_REPORT_CHUNK_SIZE * chunks - len(identifiers))]
+
+    response = client.post("/api/reports/batch", json={"identifiers": identifiers}, headers=admin_headers)
+    assert response.status_code == 200
+    assert len(response.text.splitlines()) == len(identifiers)
+
+    counted = [(statements, limit) for label, statements, limit in tracked
+               if label == "POST /api/reports/batch (bloque NDJSON)"]
+    # Los bloques ya en caché no consultan la base
+    assert len(counted) == chunks and counted[0][0] > 0
+    assert all(statements <= limit == BATCH_REPORT_CHUNK_SQL_BUDGET for statements, limit in counted)
@@ -0,0 +1,56 @@
+"""Cartera sintética: la base sembrada y sus archivos de ancho fijo son consistentes"""
+
+import os
+
+from sqlalchemy import func, select
+
+import crud, models
+from database import SessionLocal, FileUpload, FileUploadStatus
+from services import file_processor_service as fps
+
+
+def test_seeded_companies_are_listed(client, portfolio):
+    from benchmarks.api_suite import BENCH_PASSWORD
+    token = client.post(
+        "/api/auth/login", data={"username": portfolio["admin"], "password": BENCH_PASSWORD}
+    ).json()["access_token"]
+
+    response = client.get("/api/companies/", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200, response.text
+    codes = {company["code"] for company in response.json()["companies"]}
+    assert {code for _, code in portfolio["companies"]} <= codes
+
+
+def _counts(db):
+    return {
+        model.__tablename__: db.execute(select(func.count()).select_from(model)).scalar()
+        for model in (models.Client, models.Loan, models.Payment)
+    }
+
+
+def test_files_of_the_seeded_portfolio_reingest_into_the_same_rows(portfolio, tmp_path):
+    from benchmarks.synthetic_portfolio import build_portfolio
+
+    # Los mismos datos que ya están en la base, ahora como archivos
+    build_portfolio(portfolio["spec"], load_db=False, fixed_width_dir=str(tmp_path))
+    company_id, code = portfolio["companies"][0]
+    path = str(tmp_path / f"{code}_{portfolio['spec'].cutoff:%Y%m%d}.txt")
+
+    with SessionLocal() as db:
+        before = _counts(db)
+        upload = FileUpload(
+            user_id=1, company_id=company_id, original_filename=os.path.basename(path),
+            stored_filename=os.path.basename(path), file_path=path, file_size=os.path.getsize(path),
+            file_type="text/plain", status=FileUploadStatus.uploaded, created_user="pruebas"
+        )
+        db.add(upload)
+        db.commit()
+        stats = fps.ingest_file(db, upload, batch_size=500)
+
+        assert upload.status == FileUploadStatus.completed
+        assert stats.failed_records == 0 and stats.errors == []
+        assert stats.new_clients == 0 and stats.new_loans == 0
+        assert _counts(db) == before
+
+        company_ids = [company_id for (company_id,) in db.query(models.Company.id)]
+        assert crud.get_portfolio_stats(db) == crud.compute_portfolio_breakdown(db, company_ids)
@@ -3,21 +3,28 @@ Módulo de base de datos para MIRIESGO v2
 Configuración y modelos SQLAlchemy para MySQL
 """
 
+from . import config as _config
 from .config import (
-    engine, SessionLocal, Base, get_db, 
+    get_engine, on_engine_created, use_pool_class, select_database_url, SessionLocal, Base, get_db, 
     create_all_tables, drop_all_tables, 
     test_connection, get_database_info,
     validate_config, db_logger, AuditMixin
 )
 
 from .models import (
-    Company, User, Client, Loan, CreditReport, 
-    AuditLog, Session, FileUpload,
+    Company, User, Client, Loan, Payment, CreditReport, 
+    AuditLog, Session, FileUpload, ScoringRun, JobLock,
     CompanyStatus, UserRole, LoanType, LoanStatus, 
-    PaymentBehavior, ReportType, RiskLevel, FileUploadStatus,
+    PaymentBehavior, PaymentStatus, ReportType, RiskLevel, FileUploadStatus, ScoringRunStatus,
     get_all_models, get_model_by_name, create_model_instance
 )
 
+from .bulk import bulk_upsert_loans, BulkUpsertResult, BULK_BATCH_SIZE
+
+from .async_config import (
+    get_async_db, get_async_engine, get_async_sessionmaker, on_async_engine_created, use_async_pool_class
+)
+
 # Información del módulo
 __version__ = "1.0.0"
 __author__ = "MIRIESGO v2 Team"
@@ -29,26 +36,39 @@ MAX_PAGE_SIZE = 100
 # Exportaciones principales
 __all__ = [
     # Configuración
-    'engine', 'SessionLocal', 'Base', 'get_db',
+    'engine', 'get_engine', 'on_engine_created', 'use_pool_class', 'select_database_url',
+    'SessionLocal', 'Base', 'get_db',
     'create_all_tables', 'drop_all_tables', 
     'test_connection', 'get_database_info',
     'validate_config', 'db_logger', 'AuditMixin',
     
     # Modelos
-    'Company', 'User', 'Client', 'Loan', 'CreditReport',
-    'AuditLog', 'Session', 'FileUpload',
+    'Company', 'User', 'Client', 'Loan', 'Payment', 'CreditReport',
+    'AuditLog', 'Session', 'FileUpload', 'ScoringRun', 'JobLock',
     
     # Enums
     'CompanyStatus', 'UserRole', 'LoanType', 'LoanStatus',
-    'PaymentBehavior', 'ReportType', 'RiskLevel', 'FileUploadStatus',
+    'PaymentBehavior', 'PaymentStatus', 'ReportType', 'RiskLevel', 'FileUploadStatus', 'ScoringRunStatus',
     
     # Utilidades
     'get_all_models', 'get_model_by_name', 'create_model_instance',
     
+    # Escrituras masivas
+    'bulk_upsert_loans', 'BulkUpsertResult', 'BULK_BATCH_SIZE',
+
+    # Acceso asíncrono
+    'get_async_db', 'get_async_engine', 'get_async_sessionmaker', 'on_async_engine_created', 'use_async_pool_class',
+    
     # Constantes
     'DEFAULT_PAGE_SIZE', 'MAX_PAGE_SIZE'
 ]
 
+def __getattr__(name: str):
+    # `engine` y `DATABASE_URL` se resuelven al primer acceso (ver config.get_engine)
+    if name in ("engine", "DATABASE_URL"):
+        return getattr(_config, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 def initialize_database():
     """
     Inicializar la base de datos
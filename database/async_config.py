@@ -0,0 +1,105 @@
+"""
+Configuración asíncrona de base de datos para MIRIESGO v2
+AsyncSession sobre aiomysql (MySQL/MariaDB) o aiosqlite (SQLite) para las rutas async
+"""
+
+from typing import AsyncIterator, Callable, List, Optional
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool
+
+from .config import DB_BACKEND, db_logger, select_database_url, selected_database_url
+
+# Drivers asíncronos equivalentes a los síncronos
+ASYNC_DRIVERS = {
+    "mysql": "mysql+aiomysql",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+# Parámetros de la URL síncrona que los drivers asíncronos no aceptan
+UNSUPPORTED_QUERY_PARAMS = ("ssl_disabled",)
+
+_async_engine: Optional[AsyncEngine] = None
+_async_session_factory: Optional[async_sessionmaker] = None
+_engine_hooks: List[Callable] = []
+_pool_class_factory: Optional[Callable[[type], type]] = None
+
+def async_database_url(url: str):
+    """Convertir la URL síncrona (pymysql / sqlite) a su driver asíncrono"""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No hay driver asíncrono configurado para '{backend}'")
+    return parsed.set(drivername=ASYNC_DRIVERS[backend]).difference_update_query(UNSUPPORTED_QUERY_PARAMS)
+
+def on_async_engine_created(hook: Callable):
+    """Registrar una función que recibe el engine síncrono subyacente (métricas, logging)"""
+    _engine_hooks.append(hook)
+    if _async_engine is not None:
+        hook(_async_engine.sync_engine)
+
+def use_async_pool_class(factory: Callable[[type], type]):
+    """Como config.use_pool_class, para el engine asíncrono"""
+    global _pool_class_factory
+    if _async_engine is not None:
+        db_logger.warning("El engine asíncrono ya existe: la clase de pool registrada no se aplicará")
+    _pool_class_factory = factory
+
+def _pool_class(default: type) -> type:
+    return _pool_class_factory(default) if _pool_class_factory else default
+
+def get_async_engine() -> AsyncEngine:
+    """
+    Engine asíncrono, creado en el primer uso sobre el mismo backend que el síncrono.
+    Se usa dentro del event loop, donde no se puede hacer la prueba bloqueante de MySQL
+    del modo "auto": el backend debe estar elegido antes (evento de arranque de la API)
+    o fijado con DB_BACKEND.
+    """
+    global _async_engine
+    if _async_engine is None:
+        sync_url = selected_database_url()
+        if sync_url is None:
+            if DB_BACKEND not in ("mysql", "sqlite"):
+                raise RuntimeError(
+                    "Backend de base de datos sin elegir: llame a select_database_url fuera del "
+                    "event loop antes de usar el engine asíncrono, o defina DB_BACKEND"
+                )
+            sync_url = select_database_url()
+        url = async_database_url(sync_url)
+        if url.get_backend_name() == "mysql":
+            engine = create_async_engine(
+                url,
+                poolclass=_pool_class(AsyncAdaptedQueuePool),
+                pool_size=10,
+                max_overflow=20,
+                pool_pre_ping=True,
+                pool_recycle=3600,
+                echo=False,
+                connect_args={"connect_timeout": 30}
+            )
+        else:
+            # aiosqlite abre una conexión por uso (NullPool, el valor por defecto del dialecto)
+            engine = create_async_engine(url, poolclass=_pool_class(NullPool), echo=False)
+        _async_engine = engine
+        for hook in _engine_hooks:
+            hook(engine.sync_engine)
+    return _async_engine
+
+def get_async_sessionmaker() -> async_sessionmaker:
+    global _async_session_factory
+    if _async_session_factory is None:
+        # expire_on_commit=False: en async no se pueden recargar atributos de forma implícita
+        _async_session_factory = async_sessionmaker(
+            bind=get_async_engine(),
+            autoflush=False,
+            expire_on_commit=False
+        )
+    return _async_session_factory
+
+async def get_async_db() -> AsyncIterator[AsyncSession]:
+    """
+    Dependency para obtener una sesión asíncrona de base de datos
+    """
+    async with get_async_sessionmaker()() as session:
+        yield session
@@ -0,0 +1,122 @@
+"""
+Escrituras masivas para MIRIESGO v2
+Upsert por lotes usando la sintaxis nativa de cada motor
+"""
+
+import os
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import Dict, Iterable, List
+
+from sqlalchemy import Table, select, func
+from sqlalchemy.dialects import mysql, sqlite
+from sqlalchemy.orm import Session
+
+from database.models import Loan
+
+# Tamaño de lote por defecto para escrituras masivas
+BULK_BATCH_SIZE = int(os.getenv('DB_BULK_BATCH_SIZE', '1000'))
+
+# Columnas que nunca se sobrescriben cuando el préstamo ya existe: un préstamo no cambia
+# de titular ni de empresa por una carga
+LOAN_IMMUTABLE_COLUMNS = {'id', 'loan_number', 'client_id', 'company_id', 'created_user', 'created_at'}
+
+@dataclass
+class BulkUpsertResult:
+    """Resultado de un upsert masivo"""
+    inserted: int = 0
+    updated: int = 0
+    # loan_number que ya pertenecen a otra empresa: no se escriben
+    conflicts: List[str] = field(default_factory=list)
+
+    @property
+    def total(self) -> int:
+        return self.inserted + self.updated
+
+def _batches(rows: Iterable[Dict], size: int):
+    iterator = iter(rows)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+def _loan_upsert_statement(table: Table, dialect_name: str, columns: List[str]):
+    """
+    Construir el INSERT ... ON DUPLICATE KEY UPDATE (MariaDB/MySQL)
+    o INSERT ... ON CONFLICT DO UPDATE (SQLite) sobre loan_number.
+    Si la fila trae company_id, la actualización solo aplica cuando el préstamo
+    existente es de esa misma empresa.
+    """
+    update_columns = [c for c in columns if c not in LOAN_IMMUTABLE_COLUMNS]
+    guarded = 'company_id' in columns
+
+    if dialect_name in ('mysql', 'mariadb'):
+        stmt = mysql.insert(table)
+        values = {c: stmt.inserted[c] for c in update_columns}
+        values['updated_at'] = func.current_timestamp()
+        if guarded:
+            # ON DUPLICATE KEY UPDATE no admite WHERE: cada columna conserva su valor
+            # si la empresa no coincide (company_id no se actualiza, la condición es estable)
+            same_company = table.c.company_id == stmt.inserted.company_id
+            values = {c: func.if_(same_company, value, table.c[c]) for c, value in values.items()}
+        return stmt.on_duplicate_key_update(**values)
+
+    if dialect_name == 'sqlite':
+        stmt = sqlite.insert(table)
+        values = {c: stmt.excluded[c] for c in update_columns}
+        values['updated_at'] = func.current_timestamp()
+        where = table.c.company_id == stmt.excluded.company_id if guarded else None
+        return stmt.on_conflict_do_update(index_elements=['loan_number'], set_=values, where=where)
+
+    raise NotImplementedError(f"Upsert masivo no soportado para el motor '{dialect_name}'")
+
+def bulk_upsert_loans(db: Session, rows: Iterable[Dict], batch_size: int = None,
+                      table: Table = None) -> BulkUpsertResult:
+    """
+    Insertar o actualizar préstamos por loan_number en lotes.
+
+    table es la tabla loans del modelo que se escribe (por defecto la de
+    database/models.py); la ingesta de archivos pasa la de backend/models.py,
+    que es la que leen los reportes.
+
+    Cada fila es un diccionario con columnas de la tabla loans y debe incluir
+    loan_number; las filas nuevas además requieren las columnas obligatorias.
+    Los conteos de insertados/actualizados se obtienen consultando las llaves
+    existentes de cada lote, porque el rowcount de ON DUPLICATE KEY no es
+    confiable cuando la fila no cambia. Las filas cuyo loan_number ya es de otra
+    empresa no se escriben y se reportan en conflicts. No hace commit.
+    """
+    batch_size = batch_size or BULK_BATCH_SIZE
+    table = table if table is not None else Loan.__table__
+    dialect_name = db.get_bind().dialect.name
+    result = BulkUpsertResult()
+
+    for batch in _batches(rows, batch_size):
+        # Una misma llave repetida en el lote: gana la última fila
+        by_number = {row['loan_number']: row for row in batch}
+        existing = dict(db.execute(
+            select(table.c.loan_number, table.c.company_id).where(table.c.loan_number.in_(by_number.keys()))
+        ).all())
+
+        conflicts = [
+            number for number, row in by_number.items()
+            if number in existing and 'company_id' in row and row['company_id'] != existing[number]
+        ]
+        for number in conflicts:
+            del by_number[number]
+            del existing[number]
+        result.conflicts.extend(conflicts)
+
+        # Agrupar por conjunto de columnas para que cada executemany sea homogéneo
+        groups: Dict[tuple, List[Dict]] = {}
+        for row in by_number.values():
+            groups.setdefault(tuple(sorted(row.keys())), []).append(row)
+
+        for columns, group_rows in groups.items():
+            db.execute(_loan_upsert_statement(table, dialect_name, list(columns)), group_rows)
+
+        result.updated += len(existing)
+        result.inserted += len(by_number) - len(existing)
+
+    return result
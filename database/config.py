@@ -5,10 +5,13 @@ Manejo de conexión MySQL con SQLAlchemy
 
 import os
 import sys
+import threading
+from typing import Callable, List, Optional
 from sqlalchemy import create_engine, MetaData, text
+from sqlalchemy.engine import Engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import QueuePool
+from sqlalchemy.pool import NullPool, QueuePool
 import logging
 from dotenv import load_dotenv
 
@@ -16,10 +19,6 @@ from dotenv import load_dotenv
 load_dotenv()
 load_dotenv(os.path.join(os.path.dirname(os.path.dirname(__file__)), ".env"))
 
-# Configuración de logging
-logging.basicConfig()
-logging.getLogger('sqlalchemy.engine').setLevel(logging.INFO)
-
 # ===============================================
 # CONFIGURACIÓN DE BASE DE DATOS
 # ===============================================
@@ -32,71 +31,161 @@ DB_USER = os.getenv('DB_USER', 'root')
 DB_PASSWORD = os.getenv('DB_PASSWORD', '')
 
 # Construcción de la URL de conexión
-# Intentar MySQL primero, fallback a SQLite
 if DB_PASSWORD:
-    DATABASE_URL = f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}?charset=utf8mb4&ssl_disabled=True"
+    MYSQL_URL = f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}?charset=utf8mb4&ssl_disabled=True"
 else:
-    DATABASE_URL = f"mysql+pymysql://{DB_USER}@{DB_HOST}:{DB_PORT}/{DB_NAME}?charset=utf8mb4&ssl_disabled=True"
-
-# Probar conexión MySQL
-try:
-    test_engine = create_engine(
-        DATABASE_URL,
-        connect_args={
-            "connect_timeout": 30,
-            "read_timeout": 30,
-            "write_timeout": 30
-        }
-    )
-    with test_engine.connect() as conn:
-        result = conn.execute(text("SELECT 1"))
-        result.fetchone()
-    print("✅ Conectado a MySQL/MariaDB")
-except Exception as e:
-    print(f"⚠️ MySQL no disponible ({e}), usando SQLite")
-    DATABASE_URL = "sqlite:///./miriesgo_v2.db"
+    MYSQL_URL = f"mysql+pymysql://{DB_USER}@{DB_HOST}:{DB_PORT}/{DB_NAME}?charset=utf8mb4&ssl_disabled=True"
+
+SQLITE_URL = "sqlite:///./miriesgo_v2.db"
+
+# Selección del backend: "auto" prueba MySQL la primera vez que se necesita y cae a SQLite;
+# "mysql" o "sqlite" lo fijan sin prueba (recomendado en producción: arranque sin esperas)
+DB_BACKEND = os.getenv('DB_BACKEND', 'auto').lower()
+# Tiempo máximo de la prueba de conexión en modo "auto" (segundos)
+DB_PROBE_TIMEOUT = int(os.getenv('DB_PROBE_TIMEOUT', '3'))
 
 # ===============================================
-# CONFIGURACIÓN DEL ENGINE
+# SELECCIÓN DEL BACKEND Y ENGINE (PEREZOSOS)
 # ===============================================
 
-# Configuración del motor de base de datos
-if DATABASE_URL.startswith("mysql"):
-    # Configuración para MySQL/MariaDB
-    engine = create_engine(
-        DATABASE_URL,
-        poolclass=QueuePool,
-        pool_size=10,
-        max_overflow=20,
-        pool_pre_ping=True,
-        pool_recycle=3600,
-        echo=False,  # Cambiar a True para debug SQL
-        connect_args={
-            "connect_timeout": 30,
-            "read_timeout": 30,
-            "write_timeout": 30,
-            "autocommit": False
-        }
-    )
-else:
-    # Configuración para SQLite
-    engine = create_engine(
-        DATABASE_URL,
-        echo=False,  # Cambiar a True para debug SQL
-        connect_args={
-            "check_same_thread": False
-        }
-    )
+# Nada se conecta al importar el módulo: la URL se elige y el engine se crea en el
+# primer uso, una sola vez por proceso.
+_init_lock = threading.RLock()
+_database_url: Optional[str] = None
+_engine: Optional[Engine] = None
+_engine_hooks: List[Callable] = []
+# Recibe la clase de pool por defecto y retorna la que se usa (p. ej. una subclase que
+# mide la espera por conexión); se fija con use_pool_class antes del primer uso
+_pool_class_factory: Optional[Callable[[type], type]] = None
+
+def _mysql_available() -> bool:
+    """Prueba corta de conexión a MySQL/MariaDB"""
+    probe_engine = None
+    try:
+        probe_engine = create_engine(
+            MYSQL_URL,
+            poolclass=NullPool,
+            connect_args={
+                "connect_timeout": DB_PROBE_TIMEOUT,
+                "read_timeout": DB_PROBE_TIMEOUT,
+                "write_timeout": DB_PROBE_TIMEOUT
+            }
+        )
+        with probe_engine.connect() as conn:
+            conn.execute(text("SELECT 1")).fetchone()
+        return True
+    except Exception as e:
+        db_logger.warning("MySQL no disponible (%s), usando SQLite", e)
+        return False
+    finally:
+        if probe_engine is not None:
+            probe_engine.dispose()
+
+def select_database_url() -> str:
+    """URL de la base de datos del proceso; la decisión se toma una vez y se conserva"""
+    global _database_url
+    if _database_url is None:
+        with _init_lock:
+            if _database_url is None:
+                if DB_BACKEND == "mysql":
+                    url = MYSQL_URL
+                elif DB_BACKEND == "sqlite":
+                    url = SQLITE_URL
+                else:
+                    url = MYSQL_URL if _mysql_available() else SQLITE_URL
+                db_logger.info("Backend de base de datos: %s", url.split(":", 1)[0])
+                _database_url = url
+    return _database_url
+
+def selected_database_url() -> Optional[str]:
+    """URL ya elegida por select_database_url, o None si aún no se eligió (no prueba MySQL)"""
+    return _database_url
+
+def on_engine_created(hook: Callable):
+    """Registrar una función que recibe el engine al crearse (métricas, logging)"""
+    with _init_lock:
+        _engine_hooks.append(hook)
+        if _engine is not None:
+            hook(_engine)
+
+def use_pool_class(factory: Callable[[type], type]):
+    """
+    Registrar la fábrica de la clase de pool del engine: recibe la clase por defecto
+    (QueuePool) y retorna una subclase. Solo afecta a un engine aún no creado.
+    """
+    global _pool_class_factory
+    with _init_lock:
+        if _engine is not None:
+            db_logger.warning("El engine ya existe: la clase de pool registrada no se aplicará")
+        _pool_class_factory = factory
+
+def _pool_class(default: type) -> type:
+    return _pool_class_factory(default) if _pool_class_factory else default
+
+def get_engine() -> Engine:
+    """Engine síncrono, creado en el primer uso"""
+    global _engine
+    if _engine is None:
+        with _init_lock:
+            if _engine is None:
+                url = select_database_url()
+                if url.startswith("mysql"):
+                    # Configuración para MySQL/MariaDB
+                    engine = create_engine(
+                        url,
+                        poolclass=_pool_class(QueuePool),
+                        pool_size=10,
+                        max_overflow=20,
+                        pool_pre_ping=True,
+                        pool_recycle=3600,
+                        echo=False,  # Cambiar a True para debug SQL
+                        connect_args={
+                            "connect_timeout": 30,
+                            "read_timeout": 30,
+                            "write_timeout": 30,
+                            "autocommit": False
+                        }
+                    )
+                else:
+                    # Configuración para SQLite
+                    engine = create_engine(
+                        url,
+                        poolclass=_pool_class(QueuePool),
+                        echo=False,  # Cambiar a True para debug SQL
+                        connect_args={
+                            "check_same_thread": False
+                        }
+                    )
+                for hook in _engine_hooks:
+                    hook(engine)
+                SessionLocal.configure(bind=engine)
+                _engine = engine
+    return _engine
+
+def __getattr__(name: str):
+    # Compatibilidad con `from database.config import engine, DATABASE_URL`
+    if name == "engine":
+        return get_engine()
+    if name == "DATABASE_URL":
+        return select_database_url()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # ===============================================
 # CONFIGURACIÓN DE SESIONES
 # ===============================================
 
-# Configuración de las sesiones
-SessionLocal = sessionmaker(
+class _LazySessionmaker(sessionmaker):
+    """sessionmaker que crea el engine al abrir la primera sesión"""
+
+    def __call__(self, **local_kw):
+        if self.kw.get("bind") is None and "bind" not in local_kw:
+            get_engine()
+        return super().__call__(**local_kw)
+
+# Configuración de las sesiones (el bind se asigna al crear el engine)
+SessionLocal = _LazySessionmaker(
     autocommit=False,
-    autoflush=False,
-    bind=engine
+    autoflush=False
 )
 
 # Base para modelos
@@ -125,7 +214,7 @@ def create_all_tables():
     Crear todas las tablas en la base de datos
     """
     try:
-        Base.metadata.create_all(bind=engine)
+        Base.metadata.create_all(bind=get_engine())
         print("✅ Tablas creadas exitosamente")
         return True
     except Exception as e:
@@ -138,7 +227,7 @@ def drop_all_tables():
     ¡USAR CON PRECAUCIÓN!
     """
     try:
-        Base.metadata.drop_all(bind=engine)
+        Base.metadata.drop_all(bind=get_engine())
         print("⚠️ Todas las tablas han sido eliminadas")
         return True
     except Exception as e:
@@ -150,7 +239,7 @@ def test_connection():
     Probar la conexión a la base de datos
     """
     try:
-        with engine.connect() as connection:
+        with get_engine().connect() as connection:
             result = connection.execute(text("SELECT 1 as test"))
             test_value = result.fetchone()[0]
             if test_value == 1:
@@ -168,7 +257,7 @@ def get_database_info():
     Obtener información de la base de datos
     """
     try:
-        with engine.connect() as connection:
+        with get_engine().connect() as connection:
             # Información del servidor
             server_info = connection.execute(text("SELECT VERSION() as version")).fetchone()[0]
             
@@ -190,7 +279,7 @@ def get_database_info():
                 "charset": db_info[1] if db_info else "Desconocido",
                 "collation": db_info[2] if db_info else "Desconocido",
                 "table_count": table_count,
-                "connection_url": DATABASE_URL.replace(DB_PASSWORD, "*" * len(DB_PASSWORD))
+                "connection_url": select_database_url().replace(DB_PASSWORD, "*" * len(DB_PASSWORD))
             }
             
             return info
@@ -222,20 +311,11 @@ class AuditMixin:
 
 def setup_database_logging():
     """
-    Configurar logging específico para la base de datos
+    Configurar logging específico para la base de datos.
+    No agrega handlers propios: los registros se propagan al logger raíz,
+    que configura el pipeline de logging de la aplicación.
     """
-    db_logger = logging.getLogger('miriesgo.database')
-    db_logger.setLevel(logging.INFO)
-    
-    if not db_logger.handlers:
-        handler = logging.StreamHandler()
-        formatter = logging.Formatter(
-            '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-        )
-        handler.setFormatter(formatter)
-        db_logger.addHandler(handler)
-    
-    return db_logger
+    return logging.getLogger('miriesgo.database')
 
 # Inicializar logger
 db_logger = setup_database_logging()
@@ -16,7 +16,8 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)) + '/..')
 from database import (
     SessionLocal, Company, User, Client, Loan, CreditReport,
     CompanyStatus, UserRole, LoanType, LoanStatus, PaymentBehavior,
-    ReportType, RiskLevel, create_all_tables, test_connection
+    ReportType, RiskLevel, create_all_tables, test_connection,
+    bulk_upsert_loans
 )
 
 # ===============================================
@@ -485,45 +486,17 @@ def migrate_clients(db):
     print(f"👤 {created_count} clientes migrados exitosamente")
 
 def migrate_loans(db):
-    """Migrar préstamos"""
+    """Migrar préstamos (upsert masivo por loan_number)"""
     print("💰 Migrando préstamos...")
     
-    loans_data = get_initial_loans()
-    created_count = 0
-    
-    for loan_data in loans_data:
-        # Verificar si ya existe
-        existing = db.query(Loan).filter(Loan.loan_number == loan_data["loan_number"]).first()
-        if existing:
-            print(f"  ⚠️ Préstamo {loan_data['loan_number']} ya existe")
-            continue
-        
-        loan = Loan(
-            client_id=loan_data["client_id"],
-            company_id=loan_data["company_id"],
-            loan_number=loan_data["loan_number"],
-            loan_type=loan_data["loan_type"],
-            original_amount=loan_data["original_amount"],
-            current_balance=loan_data["current_balance"],
-            monthly_payment=loan_data["monthly_payment"],
-            interest_rate=loan_data["interest_rate"],
-            start_date=loan_data["start_date"],
-            end_date=loan_data["end_date"],
-            last_payment_date=loan_data["last_payment_date"],
-            status=loan_data["status"],
-            days_late=loan_data["days_late"],
-            payment_behavior=loan_data["payment_behavior"],
-            collateral_type=loan_data["collateral_type"],
-            collateral_value=loan_data["collateral_value"],
-            created_user="migration_script"
-        )
-        
-        db.add(loan)
-        created_count += 1
-        print(f"  ✅ Creado: {loan_data['loan_number']}")
+    loans_data = [
+        {**loan_data, "created_user": "migration_script"}
+        for loan_data in get_initial_loans()
+    ]
     
+    result = bulk_upsert_loans(db, loans_data)
     db.commit()
-    print(f"💰 {created_count} préstamos migrados exitosamente")
+    print(f"💰 {result.inserted} préstamos creados y {result.updated} actualizados")
 
 def generate_credit_reports(db):
     """Generar reportes crediticios de muestra"""
@@ -5,7 +5,8 @@ Definición de todas las entidades de la base de datos
 
 from sqlalchemy import (
     Column, Integer, String, Text, Date, DateTime, Boolean, 
-    ForeignKey, Enum, JSON, BigInteger, TIMESTAMP, DECIMAL
+    ForeignKey, Enum, JSON, BigInteger, TIMESTAMP, DECIMAL,
+    UniqueConstraint
 )
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -59,12 +60,23 @@ class RiskLevel(enum.Enum):
     high = "high"
     critical = "critical"
 
+class PaymentStatus(enum.Enum):
+    # Los valores son los que guarda la tabla payments (los escribe la ingesta de archivos)
+    pending = "Pendiente"
+    paid = "Pagado"
+    late = "En Mora"
+
 class FileUploadStatus(enum.Enum):
     uploaded = "uploaded"
     processing = "processing"
     completed = "completed"
     failed = "failed"
 
+class ScoringRunStatus(enum.Enum):
+    running = "running"
+    completed = "completed"
+    failed = "failed"
+
 # ===============================================
 # MODELO: Company (Empresas)
 # ===============================================
@@ -210,10 +222,45 @@ class Loan(Base, AuditMixin):
     # Relaciones
     client = relationship("Client", back_populates="loans")
     company = relationship("Company", back_populates="loans")
+    payments = relationship("Payment", back_populates="loan", cascade="all, delete-orphan")
     
     def __repr__(self):
         return f"<Loan(id={self.id}, number='{self.loan_number}', amount={self.original_amount})>"
 
+# ===============================================
+# MODELO: Payment (Cuotas de los préstamos)
+# ===============================================
+
+class Payment(Base, AuditMixin):
+    __tablename__ = "payments"
+    __table_args__ = (
+        UniqueConstraint('loan_id', 'installment_number', name='uq_payments_loan_installment'),
+    )
+    
+    # Campos principales
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    loan_id = Column(Integer, ForeignKey('loans.id'), nullable=False, comment="ID del préstamo")
+    installment_number = Column(Integer, nullable=False, comment="Número de la cuota")
+    
+    # Información del pago
+    expected_payment_date = Column(Date, nullable=False, comment="Fecha esperada de pago")
+    actual_payment_date = Column(Date, nullable=True, comment="Fecha real de pago")
+    amount_paid = Column(DECIMAL(15, 2), nullable=True, comment="Monto pagado")
+    status = Column(Enum(PaymentStatus, values_callable=lambda statuses: [s.value for s in statuses]),
+                    default=PaymentStatus.pending, comment="Estado de la cuota")
+    days_late = Column(Integer, default=0, comment="Días de atraso de la cuota")
+    
+    # Campos de auditoría
+    created_user = Column(String(100), nullable=False, comment="Usuario que creó el registro")
+    created_at = Column(TIMESTAMP, default=func.current_timestamp(), comment="Fecha de creación")
+    updated_at = Column(TIMESTAMP, default=func.current_timestamp(), onupdate=func.current_timestamp(), comment="Fecha de última actualización")
+    
+    # Relaciones
+    loan = relationship("Loan", back_populates="payments")
+    
+    def __repr__(self):
+        return f"<Payment(id={self.id}, loan_id={self.loan_id}, installment={self.installment_number})>"
+
 # ===============================================
 # MODELO: CreditReport (Reportes crediticios generados)
 # ===============================================
@@ -299,7 +346,7 @@ class Session(Base, AuditMixin):
     # Campos principales
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False, comment="ID del usuario")
-    token_hash = Column(String(255), unique=True, nullable=False, comment="Hash del token de sesión")
+    token_hash = Column(String(255), unique=True, nullable=False, comment="Digest HMAC-SHA256 del token de sesión")
     
     # Información de la sesión
     ip_address = Column(String(45), nullable=True, comment="Dirección IP del usuario")
@@ -356,6 +403,52 @@ class FileUpload(Base, AuditMixin):
     def __repr__(self):
         return f"<FileUpload(id={self.id}, filename='{self.original_filename}', status='{self.status.value}')>"
 
+# ===============================================
+# MODELO: ScoringRun (Corridas de recálculo de puntajes)
+# ===============================================
+
+class ScoringRun(Base, AuditMixin):
+    __tablename__ = "scoring_runs"
+    
+    # Campos principales
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    status = Column(Enum(ScoringRunStatus), default=ScoringRunStatus.running, comment="Estado de la corrida")
+    changed_since = Column(TIMESTAMP, nullable=True, comment="Cambios de préstamos considerados desde (NULL = todos los clientes)")
+    started_at = Column(TIMESTAMP, nullable=False, comment="Inicio de la corrida")
+    finished_at = Column(TIMESTAMP, nullable=True, comment="Fin de la corrida")
+    
+    # Rendimiento
+    clients_scored = Column(Integer, default=0, comment="Clientes recalculados")
+    chunks = Column(Integer, default=0, comment="Bloques procesados")
+    workers = Column(Integer, default=1, comment="Procesos usados")
+    duration_seconds = Column(DECIMAL(12, 3), nullable=True, comment="Duración total")
+    clients_per_second = Column(DECIMAL(12, 2), nullable=True, comment="Throughput de la corrida")
+    error_details = Column(Text, nullable=True, comment="Detalle del error si la corrida falló")
+    
+    # Campos de auditoría
+    created_user = Column(String(100), nullable=False, comment="Usuario que creó el registro")
+    created_at = Column(TIMESTAMP, default=func.current_timestamp(), comment="Fecha de creación")
+    updated_at = Column(TIMESTAMP, default=func.current_timestamp(), onupdate=func.current_timestamp(), comment="Fecha de última actualización")
+    
+    def __repr__(self):
+        return f"<ScoringRun(id={self.id}, status='{self.status.value}', clients={self.clients_scored})>"
+
+# ===============================================
+# MODELO: JobLock (Candados de trabajos programados)
+# ===============================================
+
+class JobLock(Base):
+    __tablename__ = "job_locks"
+    
+    # Una fila por trabajo; se toma con un UPDATE condicionado a que esté libre o vencido
+    name = Column(String(50), primary_key=True, comment="Nombre del trabajo")
+    locked_by = Column(String(100), nullable=True, comment="Token de quien tiene el candado (NULL = libre)")
+    locked_until = Column(TIMESTAMP, nullable=True, comment="Vencimiento del candado (reloj de la base)")
+    updated_at = Column(TIMESTAMP, default=func.current_timestamp(), onupdate=func.current_timestamp(), comment="Fecha de última actualización")
+    
+    def __repr__(self):
+        return f"<JobLock(name='{self.name}', locked_by='{self.locked_by}')>"
+
 # ===============================================
 # FUNCIONES DE UTILIDAD PARA MODELOS
 # ===============================================
@@ -365,8 +458,8 @@ def get_all_models():
     Retorna una lista de todos los modelos definidos
     """
     return [
-        Company, User, Client, Loan, CreditReport, 
-        AuditLog, Session, FileUpload
+        Company, User, Client, Loan, Payment, CreditReport, 
+        AuditLog, Session, FileUpload, ScoringRun, JobLock
     ]
 
 def get_model_by_name(model_name: str):
@@ -378,10 +471,13 @@ def get_model_by_name(model_name: str):
         'User': User,
         'Client': Client,
         'Loan': Loan,
+        'Payment': Payment,
         'CreditReport': CreditReport,
         'AuditLog': AuditLog,
         'Session': Session,
-        'FileUpload': FileUpload
+        'FileUpload': FileUpload,
+        'ScoringRun': ScoringRun,
+        'JobLock': JobLock
     }
     return models.get(model_name)
 
@@ -400,9 +496,9 @@ def create_model_instance(model_name: str, **kwargs):
 # ===============================================
 
 __all__ = [
-    'Company', 'User', 'Client', 'Loan', 'CreditReport', 
+    'Company', 'User', 'Client', 'Loan', 'Payment', 'CreditReport', 
     'AuditLog', 'Session', 'FileUpload',
     'CompanyStatus', 'UserRole', 'LoanType', 'LoanStatus', 
-    'PaymentBehavior', 'ReportType', 'RiskLevel', 'FileUploadStatus',
+    'PaymentBehavior', 'PaymentStatus', 'ReportType', 'RiskLevel', 'FileUploadStatus',
     'get_all_models', 'get_model_by_name', 'create_model_instance'
 ]
\ No newline at end of file
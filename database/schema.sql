@@ -96,9 +96,10 @@ CREATE TABLE clients (
     
     -- Índices
     INDEX idx_clients_national_identifier (national_identifier),
-    INDEX idx_clients_full_name (full_name),
+    INDEX idx_clients_full_name_id (full_name, id),
     INDEX idx_clients_city (city),
-    INDEX idx_clients_created_at (created_at)
+    INDEX idx_clients_created_at (created_at),
+    INDEX idx_clients_updated_at (updated_at)
 ) ENGINE=InnoDB COMMENT='Tabla de clientes para consultas crediticias';
 
 -- ===============================================
@@ -147,9 +148,40 @@ CREATE TABLE loans (
     INDEX idx_loans_status (status),
     INDEX idx_loans_payment_behavior (payment_behavior),
     INDEX idx_loans_start_date (start_date),
-    INDEX idx_loans_created_at (created_at)
+    INDEX idx_loans_created_at (created_at),
+    INDEX idx_loans_updated_at (updated_at)
 ) ENGINE=InnoDB COMMENT='Tabla de préstamos y créditos';
 
+-- ===============================================
+-- TABLA: payments (Cuotas de los préstamos)
+-- ===============================================
+CREATE TABLE payments (
+    id INT PRIMARY KEY AUTO_INCREMENT,
+    loan_id INT NOT NULL COMMENT 'ID del préstamo',
+    installment_number INT NOT NULL COMMENT 'Número de la cuota',
+    
+    -- Información del pago
+    expected_payment_date DATE NOT NULL COMMENT 'Fecha esperada de pago',
+    actual_payment_date DATE NULL COMMENT 'Fecha real de pago',
+    amount_paid DECIMAL(15,2) NULL COMMENT 'Monto pagado',
+    status ENUM('Pendiente', 'Pagado', 'En Mora') DEFAULT 'Pendiente' COMMENT 'Estado de la cuota (valores que escribe la ingesta)',
+    days_late INT DEFAULT 0 COMMENT 'Días de atraso de la cuota',
+    
+    -- Campos de auditoría
+    created_user VARCHAR(100) NOT NULL COMMENT 'Usuario que creó el registro',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT 'Fecha de creación',
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT 'Fecha de última actualización',
+    
+    -- Foreign Keys
+    FOREIGN KEY (loan_id) REFERENCES loans(id) ON DELETE CASCADE ON UPDATE CASCADE,
+    
+    -- Índices
+    UNIQUE KEY uq_payments_loan_installment (loan_id, installment_number),
+    INDEX idx_payments_status (status),
+    INDEX idx_payments_expected_date (expected_payment_date),
+    INDEX idx_payments_updated_at (updated_at)
+) ENGINE=InnoDB COMMENT='Tabla de cuotas y pagos de préstamos';
+
 -- ===============================================
 -- TABLA: credit_reports (Reportes crediticios generados)
 -- ===============================================
@@ -233,7 +265,7 @@ CREATE TABLE audit_logs (
 CREATE TABLE sessions (
     id INT PRIMARY KEY AUTO_INCREMENT,
     user_id INT NOT NULL COMMENT 'ID del usuario',
-    token_hash VARCHAR(255) UNIQUE NOT NULL COMMENT 'Hash del token de sesión',
+    token_hash VARCHAR(255) UNIQUE NOT NULL COMMENT 'Digest HMAC-SHA256 del token de sesión',
     
     -- Información de la sesión
     ip_address VARCHAR(45) NULL COMMENT 'Dirección IP del usuario',
@@ -295,6 +327,60 @@ CREATE TABLE file_uploads (
     INDEX idx_file_uploads_created_at (created_at)
 ) ENGINE=InnoDB COMMENT='Tabla de archivos subidos al sistema';
 
+-- ===============================================
+-- TABLA: company_portfolio_stats (Agregados de cartera del dashboard)
+-- ===============================================
+CREATE TABLE company_portfolio_stats (
+    company_id INT PRIMARY KEY COMMENT 'ID de la empresa (0 = consolidado general)',
+    total_clients INT NOT NULL DEFAULT 0 COMMENT 'Clientes con préstamos',
+    active_clients_up_to_date INT NOT NULL DEFAULT 0 COMMENT 'Clientes al día',
+    clients_with_arrears INT NOT NULL DEFAULT 0 COMMENT 'Clientes en mora',
+    clients_in_legal INT NOT NULL DEFAULT 0 COMMENT 'Clientes en cobro jurídico',
+    mora_1_30 INT NOT NULL DEFAULT 0 COMMENT 'Clientes con 1-30 días de atraso',
+    mora_31_60 INT NOT NULL DEFAULT 0 COMMENT 'Clientes con 31-60 días de atraso',
+    mora_61_90 INT NOT NULL DEFAULT 0 COMMENT 'Clientes con 61-90 días de atraso',
+    mora_91_plus INT NOT NULL DEFAULT 0 COMMENT 'Clientes con más de 90 días de atraso',
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT 'Fecha del último recálculo'
+) ENGINE=InnoDB COMMENT='Agregados precalculados de cartera por empresa';
+
+-- ===============================================
+-- TABLA: scoring_runs (Corridas de recálculo de puntajes)
+-- ===============================================
+CREATE TABLE scoring_runs (
+    id INT PRIMARY KEY AUTO_INCREMENT,
+    status ENUM('running', 'completed', 'failed') DEFAULT 'running' COMMENT 'Estado de la corrida',
+    changed_since TIMESTAMP NULL COMMENT 'Cambios de préstamos considerados desde (NULL = todos los clientes)',
+    started_at TIMESTAMP NOT NULL COMMENT 'Inicio de la corrida',
+    finished_at TIMESTAMP NULL COMMENT 'Fin de la corrida',
+    
+    -- Rendimiento
+    clients_scored INT DEFAULT 0 COMMENT 'Clientes recalculados',
+    chunks INT DEFAULT 0 COMMENT 'Bloques procesados',
+    workers INT DEFAULT 1 COMMENT 'Procesos usados',
+    duration_seconds DECIMAL(12,3) NULL COMMENT 'Duración total',
+    clients_per_second DECIMAL(12,2) NULL COMMENT 'Throughput de la corrida',
+    error_details TEXT NULL COMMENT 'Detalle del error si la corrida falló',
+    
+    -- Campos de auditoría
+    created_user VARCHAR(100) NOT NULL COMMENT 'Usuario que creó el registro',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT 'Fecha de creación',
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT 'Fecha de última actualización',
+    
+    -- Índices
+    INDEX idx_scoring_runs_status (status),
+    INDEX idx_scoring_runs_started_at (started_at)
+) ENGINE=InnoDB COMMENT='Corridas del recálculo de puntajes por lotes';
+
+-- ===============================================
+-- TABLA: job_locks (Candados de trabajos programados)
+-- ===============================================
+CREATE TABLE job_locks (
+    name VARCHAR(50) PRIMARY KEY COMMENT 'Nombre del trabajo',
+    locked_by VARCHAR(100) NULL COMMENT 'Token de quien tiene el candado (NULL = libre)',
+    locked_until TIMESTAMP NULL COMMENT 'Vencimiento del candado (reloj de la base)',
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT 'Fecha de última actualización'
+) ENGINE=InnoDB COMMENT='Candados de trabajos programados entre procesos';
+
 -- ===============================================
 -- CONFIGURACIONES INICIALES
 -- ===============================================
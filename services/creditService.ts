@@ -492,6 +492,8 @@ const mockClients: Client[] = [
 
 // La URL base de la API. En una aplicación real, esto provendría de una variable de entorno.
 const API_BASE_URL = 'http://127.0.0.1:8000/api';
+// Tamaño de página al recorrer el listado de clientes (máximo aceptado por el backend)
+const CLIENTS_PAGE_SIZE = 1000;
 
 // Datos mock para dashboard
 const mockDashboardData = {
@@ -656,21 +658,35 @@ class CreditService {
         }
 
         try {
-            // Intentar con backend solo si hay token
-            const response = await fetch(`${API_BASE_URL}/clients`, {
-                headers: { 'Authorization': `Bearer ${token}` }
-            });
+            // Intentar con backend solo si hay token.
+            // El listado está paginado por cursor: se siguen las páginas
+            // mientras el backend devuelva el encabezado X-Next-Cursor.
+            const clients: Client[] = [];
+            let cursor: string | null = null;
+
+            do {
+                const params = new URLSearchParams({ limit: String(CLIENTS_PAGE_SIZE) });
+                if (cursor) {
+                    params.set('cursor', cursor);
+                }
 
-            console.log('💫 DEBUG: fetchAllClients - response status:', response.status);
+                const response = await fetch(`${API_BASE_URL}/clients?${params.toString()}`, {
+                    headers: { 'Authorization': `Bearer ${token}` }
+                });
 
-            // Si el backend responde correctamente, usar esos datos
-            if (response.ok) {
-                return this.handleResponse<Client[]>(response);
-            } else {
-                // Si hay error del backend, usar mock
-                console.warn('💫 Backend error, usando datos mock...');
-                return Promise.resolve([...mockClients]);
-            }
+                console.log('💫 DEBUG: fetchAllClients - response status:', response.status);
+
+                if (!response.ok) {
+                    // Si hay error del backend, usar mock
+                    console.warn('💫 Backend error, usando datos mock...');
+                    return Promise.resolve([...mockClients]);
+                }
+
+                clients.push(...await this.handleResponse<Client[]>(response));
+                cursor = response.headers.get('X-Next-Cursor');
+            } while (cursor);
+
+            return clients;
         } catch (error) {
             console.warn('💫 Backend no disponible, usando datos mock:', error);
             return Promise.resolve([...mockClients]);